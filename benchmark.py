@@ -0,0 +1,1502 @@
+"""Benchmarks for the library, run against local stand-in discord servers.
+
+Nothing here talks to the real discord, every suite runs against the stand-in
+servers of :mod:`testing`.
+
+Every suite returns a plain dict, and the command line prints them as JSON so the
+results can be compared between releases::
+
+    python -m <package>.benchmark load http decode models commands --output results.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import typing as t
+import zlib
+
+import aiohttp
+
+from . import encoding
+from .bot import Bot
+from .channel import TextChannel
+from .guild import Guild
+from .testing import (
+    FakeGateway,
+    FakeRestServer,
+    channel_payload,
+    guild_payload,
+    make_snowflake,
+    message_payload,
+)
+
+
+def _percentiles(values: t.List[float], scale: float = 1000.0) -> t.Dict[str, float]:
+    """p50, p90, p99 and max of ``values``, multiplied by ``scale``"""
+
+    if not values:
+        return {"p50": 0.0, "p90": 0.0, "p99": 0.0, "max": 0.0}
+
+    ordered = sorted(values)
+
+    def at(fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * scale
+
+    return {
+        "p50": at(0.50),
+        "p90": at(0.90),
+        "p99": at(0.99),
+        "max": ordered[-1] * scale,
+    }
+
+
+def _rss() -> int:
+    """The resident memory of this process in bytes"""
+
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+
+        # ru_maxrss is the peak, in kilobytes on linux and bytes on macos
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+async def bench_load(
+    *,
+    duration: float = 10.0,
+    message_rate: float = 1000.0,
+    command_ratio: float = 0.02,
+    guilds: int = 10,
+    channels_per_guild: int = 5,
+    rest_latency: float = 0.0,
+    rate_limit: int = 50,
+    rate_limit_window: float = 1.0,
+    bot_options: t.Optional[t.Dict[str, t.Any]] = None,
+) -> t.Dict[str, t.Any]:
+    """Runs a bot against the stand-in servers for ``duration`` seconds.
+
+    The bot has a ``ping`` command that replies with the time carried by the
+    command, so the REST server can measure the round trip from the gateway
+    sending the command to the reply arriving.
+    """
+
+    gateway = FakeGateway(
+        guilds=guilds,
+        channels_per_guild=channels_per_guild,
+        message_rate=message_rate,
+        command_ratio=command_ratio,
+    )
+    rest = FakeRestServer(
+        gateway=gateway,
+        latency=rest_latency,
+        rate_limit=rate_limit,
+        rate_limit_window=rate_limit_window,
+    )
+    await gateway.start()
+    await rest.start()
+
+    options = dict(bot_options or {})
+    options.setdefault("http_options", {})["base_url"] = rest.url
+
+    bot = Bot(False, token="benchmark", prefix="!", **options)
+
+    @bot.add_command(name="ping")
+    async def ping(ctx, sent: str):
+        await ctx.send(f"pong {sent}")
+
+    rss_start = _rss()
+    connection = asyncio.ensure_future(bot.connect())
+
+    # Wait for READY so the measurement only covers the steady state
+    while bot.user is None:
+        await asyncio.sleep(0.01)
+
+    events_start = gateway.events_sent
+    processed_start = bot.dispatcher.metrics.processed
+    max_tasks = 0
+
+    started = time.perf_counter()
+    while time.perf_counter() - started < duration:
+        await asyncio.sleep(0.1)
+        max_tasks = max(max_tasks, len(asyncio.all_tasks()))
+
+    elapsed = time.perf_counter() - started
+    events_sent = gateway.events_sent - events_start
+    processed = bot.dispatcher.metrics.processed - processed_start
+
+    result = {
+        "duration": elapsed,
+        "events_sent": events_sent,
+        "events_processed": processed,
+        "events_per_second": processed / elapsed,
+        "queue_depth": bot.dispatcher.queue_depth,
+        "commands_sent": gateway.commands_sent,
+        "replies": len(rest.round_trips),
+        "round_trip_ms": _percentiles(rest.round_trips),
+        "memory": {
+            "rss_start_bytes": rss_start,
+            "rss_end_bytes": _rss(),
+            "rss_growth_bytes": _rss() - rss_start,
+        },
+        "tasks": {"max": max_tasks, "end": len(asyncio.all_tasks())},
+        "rest": {
+            "requests": rest.requests,
+            "rate_limited": rest.rate_limited,
+            "by_route": rest.requests_by_route,
+        },
+    }
+
+    await bot.shutdown()
+    await asyncio.gather(connection, return_exceptions=True)
+    await rest.close()
+    await gateway.close()
+
+    return result
+
+
+async def bench_lifecycle(
+    *,
+    restarts: int = 5,
+    guilds: int = 100,
+    message_rate: float = 500.0,
+    command_ratio: float = 0.05,
+    rest_latency: float = 0.05,
+    traffic: float = 0.5,
+    timeout: float = 10.0,
+) -> t.Dict[str, t.Any]:
+    """Restart to ready and graceful shutdown times of a bot under load.
+
+    Every restart builds a new bot and runs it until READY and every guild is
+    cached, lets it take ``traffic`` seconds of commands, and shuts it down while
+    replies are still in flight. The replies the REST server gets once the
+    shutdown started are the commands that were drained rather than dropped.
+    """
+
+    gateway = FakeGateway(
+        guilds=guilds, message_rate=message_rate, command_ratio=command_ratio
+    )
+    rest = FakeRestServer(gateway=gateway, latency=rest_latency, rate_limit=1000)
+    await gateway.start()
+    await rest.start()
+
+    tasks_before = len(asyncio.all_tasks())
+    construct, ready, shutdown, drained_replies = [], [], [], []
+    drained = 0
+    tasks_left = 0
+
+    for _ in range(restarts):
+        started = time.perf_counter()
+        bot = Bot(
+            False,
+            token="benchmark",
+            prefix="!",
+            http_options={"base_url": rest.url},
+            send_queue_window=0.05,
+        )
+
+        @bot.add_command(name="ping")
+        async def ping(ctx, sent: str):
+            await ctx.send(f"pong {sent}")
+
+        construct.append(time.perf_counter() - started)
+        running = asyncio.ensure_future(bot.run())
+
+        while bot.user is None or len(bot.state.guilds) < guilds:
+            await asyncio.sleep(0.001)
+        ready.append(time.perf_counter() - started)
+
+        await asyncio.sleep(traffic)
+        replies = len(rest.round_trips)
+
+        stopping = time.perf_counter()
+        drained += await bot.shutdown(timeout)
+        await running
+        shutdown.append(time.perf_counter() - stopping)
+        drained_replies.append(len(rest.round_trips) - replies)
+
+        # Anything the bot left running once the servers saw it go is a leak
+        await asyncio.sleep(0.01)
+        tasks_left = max(tasks_left, len(asyncio.all_tasks()) - tasks_before)
+
+    await rest.close()
+    await gateway.close()
+
+    return {
+        "restarts": restarts,
+        "guilds": guilds,
+        "construct_ms": _percentiles(construct),
+        "restart_to_ready_ms": _percentiles(ready),
+        "shutdown_ms": _percentiles(shutdown),
+        "drained_in_time": drained,
+        "replies_during_shutdown": drained_replies,
+        "tasks_left": tasks_left,
+    }
+
+
+async def bench_http(
+    *, requests: int = 2000, concurrency: int = 10, rest_latency: float = 0.0
+) -> t.Dict[str, t.Any]:
+    """Compares a new session per request with the pooled session of the http client"""
+
+    from .http import DiscordHttpClient
+
+    rest = FakeRestServer(rate_limit=10**9, latency=rest_latency)
+    await rest.start()
+
+    async def run(get_channel) -> t.Dict[str, t.Any]:
+        latencies: t.List[float] = []
+        per_worker = requests // concurrency
+
+        async def worker(worker_id: int):
+            for index in range(per_worker):
+                start = time.perf_counter()
+                await get_channel(worker_id * 1000 + index)
+                latencies.append(time.perf_counter() - start)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(index) for index in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+        return {
+            "requests_per_second": len(latencies) / elapsed,
+            "latency_ms": _percentiles(latencies),
+        }
+
+    async def session_per_request(channel_id: int):
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"{rest.url}/channels/{channel_id}") as response:
+                return await response.json()
+
+    # The global limit would cap the pooled client at 50 requests a second
+    client = DiscordHttpClient(base_url=rest.url, global_rate_limit=10**9)  # type: ignore
+    client.login("benchmark")
+
+    result = {
+        "session_per_request": await run(session_per_request),
+        "pooled_session": await run(client.get_channel),
+    }
+
+    await client.close()
+    await rest.close()
+    return result
+
+
+async def bench_coalesce(
+    *, lookups: int = 1000, rest_latency: float = 0.01
+) -> t.Dict[str, t.Any]:
+    """Concurrent lookups of one channel, which share a single request"""
+
+    from .http import DiscordHttpClient
+
+    rest = FakeRestServer(rate_limit=10**9, latency=rest_latency)
+    await rest.start()
+
+    client = DiscordHttpClient(base_url=rest.url, global_rate_limit=10**9)  # type: ignore
+    client.login("benchmark")
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(client.get_channel(1000) for _ in range(lookups)))
+    elapsed = time.perf_counter() - start
+
+    result = {
+        "lookups": lookups,
+        "requests": sum(rest.requests_by_route.values()),
+        "coalesced_hits": client.coalesced_hits,
+        "same_result": all(data is results[0] for data in results),
+        "elapsed_ms": elapsed * 1000,
+    }
+
+    await client.close()
+    await rest.close()
+    return result
+
+
+async def bench_converters(
+    *, invocations: int = 20, rest_latency: float = 0.05
+) -> t.Dict[str, t.Any]:
+    """Time to convert three guild and channel arguments that are not cached"""
+
+    rest = FakeRestServer(rate_limit=10**9, latency=rest_latency)
+    url = await rest.start()
+
+    bot = Bot(
+        False,
+        token="benchmark",
+        prefix="!",
+        http_options={"base_url": url, "global_rate_limit": 10**9},
+    )
+
+    async def command(ctx, guild: Guild, channel: TextChannel, other: Guild):
+        pass
+
+    bot.add_command(name="convert")(command)
+    plan = bot.commands[0].plan
+
+    timings = []
+    for index in range(invocations):
+        words = [str(200000 + index), str(3000000 + index), str(300000 + index)]
+        start = time.perf_counter()
+        await plan.convert(bot, words)
+        timings.append(time.perf_counter() - start)
+
+    await bot.http.close()
+    await rest.close()
+    return {
+        "rest_latency_ms": rest_latency * 1000,
+        "convert_ms": _percentiles(timings),
+    }
+
+
+async def bench_sends(
+    *, sends: int = 20, rest_latency: float = 0.02
+) -> t.Dict[str, t.Any]:
+    """A burst of replies to one channel, with and without the send queue
+
+    The channel bucket allows 5 messages a second, a faster stand-in for the
+    5 messages per 5 seconds discord allows.
+    """
+
+    from .http import DiscordHttpClient
+    from .outbound import SendQueue
+
+    result: t.Dict[str, t.Any] = {"sends": sends}
+
+    for name in ("direct", "queued"):
+        rest = FakeRestServer(rate_limit=5, rate_limit_window=1.0, latency=rest_latency)
+        await rest.start()
+
+        client = DiscordHttpClient(base_url=rest.url)  # type: ignore
+        client.login("benchmark")
+        queue = SendQueue(client, window=0.05)
+
+        start = time.perf_counter()
+        if name == "direct":
+            for index in range(sends):
+                await client.send_message(1000, f"line {index}")
+        else:
+            futures = [queue.send(1000, f"line {index}") for index in range(sends)]
+            await asyncio.gather(*futures)
+        elapsed = time.perf_counter() - start
+
+        result[name] = {
+            "requests": rest.requests,
+            "rate_limited": rest.rate_limited,
+            "delivered_ms": elapsed * 1000,
+        }
+
+        await client.close()
+        await rest.close()
+
+    return result
+
+
+async def bench_history(
+    *, messages: int = 20000, members: int = 20000, rest_latency: float = 0.01
+) -> t.Dict[str, t.Any]:
+    """Walks the whole history of a channel and the members of a guild"""
+
+    rest = FakeRestServer(
+        rate_limit=10**9,
+        latency=rest_latency,
+        history_size=messages,
+        member_count=members,
+    )
+    url = await rest.start()
+
+    bot = Bot(
+        False,
+        token="benchmark",
+        prefix="!",
+        http_options={"base_url": url, "global_rate_limit": 10**9},
+    )
+    channel = TextChannel(channel_payload(1000, 10), bot)
+    guild = Guild(bot, guild_payload(10, []))
+
+    result: t.Dict[str, t.Any] = {"rest_latency_ms": rest_latency * 1000}
+    for name, walk in (
+        ("history", lambda: channel.history(limit=None)),
+        ("members", lambda: guild.fetch_members()),
+    ):
+        tracemalloc.start()
+        start = time.perf_counter()
+        count = 0
+        async for _ in walk():
+            count += 1
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        result[name] = {
+            "items": count,
+            "items_per_second": count / elapsed,
+            "peak_bytes": peak,
+        }
+
+    result["requests"] = rest.requests_by_route
+
+    await bot.http.close()
+    await rest.close()
+    return result
+
+
+async def bench_bulk(
+    *, messages: int = 200, channels: int = 100, rest_latency: float = 0.02
+) -> t.Dict[str, t.Any]:
+    """Deleting messages and editing channels one by one, and with the bulk helpers"""
+
+    from . import bulk
+    from .http import DiscordHttpClient
+
+    now = int(time.time() * 1000) - bulk.DISCORD_EPOCH
+    message_ids = [(now << 22) + index for index in range(messages)]
+    edits = {1000 + index: {"topic": f"topic {index}"} for index in range(channels)}
+
+    async def one_by_one_deletes(client):
+        for message_id in message_ids:
+            await client.delete_message(1000, message_id)
+
+    async def one_by_one_edits(client):
+        for channel_id, payload in edits.items():
+            await client.modify_channel(channel_id, payload)
+
+    result: t.Dict[str, t.Any] = {"messages": messages, "channels": channels}
+    for name, operation in (
+        ("delete_one_by_one", one_by_one_deletes),
+        ("delete_bulk", lambda client: bulk.delete_messages(client, 1000, message_ids)),
+        ("edit_one_by_one", one_by_one_edits),
+        ("edit_bulk", lambda client: bulk.edit_channels(client, edits)),
+    ):
+        rest = FakeRestServer(rate_limit=10**9, latency=rest_latency)
+        await rest.start()
+
+        client = DiscordHttpClient(base_url=rest.url, global_rate_limit=10**9)  # type: ignore
+        client.login("benchmark")
+
+        start = time.perf_counter()
+        await operation(client)
+        result[name] = {
+            "requests": rest.requests,
+            "elapsed_ms": (time.perf_counter() - start) * 1000,
+        }
+
+        await client.close()
+        await rest.close()
+
+    return result
+
+
+async def bench_replay(
+    *,
+    recording: t.Optional[str] = None,
+    duration: float = 3.0,
+    message_rate: float = 1000.0,
+    compress: bool = True,
+) -> t.Dict[str, t.Any]:
+    """Replays a gateway recording through a fresh bot as fast as possible
+
+    Without a ``recording``, one is made first by running the ``load`` suite for
+    ``duration`` seconds with the recorder on.
+    """
+
+    from .recording import ReplayDriver
+
+    result: t.Dict[str, t.Any] = {}
+    directory = None
+    if recording is None:
+        directory = tempfile.mkdtemp()
+        recording = os.path.join(directory, "gateway.rec")
+        live = await bench_load(
+            duration=duration,
+            message_rate=message_rate,
+            bot_options={"record_gateway": recording, "record_compress": compress},
+        )
+        result["live_events_per_second"] = live["events_per_second"]
+
+    result["recording_bytes"] = os.path.getsize(recording)
+
+    bot = Bot(False, token="benchmark", prefix="!")
+
+    @bot.add_command(name="ping")
+    async def ping(ctx, sent: str):
+        await ctx.send(f"pong {sent}")
+
+    result["replay"] = await ReplayDriver(bot, recording).run()
+    result["cached"] = {
+        "guilds": len(bot.state.guilds),
+        "channels": len(bot.state.channels),
+        "users": len(bot.state.users),
+    }
+
+    await bot.dispatcher.close()
+    if directory is not None:
+        shutil.rmtree(directory)
+
+    return result
+
+
+def _interaction_payload(
+    index: int, name: str, options: t.Dict[str, t.Any]
+) -> t.Dict[str, t.Any]:
+    """An APPLICATION_COMMAND interaction payload with the fields discord sends"""
+
+    return {
+        "id": make_snowflake(index % 4096),
+        "application_id": "1",
+        "type": 2,
+        "token": f"token-{index}",
+        "version": 1,
+        "guild_id": "100000",
+        "channel_id": "10000000",
+        "member": {
+            "user": {
+                "id": str(1000 + index),
+                "username": "user",
+                "discriminator": "0001",
+            },
+            "roles": [],
+            "permissions": "2147483647",
+        },
+        "data": {
+            "id": "2",
+            "name": name,
+            "type": 1,
+            "options": [
+                {"name": key, "type": 3, "value": value}
+                for key, value in options.items()
+            ],
+        },
+    }
+
+
+async def bench_interactions(
+    *, requests: int = 300, concurrency: int = 10, defer_every: int = 10
+) -> t.Dict[str, t.Any]:
+    """Latency of slash commands taken over http, from signed requests
+
+    Every ``defer_every``th interaction runs a command that is slower than the
+    deferral deadline, so its messages go over the webhook of the interaction to a
+    local stand-in for the discord api. The requests are signed beforehand with a
+    key made for the run.
+    """
+
+    from . import interactions
+
+    secret = os.urandom(32)
+    rest = FakeRestServer(rate_limit=10**9)
+    await rest.start()
+
+    bot = Bot(
+        False,
+        token="benchmark",
+        prefix="!",
+        http_options={"base_url": rest.url, "global_rate_limit": 10**9},
+        interactions_public_key=interactions.public_key(secret),
+        interactions_port=0,
+    )
+    server = bot.interactions_server
+    server.defer_after = 0.05  # type: ignore
+
+    @bot.add_command(name="echo")
+    async def echo(ctx, text: str, *, rest: str = ""):
+        await ctx.send(f"{text} {rest}")
+
+    @bot.add_command(name="slow")
+    async def slow(ctx):
+        await asyncio.sleep(0.1)
+        await ctx.send("done")
+        await ctx.send("and a followup")
+
+    url = await server.start()  # type: ignore
+
+    fixtures = []
+    for index in range(requests):
+        if defer_every and index % defer_every == 0:
+            payload = _interaction_payload(index, "slow", {})
+        else:
+            payload = _interaction_payload(
+                index, "echo", {"text": "hello", "rest": "over http"}
+            )
+
+        body = json.dumps(payload).encode()
+        fixtures.append((body, interactions.sign_request(secret, body)))
+
+    latencies: t.List[float] = []
+    statuses: t.Dict[int, int] = {}
+
+    async with aiohttp.ClientSession() as session:
+
+        async def post(body: bytes, headers: t.Dict[str, str]) -> None:
+            start = time.perf_counter()
+            async with session.post(url, data=body, headers=headers) as response:
+                await response.read()
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+            latencies.append(time.perf_counter() - start)
+
+        async def worker(worker_id: int) -> None:
+            for body, headers in fixtures[worker_id::concurrency]:
+                await post(body, headers)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(index) for index in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+        # Tampered with after signing, so it has to be refused
+        body, headers = fixtures[0]
+        await post(body + b" ", headers)
+
+    await server.close()  # type: ignore
+    await bot.http.close()
+    await bot.dispatcher.close()
+    await rest.close()
+
+    return {
+        "requests_per_second": requests / elapsed,
+        "latency_ms": _percentiles(latencies[:requests]),
+        "statuses": statuses,
+        "immediate": server.immediate,  # type: ignore
+        "deferred": server.deferred,  # type: ignore
+        "rejected": server.rejected,  # type: ignore
+        "webhook_requests": {
+            route: count
+            for route, count in rest.requests_by_route.items()
+            if "/webhooks/" in route
+        },
+    }
+
+
+def _storage_entities(
+    guilds: int, channels_per_guild: int, users: int
+) -> t.Iterator[t.Tuple[str, t.Dict[str, t.Any]]]:
+    """The payloads of the guilds, channels and users of the storage suite"""
+
+    for index in range(guilds):
+        guild_id = 100000 + index
+        channel_ids = [
+            guild_id * 100 + channel for channel in range(channels_per_guild)
+        ]
+        yield "guild", guild_payload(guild_id, channel_ids)
+
+    for index in range(users):
+        yield "user", {
+            "id": str(1000 + index),
+            "username": f"user{index}",
+            "discriminator": f"{index % 10000:04}",
+            "avatar": "a" * 32,
+            "bot": False,
+        }
+
+
+def _storage_worker(
+    mode: str,
+    path: str,
+    sizes: t.Tuple[int, int, int],
+    lookups: int,
+    seed: int,
+    results,
+) -> None:
+    # Top level, so spawned processes can import it
+    import random
+
+    from .state import ConnectionState
+    from .storage import SQLiteBackend
+
+    guilds, channels_per_guild, users = sizes
+    baseline = _rss()
+
+    backend = SQLiteBackend(path) if mode == "sqlite" else None
+    state = ConnectionState(None, max_users=None, backend=backend)
+
+    if mode == "memory":
+        # What every process does on its own without a shared backend
+        for kind, payload in _storage_entities(*sizes):
+            if kind == "guild":
+                state.parse_guild_create(payload)
+            else:
+                state.store_user(payload)
+
+    generator = random.Random(seed)
+    channel_ids = [
+        (100000 + generator.randrange(guilds)) * 100
+        + generator.randrange(channels_per_guild)
+        for _ in range(lookups)
+    ]
+    user_ids = [1000 + generator.randrange(users) for _ in range(lookups)]
+
+    latencies: t.List[float] = []
+    for channel_id, user_id in zip(channel_ids, user_ids):
+        start = time.perf_counter()
+        channel = state.get_channel(channel_id)
+        user = state.get_user(user_id)
+        latencies.append(time.perf_counter() - start)
+        assert channel is not None and user is not None
+
+    results.put(
+        {
+            "rss_bytes": _rss(),
+            "cache_rss_bytes": _rss() - baseline,
+            "lookup_us": _percentiles(latencies, 1e6),
+        }
+    )
+
+    if backend is not None:
+        backend.close()
+
+
+async def bench_storage(
+    *,
+    workers: int = 8,
+    guilds: int = 1000,
+    channels_per_guild: int = 20,
+    users: int = 20000,
+    lookups: int = 5000,
+) -> t.Dict[str, t.Any]:
+    """Lookup latency and total memory of ``workers`` processes sharing a cache or not
+
+    Every worker looks up ``lookups`` random channels and users, either from a
+    cache it filled itself with every payload, as separate processes do without a
+    backend, or from one SQLite database filled beforehand. A REST lookup against
+    a local stand-in server is timed for comparison.
+    """
+
+    import multiprocessing
+
+    from .http import DiscordHttpClient
+    from .state import ConnectionState
+    from .storage import SQLiteBackend
+
+    sizes = (guilds, channels_per_guild, users)
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "state.sqlite")
+
+    backend = SQLiteBackend(path)
+    state = ConnectionState(None, max_users=None, backend=backend)
+    start = time.perf_counter()
+    for kind, payload in _storage_entities(*sizes):
+        if kind == "guild":
+            state.parse_guild_create(payload)
+        else:
+            state.store_user(payload)
+    backend.close()
+
+    result: t.Dict[str, t.Any] = {
+        "workers": workers,
+        "channels": guilds * channels_per_guild,
+        "users": users,
+        "sqlite_fill_s": time.perf_counter() - start,
+        "sqlite_bytes": os.path.getsize(path),
+        "sqlite_batches": backend.batches,
+    }
+
+    def run_workers(mode: str) -> t.Dict[str, t.Any]:
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        processes = [
+            context.Process(
+                target=_storage_worker,
+                args=(mode, path, sizes, lookups, index, results),
+            )
+            for index in range(workers)
+        ]
+        for process in processes:
+            process.start()
+
+        reports = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+        return {
+            "total_rss_bytes": sum(report["rss_bytes"] for report in reports),
+            "total_cache_rss_bytes": sum(
+                report["cache_rss_bytes"] for report in reports
+            ),
+            "lookup_us_p50": max(report["lookup_us"]["p50"] for report in reports),
+            "lookup_us_p99": max(report["lookup_us"]["p99"] for report in reports),
+        }
+
+    loop = asyncio.get_running_loop()
+    for mode in ("memory", "sqlite"):
+        result[mode] = await loop.run_in_executor(None, run_workers, mode)
+
+    shutil.rmtree(directory)
+
+    rest = FakeRestServer(rate_limit=10**9)
+    await rest.start()
+    client = DiscordHttpClient(base_url=rest.url, global_rate_limit=10**9)  # type: ignore
+    client.login("benchmark")
+
+    latencies: t.List[float] = []
+    for index in range(500):
+        start = time.perf_counter()
+        await client.get_channel(index)
+        latencies.append(time.perf_counter() - start)
+
+    result["rest_lookup_us"] = _percentiles(latencies, 1e6)
+
+    await client.close()
+    await rest.close()
+    return result
+
+
+def _mixed_traffic(path: str, events: int) -> None:
+    """Records READY, a guild and ``events`` events of a busy guild to ``path``"""
+
+    from .recording import GatewayRecorder
+
+    guild_id, channel_id = 100000, 10000000
+    recorder = GatewayRecorder(path)
+
+    def record(sequence: int, event: str, data: t.Dict[str, t.Any]) -> None:
+        recorder.record(0, json.dumps({"t": event, "s": sequence, "op": 0, "d": data}))
+
+    record(
+        1,
+        "READY",
+        {
+            "v": 9,
+            "session_id": "session-0",
+            "user": {"id": "1", "username": "benchmark", "bot": True},
+            "guilds": [{"id": str(guild_id), "unavailable": True}],
+        },
+    )
+    record(2, "GUILD_CREATE", guild_payload(guild_id, [channel_id]))
+
+    for index in range(events):
+        user_id = str(1000 + index % 5000)
+        member = {
+            "user": {
+                "id": user_id,
+                "username": f"user{user_id}",
+                "discriminator": "0001",
+                "avatar": "a" * 32,
+            },
+            "roles": [make_snowflake(role) for role in range(3)],
+            "nick": None,
+            "joined_at": "2021-07-01T00:00:00.000000+00:00",
+            "premium_since": None,
+            "deaf": False,
+            "mute": False,
+        }
+
+        kind = index % 20
+        if kind < 8:
+            event, data = "PRESENCE_UPDATE", {
+                "user": {"id": user_id},
+                "guild_id": str(guild_id),
+                "status": "online",
+                "activities": [
+                    {
+                        "name": "a game",
+                        "type": 0,
+                        "created_at": 1625097600000,
+                        "timestamps": {"start": 1625097000000},
+                        "application_id": make_snowflake(index),
+                        "details": "In a match",
+                        "state": "Playing solo",
+                        "assets": {"large_image": "b" * 18, "large_text": "a map"},
+                    }
+                ],
+                "client_status": {"desktop": "online"},
+            }
+        elif kind < 13:
+            event, data = "TYPING_START", {
+                "channel_id": str(channel_id),
+                "guild_id": str(guild_id),
+                "user_id": user_id,
+                "timestamp": 1625097600,
+                "member": member,
+            }
+        elif kind < 15:
+            event, data = "MESSAGE_REACTION_ADD", {
+                "user_id": user_id,
+                "channel_id": str(channel_id),
+                "message_id": make_snowflake(index),
+                "guild_id": str(guild_id),
+                "member": member,
+                "emoji": {"id": None, "name": "+1"},
+            }
+        else:
+            event, data = "MESSAGE_CREATE", message_payload(
+                make_snowflake(index), channel_id, guild_id, "just a normal message"
+            )
+
+        record(index + 3, event, data)
+
+    recorder.close()
+
+
+async def bench_filter(
+    *, recording: t.Optional[str] = None, events: int = 50000
+) -> t.Dict[str, t.Any]:
+    """CPU time of replaying a recording with and without skipping unwanted events
+
+    Without a ``recording``, one of ``events`` events of a busy guild is made first,
+    where only the messages have a listener, and the presences, typing and reactions
+    are skipped when filtering.
+    """
+
+    from .recording import ReplayDriver
+
+    directory = None
+    if recording is None:
+        directory = tempfile.mkdtemp()
+        recording = os.path.join(directory, "gateway.rec")
+        _mixed_traffic(recording, events)
+
+    decoders = {"json": encoding.JSONDecoder()}
+    if encoding.orjson is not None:
+        decoders["orjson"] = encoding.OrjsonDecoder()
+
+    result: t.Dict[str, t.Any] = {}
+    for name, decoder in decoders.items():
+        runs: t.Dict[str, t.Any] = {}
+        for filtered in (False, True):
+            bot = Bot(
+                False,
+                token="benchmark",
+                prefix="!",
+                decoder=decoder,
+                filter_events=filtered,
+            )
+
+            cpu = time.process_time()
+            replay = await ReplayDriver(bot, recording).run()
+            replay["cpu_s"] = time.process_time() - cpu
+            replay["intents"] = bot.intents
+
+            runs["filtered" if filtered else "unfiltered"] = replay
+            await bot.dispatcher.close()
+
+        unfiltered, filtered = runs["unfiltered"]["cpu_s"], runs["filtered"]["cpu_s"]
+        runs["cpu_saved"] = 1 - filtered / unfiltered if unfiltered else 0.0
+        result[name] = runs
+
+    if directory is not None:
+        shutil.rmtree(directory)
+
+    return result
+
+
+def bench_decode(*, events: int = 10000) -> t.Dict[str, t.Any]:
+    """Bytes on the wire and decode time for ``events`` recorded-like gateway events"""
+
+    frames = []
+    for index in range(events):
+        if index % 500 == 0:
+            data = guild_payload(100000 + index, [index * 100 + n for n in range(20)])
+            event = "GUILD_CREATE"
+        else:
+            data = message_payload(make_snowflake(index), 1000, 10, "hello world " * 4)
+            event = "MESSAGE_CREATE"
+
+        frames.append(json.dumps({"op": 0, "s": index, "t": event, "d": data}))
+
+    raw = [frame.encode() for frame in frames]
+
+    compressor = zlib.compressobj()
+    compressed = [
+        compressor.compress(frame) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        for frame in raw
+    ]
+
+    decoders = {"json": encoding.JSONDecoder()}
+    if encoding.orjson is not None:
+        decoders["orjson"] = encoding.OrjsonDecoder()
+
+    result: t.Dict[str, t.Any] = {
+        "events": events,
+        "bytes_json": sum(map(len, raw)),
+        "bytes_zlib_stream": sum(map(len, compressed)),
+        "decode_ms": {},
+        "inflate_and_decode_ms": {},
+    }
+
+    for name, decoder in decoders.items():
+        start = time.perf_counter()
+        for frame in raw:
+            decoder.loads(frame)
+        result["decode_ms"][name] = (time.perf_counter() - start) * 1000
+
+        inflater = encoding.ZlibStreamInflater()
+        start = time.perf_counter()
+        for frame in compressed:
+            decoder.loads(inflater.feed(frame))  # type: ignore
+        result["inflate_and_decode_ms"][name] = (time.perf_counter() - start) * 1000
+
+    return result
+
+
+class _EagerGuild:
+    """The guild model as it was before slots, copying every field of the payload"""
+
+    _FIELDS = (
+        "roles",
+        "icon",
+        "description",
+        "splash",
+        "discovery_splash",
+        "features",
+        "stickers",
+        "banner",
+        "owner_id",
+        "region",
+        "afk_channel_id",
+        "afk_timeout",
+        "system_channel_id",
+        "widget_enabled",
+        "widget_channel_id",
+        "verification_level",
+        "default_message_notifications",
+        "mfa_level",
+        "explicit_content_filter",
+        "max_presences",
+        "max_members",
+        "max_video_channel_users",
+        "vanity_url_code",
+        "premium_tier",
+        "premium_subscription_count",
+        "system_channel_flags",
+        "preferred_locale",
+        "rules_channel_id",
+        "public_updates_channel_id",
+        "nsfw",
+        "nsfw_level",
+    )
+
+    def __init__(self, bot, json: t.Dict[str, t.Any]) -> None:
+        self.bot = bot
+        self.id = json["id"]
+        self.name = json["name"]
+        for field in self._FIELDS:
+            setattr(self, field, json.get(field))
+
+
+class _EagerTextChannel:
+    """The text channel model as it was before slots"""
+
+    _FIELDS = (
+        "last_message_id",
+        "last_pin_timestamp",
+        "name",
+        "position",
+        "parent_id",
+        "topic",
+        "guild_id",
+        "permission_overwrites",
+        "nsfw",
+        "rate_limit_per_user",
+    )
+
+    def __init__(self, channel_json: t.Dict[str, t.Any], bot) -> None:
+        self.http = bot
+        self.loop = bot
+        self.id = channel_json["id"]
+        self.type = channel_json["type"]
+        for field in self._FIELDS:
+            setattr(self, field, channel_json.get(field))
+
+
+def bench_models(*, count: int = 10000) -> t.Dict[str, t.Any]:
+    """Memory kept by ``count`` cached guilds and channels, against the eager models
+
+    Every model is built from a payload of its own that is then dropped, as the
+    gateway does, so whatever the model keeps of its payload is counted too.
+    """
+
+    def guild(index: int) -> t.Dict[str, t.Any]:
+        return guild_payload(100000 + index, [])
+
+    def channel(index: int) -> t.Dict[str, t.Any]:
+        return channel_payload(1000000 + index, 100000)
+
+    result: t.Dict[str, t.Any] = {"count": count}
+
+    for name, build in (
+        ("guild", lambda index: Guild(None, guild(index))),
+        ("eager_guild", lambda index: _EagerGuild(None, guild(index))),
+        ("channel", lambda index: TextChannel(channel(index), None)),
+        ("eager_channel", lambda index: _EagerTextChannel(channel(index), None)),
+    ):
+        tracemalloc.start()
+        start = tracemalloc.get_traced_memory()[0]
+        start_time = time.perf_counter()
+
+        models = [build(index) for index in range(count)]
+
+        elapsed = time.perf_counter() - start_time
+        used = tracemalloc.get_traced_memory()[0] - start
+        tracemalloc.stop()
+
+        result[f"{name}_bytes"] = used
+        result[f"{name}_build_ms"] = elapsed * 1000
+        del models
+
+    return result
+
+
+def bench_messages(
+    *, count: int = 10000, traffic: int = 100000, channels: int = 50
+) -> t.Dict[str, t.Any]:
+    """Memory of ``count`` cached messages, and the hit rate of edits and deletes
+
+    The memory is measured from encoded MESSAGE_CREATE payloads, so it is what the
+    cache keeps once the decoded payloads are gone, compared with keeping the
+    payloads themselves. Then ``traffic`` messages go through a cache of ``count``,
+    with one edit or delete for every ten messages, mostly of recent messages.
+    """
+
+    import random
+
+    def payloads(total: int) -> t.List[bytes]:
+        return [
+            json.dumps(
+                message_payload(
+                    str(10**17 + index),
+                    100000 + index % channels,
+                    100000,
+                    f"message {index} with a few words in it",
+                )
+            ).encode()
+            for index in range(total)
+        ]
+
+    encoded = payloads(count)
+    result: t.Dict[str, t.Any] = {"count": count}
+
+    for name, options in (
+        ("cache", {}),
+        ("per_channel_cache", {"max_cached_messages_per_channel": count // channels}),
+    ):
+        bot = Bot(
+            False, token="benchmark", prefix="!", max_cached_messages=count, **options
+        )
+        state = bot.state
+
+        # The authors are cached before measuring, as the messages share them
+        for raw in encoded:
+            state.message_author(json.loads(raw))
+
+        tracemalloc.start()
+        start = tracemalloc.get_traced_memory()[0]
+        for raw in encoded:
+            state.parse_message_create(json.loads(raw))
+        result[f"{name}_bytes_per_10k"] = (
+            (tracemalloc.get_traced_memory()[0] - start) / count * 10000
+        )
+
+        # Full, every new message evicts one, so the memory stays where it is
+        for raw in payloads(count * 2)[count:]:
+            state.parse_message_create(json.loads(raw))
+        result[f"{name}_bytes_per_10k_after_{count * 2}"] = (
+            (tracemalloc.get_traced_memory()[0] - start) / count * 10000
+        )
+        tracemalloc.stop()
+
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    kept = {}
+    for raw in encoded:
+        payload = json.loads(raw)
+        kept[payload["id"]] = payload
+    result["payloads_bytes_per_10k"] = (
+        (tracemalloc.get_traced_memory()[0] - start) / count * 10000
+    )
+    tracemalloc.stop()
+    del kept
+
+    bot = Bot(False, token="benchmark", prefix="!", max_cached_messages=count)
+    state = bot.state
+    messages = state.messages
+    random_ = random.Random(0)
+    start_time = time.perf_counter()
+    for index in range(traffic):
+        message_id = str(10**17 + index)
+        state.parse(
+            "MESSAGE_CREATE",
+            message_payload(message_id, 100000 + index % channels, 100000, "hi"),
+        )
+        if index % 10 == 0:
+            # Most edits and deletes are of recent messages, a few of old ones
+            target = str(10**17 + max(0, index - int(random_.expovariate(4 / count))))
+            if random_.random() < 0.5:
+                state.parse("MESSAGE_UPDATE", {"id": target, "content": "edited"})
+            else:
+                state.parse("MESSAGE_DELETE", {"id": target, "channel_id": "1"})
+
+    result.update(
+        {
+            "traffic": traffic,
+            "traffic_us": (time.perf_counter() - start_time) / traffic * 1e6,
+            "cached": len(messages),  # type: ignore
+            "hits": messages.hits,  # type: ignore
+            "misses": messages.misses,  # type: ignore
+            "hit_rate": messages.hit_rate,  # type: ignore
+        }
+    )
+    return result
+
+
+async def bench_commands(
+    *, commands: int = 500, messages: int = 20000
+) -> t.Dict[str, t.Any]:
+    """Cost of finding and converting a command with ``commands`` registered"""
+
+    bot = Bot(False, token="benchmark", prefix="!")
+
+    for index in range(commands):
+
+        async def command(ctx, number: int, text: str = ""):
+            pass
+
+        bot.add_command(name=f"command{index}", aliases=[f"c{index}"])(command)
+
+    class FakeMessage:
+        def __init__(self, content: str):
+            self.content = content
+            self.guild_id = 1
+            self.channel = None
+
+    samples = [
+        FakeMessage(f"!command{index % commands} 42 text") for index in range(messages)
+    ]
+    samples += [FakeMessage("not a command") for _ in range(messages)]
+
+    timings = {}
+    for name, batch in (
+        ("command_us", samples[:messages]),
+        ("not_command_us", samples[messages:]),
+    ):
+        start = time.perf_counter()
+        for message in batch:
+            await bot.process_command(message)  # type: ignore
+        await bot.join_commands()
+        timings[name] = (time.perf_counter() - start) / len(batch) * 1e6
+
+    return {"commands": commands, "messages": messages, **timings}
+
+
+async def bench_cooldowns(
+    *, users: int = 500000, messages: int = 20000
+) -> t.Dict[str, t.Any]:
+    """Cost of the cooldown checks, and memory of the cooldowns of ``users`` users
+
+    One user spams a command with a cooldown through ``process_command``, and the
+    invocations turned away are timed against those that run.
+    """
+
+    from .cooldowns import CommandLimits, Cooldown, MaxConcurrency
+
+    limits = CommandLimits(Cooldown(5, 10.0), MaxConcurrency(1))
+    start = time.perf_counter()
+    for index in range(messages):
+        limits.release(limits.acquire(index, 1, 1))
+    check_us = (time.perf_counter() - start) / messages * 1e6
+
+    cooldown = Cooldown(1, 10.0)
+    tracemalloc.start()
+    now = time.monotonic()
+    for user_id in range(users):
+        cooldown.consume(user_id, now)
+    keys_before = len(cooldown)
+    memory_before = tracemalloc.get_traced_memory()[0]
+
+    evicted = cooldown.sweep(now + cooldown.per)
+    memory_after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    # Timed again without tracing, which slows every allocation and free
+    for user_id in range(users):
+        cooldown.consume(user_id, now)
+    start = time.perf_counter()
+    cooldown.sweep(now + cooldown.per)
+    sweep_ms = (time.perf_counter() - start) * 1000
+
+    bot = Bot(False, token="benchmark", prefix="!")
+
+    async def on_command_error(exc, context):
+        pass
+
+    bot.on_command_error = on_command_error  # type: ignore
+
+    async def ping(ctx, number: int):
+        pass
+
+    async def spam(ctx, number: int):
+        pass
+
+    bot.add_command(name="ping")(ping)
+    bot.add_command(name="spam", cooldown=Cooldown(5, 60.0))(spam)
+
+    class FakeChannel:
+        id = 1
+
+    author = bot.state.store_user({"id": "1", "username": "user"})
+
+    class FakeMessage:
+        def __init__(self, content: str):
+            self.content = content
+            self.guild_id = 1
+            self.channel = FakeChannel()
+            self.author = author
+
+    timings = {}
+    for name in ("ping", "spam"):
+        batch = [FakeMessage(f"!{name} 42") for _ in range(messages)]
+        start = time.perf_counter()
+        for message in batch:
+            await bot.process_command(message)  # type: ignore
+        await bot.join_commands()
+        timings[f"{name}_us"] = (time.perf_counter() - start) / messages * 1e6
+
+    counts = bot.metrics.commands
+    await bot.http.close()
+
+    return {
+        "users": users,
+        "messages": messages,
+        "check_us": check_us,
+        "keys_before_sweep": keys_before,
+        "keys_after_sweep": len(cooldown),
+        "evicted": evicted,
+        "sweep_ms": sweep_ms,
+        "memory_before_sweep_mb": memory_before / 1e6,
+        "memory_after_sweep_mb": memory_after / 1e6,
+        "bytes_per_key": (memory_before - memory_after) / max(evicted, 1),
+        "spam_ok": counts.labels("spam", "ok").value,
+        "spam_limited": counts.labels("spam", "limited").value,
+        **timings,
+    }
+
+
+def bench_prefixes(*, prefixes: int = 50, messages: int = 100000) -> t.Dict[str, t.Any]:
+    """Matching messages against many prefixes, with ``startswith`` and the matcher"""
+
+    from .prefix import PrefixMatcher
+
+    candidates = [f"{chr(33 + index % 15)}{index}" for index in range(prefixes)]
+    matcher = PrefixMatcher(candidates)
+    samples = [
+        "hello there" if index % 50 else f"{candidates[index % prefixes]} ping"
+        for index in range(messages)
+    ]
+
+    def startswith(content: str):
+        for prefix in candidates:
+            if content.startswith(prefix):
+                return prefix
+        return None
+
+    timings = {}
+    for name, match in (("startswith_us", startswith), ("matcher_us", matcher.match)):
+        start = time.perf_counter()
+        for content in samples:
+            match(content)
+        timings[name] = (time.perf_counter() - start) / messages * 1e6
+
+    return {"prefixes": prefixes, "messages": messages, **timings}
+
+
+SUITES = {
+    "load": bench_load,
+    "lifecycle": bench_lifecycle,
+    "http": bench_http,
+    "coalesce": bench_coalesce,
+    "converters": bench_converters,
+    "sends": bench_sends,
+    "history": bench_history,
+    "bulk": bench_bulk,
+    "replay": bench_replay,
+    "filter": bench_filter,
+    "storage": bench_storage,
+    "interactions": bench_interactions,
+    "decode": bench_decode,
+    "models": bench_models,
+    "messages": bench_messages,
+    "commands": bench_commands,
+    "cooldowns": bench_cooldowns,
+    "prefixes": bench_prefixes,
+}
+
+
+async def run(
+    suites: t.Iterable[str], options: t.Optional[t.Dict[str, t.Dict[str, t.Any]]] = None
+) -> t.Dict[str, t.Any]:
+    """Runs the named suites, and returns their results with details of the environment
+
+    Args:
+        suites (t.Iterable[str]): Names of the suites in ``SUITES`` to run
+        options (t.Optional[t.Dict[str, t.Dict[str, t.Any]]]): Keyword arguments for each suite, by name. Defaults to None.
+    """
+
+    options = options or {}
+    results: t.Dict[str, t.Any] = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.time(),
+        "suites": {},
+    }
+
+    for name in suites:
+        suite = SUITES[name]
+        result = suite(**options.get(name, {}))
+        if asyncio.iscoroutine(result):
+            result = await result
+
+        results["suites"][name] = result
+
+    return results
+
+
+def main(argv: t.Optional[t.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "suites", nargs="*", help=f"Suites to run, out of {', '.join(SUITES)}"
+    )
+    parser.add_argument("--output", help="File to write the JSON results to")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--message-rate", type=float, default=1000.0)
+    parser.add_argument("--command-ratio", type=float, default=0.02)
+    parser.add_argument("--rest-latency", type=float, default=0.0)
+    parser.add_argument(
+        "--recording", help="Gateway recording for the replay and filter suites"
+    )
+    arguments = parser.parse_args(argv)
+
+    unknown = set(arguments.suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suites: {', '.join(sorted(unknown))}")
+
+    options = {
+        "load": {
+            "duration": arguments.duration,
+            "message_rate": arguments.message_rate,
+            "command_ratio": arguments.command_ratio,
+            "rest_latency": arguments.rest_latency,
+        },
+        "http": {"rest_latency": arguments.rest_latency},
+        "coalesce": {"rest_latency": arguments.rest_latency or 0.01},
+        "replay": {"recording": arguments.recording},
+        "filter": {"recording": arguments.recording},
+    }
+
+    results = asyncio.run(run(arguments.suites or list(SUITES), options))
+    output = json.dumps(results, indent=2)
+
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,99 +1,377 @@
 import asyncio
+import concurrent.futures
 import inspect
-import json
+import logging
+import signal
+import time
+import traceback
 import typing as t
 
-import websockets
-
-from . import channel, errors, http
-from .command import BotCommand
+from . import (
+    bulk,
+    channel,
+    cooldowns,
+    dispatch,
+    encoding,
+    errors,
+    executors,
+    gateway,
+    http,
+    interactions,
+    metrics,
+    outbound,
+    recording,
+    storage,
+)
+from .command import CONVERTERS, BotCommand
 from .context import Context
 from .embed import Embed
 from .guild import Guild
-from .message import Message
+from .message import CachedMessage, Message
+from .prefix import PrefixResolver
+from .state import ConnectionState
 from .user import User
 
+log = logging.getLogger(__name__)
+
 
 class Bot:
     """Basic bot implementation.
 
     This is the class to use for starting, stopping, controlling and developing
     the bot. You can subclass this class to get extra functionality and features not already added.
+
+    Metrics are always recorded in :attr:`metrics`, and are also served for Prometheus
+    at ``http://<metrics_host>:<metrics_port>/metrics`` when a port is given.
+
+    Commands found in messages run as tasks of their own, at most
+    ``max_running_commands`` at once, so a slow command does not hold up the
+    events of other channels. Past that, new commands wait for a free slot.
+
+    With an ``interactions_public_key``, slash commands are also taken over http at
+    ``http://<interactions_host>:<interactions_port>/interactions``, and run the
+    command of the same name. Their signatures are checked with PyNaCl, so the bot
+    refuses to start without it.
     """
 
     def __init__(
-        self, debug: t.Optional[bool] = True, *, token: str, prefix: str
+        self,
+        debug: t.Optional[bool] = True,
+        *,
+        token: str,
+        prefix: t.Union[str, t.Sequence[str]],
+        http_options: t.Optional[t.Dict[str, t.Any]] = None,
+        gateway_url: t.Optional[str] = None,
+        compress: bool = False,
+        decoder: t.Optional[encoding.Decoder] = None,
+        max_cached_users: t.Optional[int] = 10000,
+        max_cached_messages: t.Optional[int] = 1000,
+        max_cached_messages_per_channel: t.Optional[int] = None,
+        dispatch_options: t.Optional[t.Dict[str, t.Any]] = None,
+        metrics_host: str = "127.0.0.1",
+        metrics_port: t.Optional[int] = None,
+        send_queue_window: t.Optional[float] = None,
+        thread_workers: t.Optional[int] = None,
+        process_workers: t.Optional[int] = None,
+        loop_block_threshold: t.Optional[float] = 0.25,
+        record_gateway: t.Optional[str] = None,
+        record_compress: bool = False,
+        prefix_resolver=None,
+        prefix_ttl: float = 300.0,
+        mention_prefix: bool = False,
+        intents: t.Optional[int] = None,
+        filter_events: bool = True,
+        state_backend: t.Optional[storage.StateBackend] = None,
+        interactions_public_key: t.Optional[str] = None,
+        interactions_host: str = "127.0.0.1",
+        interactions_port: int = 8080,
+        cooldown_sweep_interval: float = 60.0,
+        max_running_commands: int = 1000,
     ) -> None:
 
         self.running = False
-        self.loop = asyncio.get_event_loop()
+        self.debug = debug
 
-        if debug:
-            self.loop.set_debug(True)
+        # Nothing is bound to a loop until the bot runs, see the loop property
+        self._loop: t.Optional[asyncio.AbstractEventLoop] = None
+        self._stopped: t.Optional[asyncio.Event] = None
 
         self.prefix = prefix
 
-        self.http = http.DiscordHttpClient(self.loop)
+        self.decoder = decoder or encoding.default_decoder()
+        self.compress = compress
+
+        self.metrics = metrics.BotMetrics()
+        self.metrics_server: t.Optional[metrics.MetricsServer] = None
+        if metrics_port is not None:
+            self.metrics_server = metrics.MetricsServer(
+                self.metrics, host=metrics_host, port=metrics_port
+            )
+        self._loop_monitor = metrics.EventLoopLagMonitor(self.metrics.loop_lag)
+
+        # Opt in: takes slash commands over http, with or without the gateway
+        self.interactions_server: t.Optional[interactions.InteractionServer] = None
+        if interactions_public_key is not None:
+            self.interactions_server = interactions.InteractionServer(
+                self,
+                interactions_public_key,
+                host=interactions_host,
+                port=interactions_port,
+            )
+
+        self.http = http.DiscordHttpClient(
+            None,
+            decoder=self.decoder,
+            metrics=self.metrics,
+            **(http_options or {}),
+        )
         self.is_closed = False
         self.token = token
 
+        # Opt in: merges the plain text sent to a channel within the window
+        self.send_queue: t.Optional[outbound.SendQueue] = None
+        if send_queue_window is not None:
+            self.send_queue = outbound.SendQueue(self.http, window=send_queue_window)
+
         self.http.login(self.token)
         self.commands: t.List[BotCommand] = []
 
+        # Pools for the commands that do not run on the loop, started when first used
+        self.pools = {
+            executors.THREAD: executors.CommandPool(
+                executors.THREAD,
+                lambda: concurrent.futures.ThreadPoolExecutor(
+                    thread_workers, thread_name_prefix="command"
+                ),
+                self.metrics,
+            ),
+            executors.PROCESS: executors.CommandPool(
+                executors.PROCESS,
+                lambda: concurrent.futures.ProcessPoolExecutor(process_workers),
+                self.metrics,
+            ),
+        }
+        self.loop_block_threshold = loop_block_threshold
+        self._command_index: t.Dict[str, BotCommand] = {}
+        self._cooldown_sweeper = cooldowns.CooldownSweeper(
+            self, interval=cooldown_sweep_interval
+        )
+        self._command_slots = asyncio.Semaphore(max_running_commands)
+        self._command_tasks: t.Set[asyncio.Future] = set()
+        self.converters: t.Dict[t.Any, t.Callable[..., t.Any]] = dict(CONVERTERS)
+
+        self.gateway_url = gateway_url
+        self.gateway: t.Optional[gateway.Gateway] = None
+
+        # Derived from the listeners when connecting if not given
+        self._intents = intents
+        self.filter_events = filter_events
+
+        # Opt in: appends every frame received from the gateway to a file
+        self.recorder: t.Optional[recording.GatewayRecorder] = None
+        if record_gateway is not None:
+            self.recorder = recording.GatewayRecorder(
+                record_gateway, compress=record_compress
+            )
+        self.user: t.Optional[User] = None
+
+        # Opt in: shares the cached payloads with other processes, e.g. an SQLiteBackend
+        self.state = ConnectionState(
+            self,
+            max_users=max_cached_users,
+            backend=state_backend,
+            max_messages=max_cached_messages,
+            max_messages_per_channel=max_cached_messages_per_channel,
+        )
+
+        # Per guild prefixes from the resolver, cached for prefix_ttl seconds
+        self.prefixes = PrefixResolver(
+            self,
+            prefix,
+            resolver=prefix_resolver,
+            ttl=prefix_ttl,
+            mention=mention_prefix,
+        )
+
+        self.dispatcher = dispatch.EventDispatcher(
+            on_error=self.on_error, **(dispatch_options or {})
+        )
+        self.dispatcher.add_handler("READY", self._handle_ready)
+        self.dispatcher.add_handler("MESSAGE_CREATE", self._handle_message_create)
+
+        self.metrics.gauge(
+            "discord_dispatch_queue_depth",
+            "Events waiting for a dispatch worker",
+            function=lambda: self.dispatcher.queue_depth,
+        )
+        self.metrics.gauge(
+            "discord_gateway_pending_events",
+            "Events received from the gateway and not handed to the dispatcher yet",
+            function=lambda: sum(
+                connection.pending_events for connection in self._gateways()
+            ),
+        )
+        self.metrics.gauge(
+            "discord_commands_running",
+            "Commands found in messages that are still running",
+            function=lambda: len(self._command_tasks),
+        )
+        self.metrics.counter(
+            "discord_dispatch_dropped_total",
+            "Events dropped because the dispatch queues were full",
+            function=lambda: self.dispatcher.metrics.dropped,
+        )
+        self.metrics.gauge(
+            "discord_cached_guilds",
+            "Guilds in the cache",
+            function=lambda: len(self.state.guilds),
+        )
+        self.metrics.gauge(
+            "discord_cached_users",
+            "Users in the cache",
+            function=lambda: len(self.state.users),
+        )
+        if self.state.messages is not None:
+            messages = self.state.messages
+            self.metrics.gauge(
+                "discord_cached_messages",
+                "Messages in the cache",
+                function=lambda: len(messages),
+            )
+            self.metrics.counter(
+                "discord_message_cache_hits_total",
+                "Message lookups, updates and deletes that found the message cached",
+                function=lambda: messages.hits,
+            )
+            self.metrics.counter(
+                "discord_message_cache_misses_total",
+                "Message lookups, updates and deletes that did not find the message cached",
+                function=lambda: messages.misses,
+            )
+
+    async def _start_servers(self) -> None:
+        """Starts measuring the event loop lag, sweeping the cooldowns, and the metrics and interactions servers that were set up"""
+
+        self._loop_monitor.start()
+        self._cooldown_sweeper.start()
+        if self.metrics_server is not None:
+            await self.metrics_server.start()
+        if self.interactions_server is not None:
+            await self.interactions_server.start()
+
     async def connect(self):
         """Connect the bot to the discord servers
 
-        Args:
-            reconnect (bool): If we should try to reconnect to discord after the connection is closed. Defaults to True.
+        The connection is kept alive with heartbeats and resumed whenever it drops,
+        until the bot is closed.
         """
 
-        headers = {
-            "Authorization": f"Bot {self.token}",
-            "bot": "True",
-            "Content-type": "application/json",
-        }
+        # The servers bind while the gateway url is fetched
+        _, (url, max_concurrency, _) = await asyncio.gather(
+            self._start_servers(), self._get_gateway()
+        )
 
-        async with websockets.connect(  # type: ignore
-            uri="wss://gateway.discord.gg/?v=9&encoding=json", extra_headers=headers
-        ) as discord_websocket:
-            data = await discord_websocket.recv()
+        self.gateway = gateway.Gateway(
+            self,
+            url=url,
+            identify_limiter=gateway.IdentifyLimiter(max_concurrency),
+            compress=self.compress,
+            decoder=self.decoder,
+        )
+        await self.gateway.run()
 
-            payload = f"""{{
-        "op": 2,
-        "d": {{
-            "token": "{self.token}",
-            "intents": {1 << 9},
-            "properties": {{
-                "$os": "linux",
-                "$browser": "books_discord_py",
-                "$device": "books_discord_py"
-            }}
-        }}
-    }}"""
-            await discord_websocket.send(payload)
+    async def _get_gateway(self) -> t.Tuple[str, int, int]:
+        """The gateway url, identify ``max_concurrency`` and recommended shard count"""
 
-            ready_data = await discord_websocket.recv()
-            user_json = json.loads(ready_data)
-            self.user = User(user_json["d"]["user"], self)
+        if self.gateway_url is not None:
+            return self.gateway_url, 1, 1
 
-            should_receive = True
+        gateway_data = await self.http.get_gateway_bot()
+        return (
+            gateway_data["url"],
+            gateway_data["session_start_limit"]["max_concurrency"],
+            gateway_data["shards"],
+        )
 
-            while should_receive:
-                data = await discord_websocket.recv()
+    def _gateways(self) -> t.List[gateway.Gateway]:
+        return [self.gateway] if self.gateway is not None else []
 
-                asyncio.ensure_future(self.handle_events(json.loads(data)))
+    def gateway_for_guild(self, guild_id: int) -> gateway.Gateway:
+        """The gateway connection that receives the events of a guild"""
+
+        if self.gateway is None:
+            raise errors.GatewayError("The bot is not connected to the gateway")
+
+        return self.gateway
+
+    @property
+    def latency(self) -> float:
+        """The time in seconds between the last heartbeat and its acknowledgement"""
+
+        if self.gateway is None:
+            return float("inf")
+
+        return self.gateway.latency
+
+    @property
+    def intents(self) -> int:
+        """The intents sent in IDENTIFY
+
+        Unless given when creating the bot, these are the intents of the events that
+        have a listener or update the cache when the bot identifies, leaving out the
+        privileged intents. Listeners added later only get their events once the
+        bot identifies again, so they should be added before connecting.
+        """
+
+        if self._intents is not None:
+            return self._intents
+
+        return gateway.intents_for(self.dispatcher.events | self.state.events)
+
+    def wants_event(self, event: t.Optional[str]) -> bool:
+        """If a dispatch event has to be parsed, because a listener or the cache uses it"""
+
+        return (
+            event in gateway.GATEWAY_EVENTS
+            or self.dispatcher.has_handlers(event)  # type: ignore
+            or self.state.parses(event)  # type: ignore
+        )
 
     async def handle_events(self, event_data) -> None:
 
         if event_data["op"] != 0:
             return
 
-        if event_data["t"] == "MESSAGE_CREATE":
-            message = await Message(self).setup(event_data["d"])
-            asyncio.ensure_future(self.on_message_create(message))
+        self.metrics.events.labels(event_data["t"]).inc()
+        self.state.parse(event_data["t"], event_data["d"])
+        await self.dispatcher.dispatch(event_data)
+
+    def add_listener(self, event: str, listener) -> None:
+        """Registers a coroutine to be called with the data of a gateway event
+
+        Args:
+            event (str): The name of the event, e.g. ``GUILD_CREATE``
+            listener (t.Callable[[t.Dict[str, t.Any]], t.Awaitable[None]]): The coroutine to call with the ``d`` field of the event
+        """
+
+        if not inspect.iscoroutinefunction(listener):
+            raise TypeError("Listeners must be a coroutine")
+
+        self.dispatcher.add_handler(event, listener)
+
+    async def _handle_ready(self, data) -> None:
+        if self.prefixes.mention:
+            # The mention prefixes need the id of the bot, known from READY
+            self.prefixes.invalidate()
 
-        if event_data["t"] == "READY":
-            asyncio.ensure_future(self.on_ready())
+        await self.on_ready()
+
+    async def _handle_message_create(self, data) -> None:
+        message = await Message(self).setup(data)
+        await self.on_message_create(message)
+
+    async def on_error(self, event: str, exc: Exception):
+        traceback.print_exception(type(exc), exc, exc.__traceback__)
 
     async def on_ready(self):
         pass
@@ -107,69 +385,124 @@ class Bot:
         Args:
             message (Message): The message to process
         """
-        try:
-            if message.content.startswith(self.prefix):
-                command_message = message.content[len(self.prefix) :]
+        content = message.content
+        if not content:
+            return
 
-                for command in self.commands:
-                    if command_message.split(" ")[0] == command.name:
-                        # They have ran a command
+        matcher = self.prefixes.cached(message.guild_id)
+        if matcher is None:
+            matcher = await self.prefixes.get(message.guild_id)
 
-                        # Handle the arguments to the command
-                        given_arguments = command_message.split(" ")[1:]
+        prefix = matcher.match(content)
+        if prefix is None:
+            return
+
+        words = content[len(prefix) :].split()
+        if not words:
+            return
 
-                        # The signature of the command
-                        sig = inspect.signature(command.callback)
+        command = self._command_index.get(words[0])
+        if command is None:
+            return
 
-                        print(sig.parameters)
+        # Run apart from the dispatch worker, which handles the events of other
+        # channels in order after this one
+        await self._command_slots.acquire()
+        task = asyncio.ensure_future(self._run_command(command, message, words))
+        self._command_tasks.add(task)
+        task.add_done_callback(self._command_done)
 
-                        items = sig.parameters.items()
+    def _command_done(self, task: asyncio.Future) -> None:
+        self._command_tasks.discard(task)
+        self._command_slots.release()
+
+    async def join_commands(self, timeout: t.Optional[float] = None) -> bool:
+        """Waits for the commands found in messages that are still running
+
+        Args:
+            timeout (t.Optional[float]): Max seconds to wait, no limit if None. Defaults to None.
 
-                        position = -1
-                        for key, value in items:
-                            if value.annotation == int:
+        Returns:
+            bool: If every command finished in time
+        """
 
-                                given_arguments[position] = int(
-                                    given_arguments[position]
-                                )
+        if not self._command_tasks:
+            return True
 
-                            if value.annotation == Guild:
-                                if given_arguments[position].isnumeric():
-                                    guild = await self.get_guild(
-                                        int(given_arguments[position])
-                                    )
-                                    given_arguments[position] = guild
+        _, pending = await asyncio.wait(set(self._command_tasks), timeout=timeout)
+        return not pending
 
-                            position += 1
+    async def _run_command(
+        self, command: BotCommand, message: Message, words: t.List[str]
+    ) -> None:
+        try:
+            await self._invoke_command(command, message, words)
+        except Exception as exc:
+            # Raised by on_command_error, with no dispatch worker to report it
+            await self.on_error("MESSAGE_CREATE", exc)
 
-                        # Check for the number of parameters given
-                        if len(given_arguments) > len(sig.parameters) - 1:
-                            raise errors.TooManyArguments(
-                                "Too many arguments were passed"
-                            )
-                        elif len(given_arguments) < len(sig.parameters) - 1:
-                            raise errors.NotEnoughArguments(
-                                "Not enough arguments were passed"
-                            )
+    async def _invoke_command(
+        self, command: BotCommand, message: Message, words: t.List[str]
+    ) -> None:
+        started = time.perf_counter()
+        limits = command.limits
+        acquired = False
+        try:
+            # Checked before converting, so a spammed command costs next to nothing
+            if limits is not None:
+                key = limits.acquire(
+                    message.author.id,
+                    message.channel.id if message.channel is not None else None,
+                    message.guild_id,
+                )
+                acquired = True
 
-                        # Get the context of the command, and invoke it
-                        context = Context(self, message)
-                        await command.call_command(context, *given_arguments)
-                        return
+            args, kwargs = await command.plan.convert(self, words[1:])
 
-                    if command_message.split(" ")[0] in command.aliases:
-                        # They have run a command
-                        context = Context(self, message)
-                        await command.call_command(context)
-                        return
+            # Get the context of the command, and invoke it
+            context = Context(self, message)
+            await command.call_command(context, *args, **kwargs)
 
         except Exception as e:
+            status = "limited" if isinstance(e, errors.CommandLimited) else "error"
+            self.metrics.commands.labels(command.name, status).inc()
             context = Context(self, message)
             await self.on_command_error(e, context)
 
+        else:
+            self.metrics.commands.labels(command.name, "ok").inc()
+
+        finally:
+            if acquired:
+                limits.release(key)  # type: ignore
+            self.metrics.command_latency.labels(command.name).observe(
+                time.perf_counter() - started
+            )
+
     async def on_command_error(self, exc: Exception, context: Context):
         raise exc
 
+    def _loop_blocked(self, command: BotCommand, seconds: float) -> None:
+        self.metrics.loop_blocked.labels(command.name).inc()
+        self.on_loop_blocked(command, seconds)
+
+    def on_loop_blocked(self, command: BotCommand, seconds: float) -> None:
+        """Called when a command held the event loop for longer than ``loop_block_threshold``
+
+        Logs a warning by default.
+
+        Args:
+            command (BotCommand): The command
+            seconds (float): How long it held the loop without awaiting
+        """
+
+        log.warning(
+            "The command %s blocked the event loop for %.3fs, "
+            "consider running it in a thread or process",
+            command.name,
+            seconds,
+        )
+
     async def send_message(
         self,
         channel_id: int,
@@ -185,6 +518,9 @@ class Bot:
             content (str): The content of the message to send
             tts (t.Optional[bool], optional): If it should be a discord text-to-speach (tts) message: Defaults to False.
             embeds (t.Optional[t.List[t.Dict[str, str]]], optional): List of dictionaries for embeds to send. The embeds must be in the discord desired format: Defaults to None.
+
+        Returns:
+            t.Optional[asyncio.Future]: With a send queue, a future resolved once the message is delivered
         """
 
         if (
@@ -197,6 +533,9 @@ class Bot:
                 "Discord requires either a message content or embed to send in a message"
             )
 
+        if self.send_queue is not None:
+            return self.send_queue.send(channel_id, content, tts, embeds)
+
         await self.http.send_message(channel_id, content, tts, embeds)
 
     async def get_text_channel(self, channel_id: int) -> channel.TextChannel:
@@ -209,47 +548,357 @@ class Bot:
             channel.TextChannel: The channel object that corresponds to the id provided
         """
 
+        cached = self.state.get_channel(channel_id)
+        if cached is not None:
+            return cached
+
         channel_json = await self.http.get_channel(channel_id)
-        return channel.TextChannel(channel_json, self)  # type: ignore
+        return self.state.store_channel(channel_json)  # type: ignore
 
     async def get_guild(self, guild_id: int) -> Guild:
+        """Get the discord guild for a given id
+
+        Args:
+            guild_id (int): The id of the guild to get
+
+        Returns:
+            Guild: The guild object that corresponds to the id provided
+        """
+
+        cached = self.state.get_guild(guild_id)
+        if cached is not None:
+            return cached
+
         guild_json = await self.http.get_guild(guild_id)
-        return Guild(self, guild_json)
+        return self.state.store_guild(guild_json)  # type: ignore
+
+    def get_user(self, user_id: int) -> t.Optional[User]:
+        """Get a cached user for a given id
+
+        Args:
+            user_id (int): The id of the user to get
+
+        Returns:
+            t.Optional[User]: The user, or None if they are not in the cache
+        """
+
+        return self.state.get_user(user_id)
+
+    async def edit_channels(
+        self,
+        edits: t.Mapping[int, t.Dict[str, t.Any]],
+        *,
+        concurrency: int = 10,
+        reason: t.Optional[str] = None,
+    ) -> bulk.BulkResult:
+        """Changes many channels at once, with up to ``concurrency`` requests in flight
+
+        Args:
+            edits (t.Mapping[int, t.Dict[str, t.Any]]): The payload of every edit in the form discord takes, by channel id
+            concurrency (int): Max number of requests in flight. Defaults to 10.
+            reason (t.Optional[str]): The reason shown in the audit log. Defaults to None.
+
+        Returns:
+            bulk.BulkResult: The outcome for every channel
+        """
+
+        result = await bulk.edit_channels(
+            self.http, edits, concurrency=concurrency, reason=reason
+        )
+
+        # Keep the cache in step with what discord accepted
+        for channel_json in result.results.values():
+            if channel_json:
+                self.state.store_channel(channel_json)
+
+        return result
+
+    async def fetch_user(self, user_id: int) -> User:
+        """Get the user for a given id, from the cache or else from discord
+
+        Args:
+            user_id (int): The id of the user to get
+
+        Returns:
+            User: The user that corresponds to the id provided
+        """
+
+        cached = self.state.get_user(user_id)
+        if cached is not None:
+            return cached
+
+        user_json = await self.http.get_user(user_id)
+        return self.state.store_user(user_json)
+
+    def get_message(self, message_id: int) -> t.Optional[CachedMessage]:
+        """Get a message from the message cache, None if it is not cached
+
+        Args:
+            message_id (int): The id of the message to get
+        """
+
+        if self.state.messages is None:
+            return None
+
+        return self.state.messages.get(int(message_id))
 
-    def complete_pending_tasks(self):
-        loop = asyncio.new_event_loop()
+    async def fetch_message(self, channel_id: int, message_id: int) -> CachedMessage:
+        """Get a message from the cache, or else from discord
 
-        def get_pending_tasks():
-            tasks = asyncio.all_tasks()
-            pending = [
-                task for task in tasks if task != run_main_task and not task.done()
-            ]
-            return pending
+        Messages fetched from discord are not added to the cache, as they would
+        evict messages more recent than them.
 
-        async def run_all_pending_tasks():
-            while True:
-                pending_tasks = get_pending_tasks()
-                if len(pending_tasks) == 0:
-                    return
-                await asyncio.gather(*pending_tasks)
+        Args:
+            channel_id (int): The id of the channel the message was sent in
+            message_id (int): The id of the message to get
+
+        Returns:
+            CachedMessage: The message that corresponds to the ids provided
+        """
+
+        cached = self.get_message(message_id)
+        if cached is not None:
+            return cached
+
+        message_json = await self.http.get_message(channel_id, message_id)
+        return CachedMessage(message_json, self.state.message_author(message_json))
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The event loop the bot runs on
+
+        The running loop once the bot runs. Before that, a new loop for :meth:`start`
+        to run on, only created when it is first asked for.
+        """
+
+        if self._loop is None or self._loop.is_closed():
+            try:
+                self._loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self._loop = asyncio.new_event_loop()
+
+        return self._loop
+
+    async def complete_pending_tasks(self, timeout: t.Optional[float] = None) -> int:
+        """Waits for every other task on the loop to finish, including the tasks they start
+
+        Args:
+            timeout (t.Optional[float]): Max seconds to wait, no limit if None. Defaults to None.
+
+        Returns:
+            int: The number of tasks still pending when the timeout ran out
+        """
+
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        current = asyncio.current_task()
+
+        while True:
+            pending = {
+                task
+                for task in asyncio.all_tasks()
+                if task is not current and not task.done()
+            }
+            if not pending:
+                return 0
+
+            remaining = None if deadline is None else deadline - loop.time()
+            if remaining is not None and remaining <= 0:
+                return len(pending)
+
+            await asyncio.wait(pending, timeout=remaining)
+
+    async def run(self, *, gateway: bool = True) -> None:
+        """Runs the bot on the running loop until :meth:`stop` is called, then shuts it down
+
+        The http session, the pools, the dispatch workers and the connections are
+        only made once the loop runs, so a bot can be built before there is a loop
+        and nothing it made is tied to the wrong one.
+
+        Args:
+            gateway (bool): If the bot should connect to the gateway, otherwise it only takes interactions over http. Defaults to True.
+        """
+
+        self._loop = asyncio.get_running_loop()
+        if self.debug:
+            self._loop.set_debug(True)
+
+        self.running = True
+        self.is_closed = False
+        self._stopped = asyncio.Event()
+        stopped = asyncio.ensure_future(self._stopped.wait())
+        main = asyncio.ensure_future(
+            self.connect() if gateway else self._start_servers()
+        )
+
+        try:
+            await asyncio.wait((main, stopped), return_when=asyncio.FIRST_COMPLETED)
+            if not gateway and main.done() and main.exception() is None:
+                await stopped
+        finally:
+            stopped.cancel()
+            if not self._gateways():
+                # Still starting, so there is no connection to close that would end it
+                main.cancel()
+            await self.shutdown()
+
+            # Closing the gateways ended the connection, unless it failed first
+            if not main.done():
+                main.cancel()
+            await asyncio.gather(main, return_exceptions=True)
+
+        if main.done() and not main.cancelled() and main.exception() is not None:
+            raise main.exception()  # type: ignore
+
+    def stop(self) -> None:
+        """Makes :meth:`run` shut the bot down, safe to call from a signal handler"""
+
+        if self._stopped is not None:
+            self._stopped.set()
+
+    async def shutdown(self, timeout: float = 10.0) -> bool:
+        """Shuts the bot down gracefully, within ``timeout`` seconds.
+
+        The gateways and the interactions server stop taking new events first. The
+        events already received, the commands they run and the messages waiting in
+        the send queue are then given until the deadline to finish, and whatever is
+        left after that is cancelled. Last the recording and the state backend are
+        flushed and every socket is closed, the metrics server last so the drain
+        can be watched until the end.
+
+        Args:
+            timeout (float): Seconds the drain can take. Defaults to 10.
+
+        Returns:
+            bool: If everything finished before the deadline
+        """
+
+        if self.is_closed:
+            return True
+
+        self.is_closed = True
+        self.running = False
+        self.stop()
 
-        run_main = run_all_pending_tasks()
-        run_main_task = loop.create_task(run_main)
-        self.loop.run_until_complete(run_main_task)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
 
-    def start(self) -> None:
-        """Starts the bot and establishes a connection to discord"""
+        def remaining() -> float:
+            return max(0.0, deadline - loop.time())
 
-        loop = asyncio.new_event_loop()
-        loop.create_task(self.connect())
-        loop.run_forever()
+        self._loop_monitor.stop()
+        self._cooldown_sweeper.stop()
+        listeners = [connection.close() for connection in self._gateways()]
+        if self.interactions_server is not None:
+            listeners.append(self.interactions_server.stop())
+        await asyncio.gather(*listeners, return_exceptions=True)
 
-        # {"t":null,"s":null,"op":10,"d":{"heartbeat_interval":41250,"_trace":["[\"gateway-prd-main-h3kg\",{\"micros\":0.0}]"]}}
+        drained = True
+        try:
+            # The events the gateways received, then the commands those events ran
+            await asyncio.wait_for(
+                asyncio.gather(*(connection.join() for connection in self._gateways())),
+                remaining(),
+            )
+            await asyncio.wait_for(self.dispatcher.join(), remaining())
+        except asyncio.TimeoutError:
+            drained = False
+        drained = await self.join_commands(remaining()) and drained
+        for task in self._command_tasks:
+            task.cancel()
+        await self.dispatcher.close()
+
+        if self.interactions_server is not None:
+            drained = await self.interactions_server.join(remaining()) and drained
+
+        if self.send_queue is not None:
+            try:
+                await asyncio.wait_for(self.send_queue.close(), remaining())
+            except asyncio.TimeoutError:
+                drained = False
+
+        for pool in self.pools.values():
+            pool.shutdown(wait=drained)
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.state.backend is not None:
+            self.state.backend.close()
+
+        await self.http.close()
+        if self.metrics_server is not None:
+            await self.metrics_server.close()
+
+        return drained
+
+    def start(self, *, gateway: bool = True) -> None:
+        """Runs the bot until it is stopped, then shuts it down and closes its loop
+
+        SIGINT and SIGTERM stop the bot, so a deploy that replaces the process lets
+        the commands it is running finish first.
+
+        Args:
+            gateway (bool): If the bot should connect to the gateway, otherwise it only takes interactions over http. Defaults to True.
+        """
+
+        loop = self.loop
+        asyncio.set_event_loop(loop)
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, self.stop)
+            except (NotImplementedError, RuntimeError):
+                # Not supported on windows, where KeyboardInterrupt still stops the loop
+                pass
+
+        try:
+            loop.run_until_complete(self.run(gateway=gateway))
+        finally:
+            self.close()
 
     def close(self):
+        """Shuts the bot down if it is still running, then closes the loop it ran on
 
-        asyncio.run(self.http.close())
-        self.loop.close()
+        Any task still left on the loop is cancelled before it is closed. Inside a
+        running loop, await :meth:`shutdown` instead.
+        """
+
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+
+        if not self.is_closed:
+            loop.run_until_complete(self.shutdown())
+
+        # Tasks the bot did not start, like a status reporter, are cancelled so they
+        # are not destroyed while still pending
+        pending = [task for task in asyncio.all_tasks(loop) if not task.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+
+    def add_converter(self, annotation: t.Any):
+        """Registers a converter for the command parameters annotated with ``annotation``
+
+        The converter is called with the bot and the word given, and can be a coroutine.
+        Coroutine converters of one command invocation run concurrently.
+
+        Args:
+            annotation (t.Any): The annotation to convert, usually a type
+        """
+
+        def inner(converter):
+            self.converters[annotation] = converter
+
+            # Plans pick their converters when they are built
+            for command in self.commands:
+                command.build_plan(self.converters)
+
+            return converter
+
+        return inner
 
     def add_command(
         self,
@@ -257,14 +906,163 @@ class Bot:
         name: t.Optional[str] = None,
         aliases: t.Optional[t.List[str]] = None,
         description: t.Optional[str] = None,
+        execution: str = executors.LOOP,
+        cooldown: t.Optional[cooldowns.Cooldown] = None,
+        max_concurrency: t.Optional[cooldowns.MaxConcurrency] = None,
     ):
+        """Registers a command
+
+        A command over its cooldown or concurrency limit is not run, and
+        :meth:`on_command_error` gets a :class:`errors.CommandOnCooldown` or
+        :class:`errors.MaxConcurrencyReached` instead.
+
+        Args:
+            name (t.Optional[str]): The name of the command
+            aliases (t.Optional[t.List[str]]): Other names of the command. Defaults to None.
+            description (t.Optional[str]): The description, the docstring of the callback if None. Defaults to None.
+            execution (str): ``loop`` to run a coroutine on the event loop, or ``thread`` or ``process`` to run a function on a pool of the bot. Defaults to ``loop``.
+            cooldown (t.Optional[cooldowns.Cooldown]): How often a user, channel or guild can use the command. Defaults to None.
+            max_concurrency (t.Optional[cooldowns.MaxConcurrency]): How many invocations of a user, channel or guild can run at once. Defaults to None.
+        """
+
         def inner(func):
-            if inspect.iscoroutinefunction(func):
-                command = BotCommand(self, name, aliases, description, callback=func)
-                self.commands.append(command)
+            if inspect.iscoroutinefunction(func) != (execution == executors.LOOP):
+                raise TypeError(
+                    "Commands must be a coroutine"
+                    if execution == executors.LOOP
+                    else f"Commands run in a {execution} must be a function"
+                )
+
+            command = BotCommand(
+                self,
+                name,
+                aliases,
+                description,
+                callback=func,
+                execution=execution,
+                cooldown=cooldown,
+                max_concurrency=max_concurrency,
+            )
+            self.commands.append(command)
 
-                return func
-            else:
-                raise TypeError("Commands must be a coroutine")
+            # The first command registered under a name or alias keeps it
+            for key in (command.name, *command.aliases):
+                self._command_index.setdefault(key, command)
+
+            return func
 
         return inner
+
+
+class AutoShardedBot(Bot):
+    """A bot that runs several shards in one process.
+
+    Discord requires sharding past 2,500 guilds. Every shard is its own gateway
+    connection, and they all share the cache, the commands and the event loop.
+    Identifies are spread over the ``max_concurrency`` buckets discord gives the bot.
+
+    Args:
+        shard_count (t.Optional[int]): The total number of shards, the count recommended by discord if None. Defaults to None.
+        shard_ids (t.Optional[t.List[int]]): The shards to run in this bot, all of them if None. Defaults to None.
+        identify_limiter (t.Optional[gateway.IdentifyLimiter]): Limiter to share with other processes of the same bot. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        *args,
+        shard_count: t.Optional[int] = None,
+        shard_ids: t.Optional[t.List[int]] = None,
+        identify_limiter: t.Optional[gateway.IdentifyLimiter] = None,
+        **kwargs,
+    ) -> None:
+        super().__init__(*args, **kwargs)
+
+        if shard_ids is not None and shard_count is None:
+            raise ValueError("shard_count is needed when shard_ids are given")
+
+        self.shard_count = shard_count
+        self.shard_ids = shard_ids
+        self.identify_limiter = identify_limiter
+        self.shards: t.Dict[int, gateway.Gateway] = {}
+
+    async def connect(self):
+        """Connect every shard to the discord servers
+
+        The connections are kept alive with heartbeats and resumed whenever they drop,
+        until the bot is closed.
+        """
+
+        _, (url, max_concurrency, recommended_shards) = await asyncio.gather(
+            self._start_servers(), self._get_gateway()
+        )
+
+        if self.shard_count is None:
+            self.shard_count = recommended_shards
+
+        if self.shard_ids is None:
+            self.shard_ids = list(range(self.shard_count))
+
+        if self.identify_limiter is None:
+            self.identify_limiter = gateway.IdentifyLimiter(max_concurrency)
+
+        for shard_id in self.shard_ids:
+            self.shards[shard_id] = gateway.Gateway(
+                self,
+                url=url,
+                shard_id=shard_id,
+                shard_count=self.shard_count,
+                identify_limiter=self.identify_limiter,
+                compress=self.compress,
+                decoder=self.decoder,
+            )
+
+        self.gateway = self.shards[self.shard_ids[0]]
+        await asyncio.gather(*(shard.run() for shard in self.shards.values()))
+
+    def shard_for_guild(self, guild_id: int) -> int:
+        """The id of the shard that receives the events of a guild"""
+
+        return (int(guild_id) >> 22) % (self.shard_count or 1)
+
+    def _gateways(self) -> t.List[gateway.Gateway]:
+        return list(self.shards.values())
+
+    def gateway_for_guild(self, guild_id: int) -> gateway.Gateway:
+        shard = self.shards.get(self.shard_for_guild(guild_id))
+        if shard is None:
+            raise errors.GatewayError(
+                f"The shard of the guild {guild_id} is not run here"
+            )
+
+        return shard
+
+    @property
+    def latency(self) -> float:
+        """The average heartbeat latency of every connected shard"""
+
+        latencies = [
+            latency for latency in self.latencies.values() if latency != float("inf")
+        ]
+        if not latencies:
+            return float("inf")
+
+        return sum(latencies) / len(latencies)
+
+    @property
+    def latencies(self) -> t.Dict[int, float]:
+        """The heartbeat latency of every shard, by shard id"""
+
+        return {shard_id: shard.latency for shard_id, shard in self.shards.items()}
+
+    @property
+    def shard_status(self) -> t.Dict[int, t.Dict[str, t.Any]]:
+        """The status and latency of every shard, by shard id"""
+
+        return {
+            shard_id: {
+                "status": shard.status,
+                "latency": shard.latency,
+                "sequence": shard.sequence,
+            }
+            for shard_id, shard in self.shards.items()
+        }
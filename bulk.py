@@ -0,0 +1,192 @@
+import asyncio
+import time
+import typing as t
+
+DISCORD_EPOCH = 1420070400000
+
+# Discord refuses to bulk delete messages older than 2 weeks. A minute is taken
+# off so a message does not age out between the check and the request.
+BULK_DELETE_MAX_AGE = 14 * 24 * 60 * 60 - 60
+BULK_DELETE_MAX = 100
+
+
+class BulkResult:
+    """The outcome of a bulk operation, for every item it was given.
+
+    An item that failed does not stop the others, so every item ends up either in
+    :attr:`results` or in :attr:`errors`.
+    """
+
+    def __init__(self) -> None:
+        self.results: t.Dict[t.Any, t.Any] = {}
+        self.errors: t.Dict[t.Any, Exception] = {}
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def __repr__(self) -> str:
+        return f"<BulkResult succeeded={len(self.results)} failed={len(self.errors)}>"
+
+
+def _created_at(snowflake: int) -> float:
+    return ((int(snowflake) >> 22) + DISCORD_EPOCH) / 1000
+
+
+async def _run_bounded(
+    jobs: t.List[t.Tuple[t.List[t.Any], t.Callable[[], t.Awaitable[t.Any]]]],
+    result: BulkResult,
+    concurrency: int,
+) -> BulkResult:
+    """Runs jobs with at most ``concurrency`` in flight, filing the outcome of each under its items"""
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(items: t.List[t.Any], job) -> None:
+        async with semaphore:
+            try:
+                value = await job()
+            except Exception as exc:
+                for item in items:
+                    result.errors[item] = exc
+            else:
+                for item in items:
+                    result.results[item] = value
+
+    await asyncio.gather(*(run(items, job) for items, job in jobs))
+    return result
+
+
+async def delete_messages(
+    http,
+    channel_id: int,
+    message_ids: t.Iterable[int],
+    *,
+    concurrency: int = 5,
+    reason: t.Optional[str] = None,
+) -> BulkResult:
+    """Deletes messages of a channel with as few requests as possible
+
+    Messages newer than two weeks are deleted 100 at a time with the bulk delete
+    endpoint, and older ones, which it refuses, one at a time.
+
+    Args:
+        http (DiscordHttpClient): The client to make the requests with
+        channel_id (int): The id of the channel of the messages
+        message_ids (t.Iterable[int]): The ids of the messages to delete
+        concurrency (int): Max number of requests in flight. Defaults to 5.
+        reason (t.Optional[str]): The reason shown in the audit log. Defaults to None.
+
+    Returns:
+        BulkResult: None for every message deleted, and the error of every other one
+    """
+
+    cutoff = time.time() - BULK_DELETE_MAX_AGE
+    recent: t.List[int] = []
+    old: t.List[int] = []
+    for message_id in dict.fromkeys(int(message_id) for message_id in message_ids):
+        (recent if _created_at(message_id) > cutoff else old).append(message_id)
+
+    jobs: t.List[t.Tuple[t.List[t.Any], t.Callable[[], t.Awaitable[t.Any]]]] = []
+
+    for index in range(0, len(recent), BULK_DELETE_MAX):
+        chunk = recent[index : index + BULK_DELETE_MAX]
+        if len(chunk) == 1:
+            # The bulk endpoint takes at least 2 messages
+            old.append(chunk[0])
+            continue
+
+        jobs.append(
+            (
+                chunk,
+                lambda chunk=chunk: http.bulk_delete_messages(
+                    channel_id, chunk, reason=reason
+                ),
+            )
+        )
+
+    for message_id in old:
+        jobs.append(
+            (
+                [message_id],
+                lambda message_id=message_id: http.delete_message(
+                    channel_id, message_id, reason=reason
+                ),
+            )
+        )
+
+    return await _run_bounded(jobs, BulkResult(), concurrency)
+
+
+async def edit_channels(
+    http,
+    edits: t.Mapping[int, t.Dict[str, t.Any]],
+    *,
+    concurrency: int = 10,
+    reason: t.Optional[str] = None,
+) -> BulkResult:
+    """Changes many channels at once
+
+    Every channel is its own rate limit bucket, so the edits run concurrently, up
+    to ``concurrency`` at a time.
+
+    Args:
+        http (DiscordHttpClient): The client to make the requests with
+        edits (t.Mapping[int, t.Dict[str, t.Any]]): The payload of every edit in the form discord takes, by channel id
+        concurrency (int): Max number of requests in flight. Defaults to 10.
+        reason (t.Optional[str]): The reason shown in the audit log. Defaults to None.
+
+    Returns:
+        BulkResult: The updated payload of every channel edited, and the error of every other one
+    """
+
+    jobs = [
+        (
+            [channel_id],
+            lambda channel_id=channel_id, payload=payload: http.modify_channel(
+                channel_id, payload, reason=reason
+            ),
+        )
+        for channel_id, payload in edits.items()
+    ]
+
+    return await _run_bounded(jobs, BulkResult(), concurrency)
+
+
+async def move_channels(
+    http,
+    guild_id: int,
+    positions: t.Mapping[int, int],
+    *,
+    reason: t.Optional[str] = None,
+) -> BulkResult:
+    """Sets the position of many channels of a guild with one request
+
+    Args:
+        http (DiscordHttpClient): The client to make the request with
+        guild_id (int): The id of the guild of the channels
+        positions (t.Mapping[int, int]): The new position of every channel, by channel id
+        reason (t.Optional[str]): The reason shown in the audit log. Defaults to None.
+
+    Returns:
+        BulkResult: The position of every channel moved, or the error for all of them
+    """
+
+    result = BulkResult()
+    if not positions:
+        return result
+
+    payload = [
+        {"id": str(channel_id), "position": position}
+        for channel_id, position in positions.items()
+    ]
+
+    try:
+        await http.edit_channel_positions(guild_id, payload, reason=reason)
+    except Exception as exc:
+        for channel_id in positions:
+            result.errors[channel_id] = exc
+    else:
+        result.results.update(positions)
+
+    return result
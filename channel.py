@@ -1,26 +1,76 @@
+import asyncio
 import typing as t
+
+from . import bulk
 from .embed import Embed as discordEmbed
+from .message import Message
+from .utils import (
+    LazyPayloadField,
+    PayloadField,
+    paginate,
+    payload_fields,
+    slim_payload,
+    snowflake,
+)
 
 
 class TextChannel:
+    __slots__ = ("_bot", "_data", "_lazy", "id", "guild_id", "name", "type")
+
     def __init__(self, channel_json: t.Dict[t.Any, t.Any], bot) -> None:
 
-        self.http = bot.http
-        self.loop = bot.loop
+        self._bot = bot
+        self._data = slim_payload({}, channel_json, _PAYLOAD_FIELDS)
+        self._lazy: t.Optional[t.Dict[str, t.Any]] = None
 
-        # Defining all the attributes from what gets returned from the discord API in `channel_json`
-        self.id = channel_json["id"]
-        self.last_message_id = channel_json["last_message_id"]
-        self.last_pin_timestamp = channel_json.get("last_pin_timestamp", None)
+        self.id = int(channel_json["id"])
+        self.guild_id = snowflake(channel_json.get("guild_id"))
+        self.name = channel_json.get("name")
         self.type = channel_json["type"]
-        self.name = channel_json["name"]
-        self.position = channel_json["position"]
-        self.parent_id = channel_json["parent_id"]
-        self.topic = channel_json["topic"]
-        self.guild_id = channel_json["guild_id"]
-        self.permission_overwrites = channel_json["permission_overwrites"]
-        self.nsfw = channel_json["nsfw"]
-        self.rate_limit_per_user = channel_json["rate_limit_per_user"]
+
+    def _update(self, channel_json: t.Dict[t.Any, t.Any]) -> None:
+        """Updates the channel in place from a full or partial payload
+
+        Args:
+            channel_json (t.Dict[t.Any, t.Any]): The payload, e.g. of a CHANNEL_UPDATE event
+        """
+
+        slim_payload(self._data, channel_json, _PAYLOAD_FIELDS)
+        self._lazy = None
+
+        if "guild_id" in channel_json:
+            self.guild_id = snowflake(channel_json["guild_id"])
+        self.name = channel_json.get("name", self.name)
+        self.type = channel_json.get("type", self.type)
+
+    def _payload(self) -> t.Dict[str, t.Any]:
+        """The payload the channel can be built from again"""
+
+        return {
+            "id": str(self.id),
+            "guild_id": None if self.guild_id is None else str(self.guild_id),
+            "name": self.name,
+            "type": self.type,
+            **self._data,
+        }
+
+    @property
+    def http(self):
+        return self._bot.http
+
+    @property
+    def loop(self):
+        return self._bot.loop
+
+    # Every other attribute is read from what gets returned from the discord API in `channel_json`
+    last_message_id = PayloadField("last_message_id", convert=int)
+    last_pin_timestamp = PayloadField("last_pin_timestamp")
+    position = PayloadField("position")
+    parent_id = PayloadField("parent_id", convert=int)
+    topic = PayloadField("topic")
+    permission_overwrites = LazyPayloadField("permission_overwrites", (), tuple)
+    nsfw = PayloadField("nsfw")
+    rate_limit_per_user = PayloadField("rate_limit_per_user")
 
     async def send(
         self,
@@ -29,14 +79,20 @@ class TextChannel:
         tts: t.Optional[bool] = False,
         embeds: t.Union[
             t.Optional[t.List[discordEmbed]], t.Optional[t.List[dict]]
-        ] = None
-    ) -> None:
+        ] = None,
+    ) -> t.Optional[asyncio.Future]:
         """Sends a message to a discord text channel
 
+        When the bot has a send queue, the message is queued to be merged with other
+        text sent to the channel, and a future for its delivery is returned instead.
+
         Args:
             content `str`: The content
             tts `Optional[bool]`: If the message should be sent as a discord text-to-speach (tts) message. Defaults to False.
             embeds `Optional[List[Dict[Any, Any]]]`: A list of dictionaries representing discord embeds. Defaults to None.
+
+        Returns:
+            `Optional[asyncio.Future]`: With a send queue, a future resolved once the message is delivered
         """
 
         if (
@@ -49,4 +105,66 @@ class TextChannel:
                 "Discord requires either a message content or embed to send in a message"
             )
 
+        send_queue = getattr(self._bot, "send_queue", None)
+        if send_queue is not None:
+            return send_queue.send(self.id, content, tts, embeds)
+
         await self.http.send_message(self.id, content, tts, embeds)
+        return None
+
+    async def history(
+        self,
+        *,
+        limit: t.Optional[int] = 100,
+        before: t.Optional[int] = None,
+        after: t.Optional[int] = None,
+    ) -> t.AsyncIterator[Message]:
+        """Walks the messages of the channel, newest first, or oldest first with only ``after``
+
+        Pages of 100 messages are requested one ahead of the caller, and wait for
+        the rate limit of the route like any other request.
+
+        Args:
+            limit `Optional[int]`: Max number of messages, None for every message. Defaults to 100.
+            before `Optional[int]`: Only messages older than this message id. Defaults to None.
+            after `Optional[int]`: Only messages newer than this message id. Defaults to None.
+
+        Yields:
+            `Message`: The messages, one at a time
+        """
+
+        async def fetch_page(size: int, cursor: t.Optional[int], forward: bool):
+            if forward:
+                return await self.http.get_messages(self.id, limit=size, after=cursor)
+
+            return await self.http.get_messages(self.id, limit=size, before=cursor)
+
+        async for message_json in paginate(
+            fetch_page, limit=limit, page_size=100, before=before, after=after
+        ):
+            yield Message(self._bot)._fill(message_json, self)
+
+    async def delete_messages(
+        self,
+        message_ids: t.Iterable[int],
+        *,
+        concurrency: int = 5,
+        reason: t.Optional[str] = None,
+    ) -> bulk.BulkResult:
+        """Deletes messages of the channel, 100 at a time where discord allows it
+
+        Args:
+            message_ids `Iterable[int]`: The ids of the messages to delete
+            concurrency `int`: Max number of requests in flight. Defaults to 5.
+            reason `Optional[str]`: The reason shown in the audit log. Defaults to None.
+
+        Returns:
+            `bulk.BulkResult`: The outcome for every message
+        """
+
+        return await bulk.delete_messages(
+            self.http, self.id, message_ids, concurrency=concurrency, reason=reason
+        )
+
+
+_PAYLOAD_FIELDS = payload_fields(TextChannel)
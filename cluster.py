@@ -0,0 +1,225 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+import typing as t
+
+from . import http
+from .gateway import IdentifyLimiter
+
+
+class ProcessIdentifyLimiter(IdentifyLimiter):
+    """An :class:`IdentifyLimiter` shared by every process of a cluster.
+
+    The identify buckets are guarded by process locks, so shards in different
+    processes never identify in the same bucket within the same 5 seconds.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 1,
+        *,
+        interval: float = 5.0,
+        context: t.Optional[t.Any] = None,
+    ) -> None:
+        super().__init__(max_concurrency, interval=interval)
+
+        context = context or multiprocessing.get_context()
+        self._process_locks = [context.Lock() for _ in range(max_concurrency)]
+        self._process_last = context.Array("d", max_concurrency)
+
+    async def acquire(self, shard_id: int = 0) -> None:
+        key = shard_id % self.max_concurrency
+        await asyncio.get_running_loop().run_in_executor(None, self._wait, key)
+
+    def _wait(self, key: int) -> None:
+        with self._process_locks[key]:
+            wait = self._process_last[key] + self.interval - time.time()
+            if wait > 0:
+                time.sleep(wait)
+
+            self._process_last[key] = time.time()
+
+
+def _run_cluster(
+    bot_factory,
+    cluster_id: int,
+    shard_ids: t.List[int],
+    shard_count: int,
+    identify_limiter: IdentifyLimiter,
+    status_queue,
+    report_interval: float,
+) -> None:
+    # Every process runs its shards on the loop of its own bot
+    bot = bot_factory(
+        shard_ids=shard_ids, shard_count=shard_count, identify_limiter=identify_limiter
+    )
+
+    async def report_status():
+        try:
+            while True:
+                await asyncio.sleep(report_interval)
+                status_queue.put((cluster_id, bot.shard_status))
+        finally:
+            # Cancelled when the bot closes, once its shards are closed
+            status_queue.put((cluster_id, bot.shard_status))
+
+    bot.loop.create_task(report_status())
+    bot.start()
+
+
+class ClusterLauncher:
+    """Runs the shards of a bot over several processes, to use every core.
+
+    The shards are split into contiguous ranges, one per process, and every
+    process runs an :class:`AutoShardedBot` for its range. Identifies are limited
+    across all of the processes, and every process reports the status of its
+    shards back to the launcher, where a thread reads the reports as they come in.
+
+    The processes are not daemons, so their bots can run commands in process
+    pools of their own. They are stopped with :meth:`stop`, which lets every bot
+    shut down gracefully.
+
+    Args:
+        bot_factory (t.Callable[..., AutoShardedBot]): Top level function that creates the bot of a process, called with the ``shard_ids``, ``shard_count`` and ``identify_limiter`` keyword arguments
+        token (str): The token of the bot, used to ask discord for the shard count
+        shard_count (t.Optional[int]): The total number of shards, the count recommended by discord if None. Defaults to None.
+        processes (t.Optional[int]): The number of processes, one per core if None. Defaults to None.
+        http_options (t.Optional[t.Dict[str, t.Any]]): Options for the http client used to ask for the shard count. Defaults to None.
+        report_interval (float): Seconds between status reports from every process. Defaults to 5.
+    """
+
+    def __init__(
+        self,
+        bot_factory,
+        *,
+        token: str,
+        shard_count: t.Optional[int] = None,
+        processes: t.Optional[int] = None,
+        http_options: t.Optional[t.Dict[str, t.Any]] = None,
+        report_interval: float = 5.0,
+    ) -> None:
+
+        self.bot_factory = bot_factory
+        self.token = token
+        self.shard_count = shard_count
+        self.process_count = processes or os.cpu_count() or 1
+        self.http_options = http_options or {}
+        self.report_interval = report_interval
+
+        self.processes: t.List[multiprocessing.Process] = []
+        self.clusters: t.Dict[int, t.List[int]] = {}
+
+        self._context = multiprocessing.get_context()
+        self._status_queue = self._context.Queue()
+        self._status: t.Dict[int, t.Dict[str, t.Any]] = {}
+        self._status_lock = threading.Lock()
+
+        # Reads the reports, as a process with reports left in the pipe can not exit
+        self._reader: t.Optional[threading.Thread] = None
+
+    async def _get_gateway(self) -> t.Tuple[int, int]:
+        client = http.DiscordHttpClient(**self.http_options)
+        client.login(self.token)
+
+        try:
+            gateway_data = await client.get_gateway_bot()
+        finally:
+            await client.close()
+
+        return (
+            gateway_data["shards"],
+            gateway_data["session_start_limit"]["max_concurrency"],
+        )
+
+    def start(self) -> None:
+        """Splits the shards over the processes and starts them"""
+
+        recommended_shards, max_concurrency = asyncio.run(self._get_gateway())
+        if self.shard_count is None:
+            self.shard_count = recommended_shards
+
+        process_count = min(self.process_count, self.shard_count)
+        per_process, extra = divmod(self.shard_count, process_count)
+
+        identify_limiter = ProcessIdentifyLimiter(
+            max_concurrency, context=self._context
+        )
+
+        start = 0
+        for cluster_id in range(process_count):
+            end = start + per_process + (1 if cluster_id < extra else 0)
+            self.clusters[cluster_id] = list(range(start, end))
+            start = end
+
+            process = self._context.Process(
+                target=_run_cluster,
+                args=(
+                    self.bot_factory,
+                    cluster_id,
+                    self.clusters[cluster_id],
+                    self.shard_count,
+                    identify_limiter,
+                    self._status_queue,
+                    self.report_interval,
+                ),
+                name=f"cluster-{cluster_id}",
+            )
+            process.start()
+            self.processes.append(process)
+
+        self._reader = threading.Thread(
+            target=self._read_status, name="cluster-status", daemon=True
+        )
+        self._reader.start()
+
+    def _read_status(self) -> None:
+        while True:
+            report = self._status_queue.get()
+            if report is None:
+                return
+
+            cluster_id, shard_status = report
+            with self._status_lock:
+                for shard_id, status in shard_status.items():
+                    self._status[shard_id] = {"cluster": cluster_id, **status}
+
+    def status(self) -> t.Dict[int, t.Dict[str, t.Any]]:
+        """The last reported status of every shard, by shard id"""
+
+        with self._status_lock:
+            return dict(self._status)
+
+    def join(self) -> None:
+        """Waits for every process to exit, and for the reports they sent to be read"""
+
+        for process in self.processes:
+            process.join()
+
+        if self._reader is not None:
+            # Queued after the last report of every process, which have all exited
+            self._status_queue.put(None)
+            self._reader.join()
+            self._reader = None
+
+    def stop(self) -> None:
+        """Stops every process, sending SIGTERM so every bot shuts down gracefully"""
+
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+
+        self.join()
+
+    def run(self) -> None:
+        """Starts every process and waits for them, stopping them on Ctrl+C"""
+
+        self.start()
+        try:
+            self.join()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            # Also when the launcher fails, as the processes would outlive it
+            self.stop()
@@ -2,8 +2,284 @@ import typing as t
 import asyncio
 import inspect
 
+from . import errors
+from .channel import TextChannel
+from .cooldowns import CommandLimits, Cooldown, MaxConcurrency
+from .embed import Embed
+from .executors import EXECUTION_MODES, LOOP, watch_blocking
+from .guild import Guild
+from .user import User
+
+_TRUE = frozenset(("true", "yes", "y", "on", "1", "enable", "enabled"))
+_FALSE = frozenset(("false", "no", "n", "off", "0", "disable", "disabled"))
+
+
+def _mention_id(argument: str, prefixes: t.Tuple[str, ...]) -> t.Optional[int]:
+    """The id in a mention such as ``<#id>`` or ``<@!id>``, or of a bare id"""
+
+    if argument.isnumeric():
+        return int(argument)
+
+    if argument.endswith(">"):
+        for prefix in prefixes:
+            if argument.startswith(prefix) and argument[len(prefix) : -1].isnumeric():
+                return int(argument[len(prefix) : -1])
+
+    return None
+
+
+def _to_str(bot, argument: str) -> str:
+    return argument
+
+
+def _to_int(bot, argument: str) -> int:
+    return int(argument)
+
+
+def _to_float(bot, argument: str) -> float:
+    return float(argument)
+
+
+def _to_bool(bot, argument: str) -> bool:
+    lowered = argument.lower()
+    if lowered in _TRUE:
+        return True
+    if lowered in _FALSE:
+        return False
+
+    raise ValueError(f"{argument!r} is not a yes or no")
+
+
+async def _to_guild(bot, argument: str) -> t.Union[Guild, str]:
+    if argument.isnumeric():
+        return await bot.get_guild(int(argument))
+
+    return argument
+
+
+async def _to_text_channel(bot, argument: str) -> t.Union[TextChannel, str]:
+    channel_id = _mention_id(argument, ("<#",))
+    if channel_id is not None:
+        return await bot.get_text_channel(channel_id)
+
+    return argument
+
+
+async def _to_user(bot, argument: str) -> t.Union[User, str]:
+    user_id = _mention_id(argument, ("<@!", "<@"))
+    if user_id is not None:
+        return await bot.fetch_user(user_id)
+
+    return argument
+
+
+CONVERTERS: t.Dict[t.Any, t.Callable[..., t.Any]] = {
+    str: _to_str,
+    int: _to_int,
+    float: _to_float,
+    bool: _to_bool,
+    Guild: _to_guild,
+    TextChannel: _to_text_channel,
+    User: _to_user,
+}
+
+
+def register_converter(annotation: t.Any, converter: t.Callable[..., t.Any]) -> None:
+    """Registers the converter of an annotation for every bot
+
+    Args:
+        annotation (t.Any): The annotation of the parameters to convert, usually a type
+        converter (t.Callable[..., t.Any]): Function or coroutine called with the bot and the word given
+    """
+
+    CONVERTERS[annotation] = converter
+
+
+def _unwrap_optional(annotation: t.Any) -> t.Any:
+    """Turns ``Optional[X]`` into ``X``, leaving any other annotation as it is"""
+
+    if t.get_origin(annotation) is t.Union:
+        arguments = [arg for arg in t.get_args(annotation) if arg is not type(None)]
+        if len(arguments) == 1:
+            return arguments[0]
+
+    return annotation
+
+
+class ArgumentPlan:
+    """How to convert the arguments given to a command, worked out once from its signature.
+
+    Every positional parameter after the context takes one word of the message,
+    converted by its annotation. Parameters with a default are optional. A keyword
+    only parameter takes the rest of the message as one string, and a ``*args``
+    parameter takes the rest of the words, each converted by its annotation.
+
+    Coroutine converters of one invocation run concurrently, and a word given more
+    than once to the same converter is only converted once.
+
+    Args:
+        callback (t.Callable[..., t.Any]): The callback of the command
+        converters (t.Optional[t.Mapping[t.Any, t.Callable[..., t.Any]]]): Converters by annotation, ``CONVERTERS`` if None. Defaults to None.
+        takes_context (bool): If the first parameter is the context, which is not converted. Defaults to True.
+    """
+
+    def __init__(
+        self,
+        callback: t.Callable[..., t.Any],
+        converters: t.Optional[t.Mapping[t.Any, t.Callable[..., t.Any]]] = None,
+        takes_context: bool = True,
+    ) -> None:
+        self.converters = CONVERTERS if converters is None else converters
+        parameters = list(inspect.signature(callback).parameters.values())
+        if takes_context:
+            parameters = parameters[1:]
+
+        # (converter, is the converter a coroutine, default)
+        self.positional: t.List[t.Tuple[t.Callable[..., t.Any], bool, t.Any]] = []
+        self.names: t.List[str] = []
+        self.required = 0
+        self.rest: t.Optional[t.Tuple[t.Callable[..., t.Any], bool]] = None
+        self.rest_joined = False
+        self.rest_name: t.Optional[str] = None
+        self.rest_required = False
+
+        for parameter in parameters:
+            converter = self._converter_for(parameter.annotation)
+            is_coroutine = inspect.iscoroutinefunction(converter)
+
+            if parameter.kind in (
+                parameter.POSITIONAL_ONLY,
+                parameter.POSITIONAL_OR_KEYWORD,
+            ):
+                default = (
+                    None if parameter.default is parameter.empty else parameter.default
+                )
+                self.positional.append((converter, is_coroutine, default))
+                self.names.append(parameter.name)
+
+                if parameter.default is parameter.empty:
+                    self.required = len(self.positional)
+
+            elif parameter.kind == parameter.VAR_POSITIONAL and self.rest is None:
+                self.rest = (converter, is_coroutine)
+                self.rest_name = parameter.name
+
+            elif parameter.kind == parameter.KEYWORD_ONLY and self.rest is None:
+                self.rest = (converter, is_coroutine)
+                self.rest_joined = True
+                self.rest_name = parameter.name
+                self.rest_required = parameter.default is parameter.empty
+
+    def words_from_options(self, options: t.Mapping[str, t.Any]) -> t.List[str]:
+        """Lays out named values, e.g. the options of a slash command, as the words of a message
+
+        The values are taken by parameter name, up to the first one missing, and the
+        value for the rest of the words is split on whitespace.
+        """
+
+        words: t.List[str] = []
+        for name in self.names:
+            if name not in options:
+                return words
+
+            words.append(str(options[name]))
+
+        if self.rest_name is not None and self.rest_name in options:
+            words.extend(str(options[self.rest_name]).split())
+
+        return words
+
+    def _converter_for(self, annotation: t.Any) -> t.Callable[..., t.Any]:
+        return self.converters.get(_unwrap_optional(annotation), _to_str)
+
+    async def convert(
+        self, bot, given_arguments: t.List[str]
+    ) -> t.Tuple[t.List[t.Any], t.Dict[str, t.Any]]:
+        """Converts the words given to a command into the arguments for its callback
+
+        Args:
+            bot (Bot): The bot the command was run on
+            given_arguments (t.List[str]): The words given after the name of the command
+
+        Raises:
+            errors.TooManyArguments: More words were given than the command takes
+            errors.NotEnoughArguments: Fewer words were given than the command requires
+
+        Returns:
+            t.Tuple[t.List[t.Any], t.Dict[str, t.Any]]: The positional and keyword arguments
+        """
+
+        positional_count = len(self.positional)
+
+        if len(given_arguments) > positional_count and self.rest is None:
+            raise errors.TooManyArguments("Too many arguments were passed")
+        elif len(given_arguments) < self.required or (
+            self.rest_required and len(given_arguments) <= positional_count
+        ):
+            raise errors.NotEnoughArguments("Not enough arguments were passed")
+
+        # Values are filled in place, and coroutines are gathered at the end
+        args: t.List[t.Any] = []
+        kwargs: t.Dict[str, t.Any] = {}
+        pending: t.Dict[t.Tuple[t.Any, str], t.List[t.Tuple[t.Any, t.Any]]] = {}
+
+        def convert(converter, is_coroutine, argument, target, key) -> None:
+            if not is_coroutine:
+                target[key] = converter(bot, argument)
+            else:
+                pending.setdefault((converter, argument), []).append((target, key))
+
+        for index, (converter, is_coroutine, default) in enumerate(self.positional):
+            args.append(default)
+            if index < len(given_arguments):
+                convert(converter, is_coroutine, given_arguments[index], args, index)
+
+        if self.rest is not None:
+            converter, is_coroutine = self.rest
+            rest = given_arguments[positional_count:]
+
+            if self.rest_joined:
+                if rest:
+                    convert(
+                        converter, is_coroutine, " ".join(rest), kwargs, self.rest_name
+                    )
+            else:
+                for argument in rest:
+                    args.append(None)
+                    convert(converter, is_coroutine, argument, args, len(args) - 1)
+
+        if pending:
+            if len(pending) == 1:
+                ((converter, argument),) = pending
+                values = [await converter(bot, argument)]
+            else:
+                values = await asyncio.gather(
+                    *(converter(bot, argument) for converter, argument in pending)
+                )
+
+            for targets, value in zip(pending.values(), values):
+                for target, key in targets:
+                    target[key] = value
+
+        return args, kwargs  # type: ignore
+
 
 class BotCommand:
+    """A command of the bot.
+
+    With the ``loop`` execution the callback is a coroutine run on the event loop
+    with the context and the arguments. With ``thread`` or ``process`` it is a plain
+    function run on a pool of the bot with only the arguments, and what it returns
+    is sent to the channel of the command, unless it is None. Functions run in a
+    process must be defined at the top level of a module and take and return values
+    that can be pickled.
+
+    Args:
+        execution (str): Where the callback runs, one of ``loop``, ``thread`` or ``process``. Defaults to ``loop``.
+        cooldown (t.Optional[Cooldown]): How often the command can be used. Defaults to None.
+        max_concurrency (t.Optional[MaxConcurrency]): How many invocations can run at once. Defaults to None.
+    """
+
     def __init__(
         self,
         bot,
@@ -11,7 +287,10 @@ class BotCommand:
         aliases: t.Optional[t.List[str]] = None,
         description: t.Optional[str] = None,
         *,
-        callback: t.Coroutine
+        callback: t.Coroutine,
+        execution: str = LOOP,
+        cooldown: t.Optional[Cooldown] = None,
+        max_concurrency: t.Optional[MaxConcurrency] = None,
     ):
 
         # if not asyncio.iscoroutine(callback):
@@ -20,10 +299,18 @@ class BotCommand:
         if not isinstance(name, str):
             raise TypeError("Name of a command must be a string.")
 
+        if execution not in EXECUTION_MODES:
+            raise ValueError(f"execution must be one of {', '.join(EXECUTION_MODES)}")
+
         self.bot = bot
         self.name = name
         self.aliases = aliases or []
         self._callback = callback
+        self.execution = execution
+        self.limits: t.Optional[CommandLimits] = None
+        if cooldown is not None or max_concurrency is not None:
+            self.limits = CommandLimits(cooldown, max_concurrency)
+        self.build_plan(getattr(bot, "converters", None))
 
         if description:
             self.description = description
@@ -32,9 +319,39 @@ class BotCommand:
             if isinstance(self.description, bytes):
                 self.description = self.description.decode("utf-8")
 
+    def build_plan(
+        self, converters: t.Optional[t.Mapping[t.Any, t.Callable[..., t.Any]]]
+    ) -> None:
+        """Works out how to convert the arguments, with the converters given"""
+
+        self.plan = ArgumentPlan(
+            self._callback, converters, takes_context=self.execution == LOOP  # type: ignore
+        )
+
     @property
     def callback(self):
         return self._callback
 
-    async def call_command(self, context, *args):
-        await self._callback(context, *args)
+    async def call_command(self, context, *args, **kwargs):
+        if self.execution == LOOP:
+            coroutine = self._callback(context, *args, **kwargs)
+
+            threshold = getattr(self.bot, "loop_block_threshold", None)
+            if threshold is None:
+                await coroutine
+            else:
+                await watch_blocking(
+                    coroutine,
+                    threshold,
+                    lambda seconds: self.bot._loop_blocked(self, seconds),
+                )
+            return
+
+        result = await self.bot.pools[self.execution].run(
+            self._callback, *args, **kwargs
+        )
+
+        if isinstance(result, Embed):
+            await context.send(None, embeds=[result])
+        elif result is not None:
+            await context.send(str(result))
@@ -10,4 +10,4 @@ class Context:
         self.channel = message.channel
 
     async def send(self, *args, **kwargs):
-        await self.message.channel.send(*args, **kwargs)
+        return await self.message.channel.send(*args, **kwargs)
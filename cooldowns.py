@@ -0,0 +1,254 @@
+import asyncio
+import collections
+import time
+import typing as t
+
+from . import errors
+
+# What a limit is counted per
+USER = "user"
+CHANNEL = "channel"
+GUILD = "guild"
+BUCKETS = (USER, CHANNEL, GUILD)
+
+
+def _key(
+    bucket: str, user_id: int, channel_id: t.Optional[int], guild_id: t.Optional[int]
+) -> t.Optional[int]:
+    if bucket == USER:
+        return user_id
+    if bucket == CHANNEL or guild_id is None:
+        # Direct messages have no guild, so their channel stands in for it
+        return channel_id
+
+    return guild_id
+
+
+class Cooldown:
+    """Allows a command ``rate`` times every ``per`` seconds, per user, channel or guild.
+
+    Every key has a token bucket that holds ``rate`` tokens and refills at
+    ``rate / per`` tokens a second, so uses are allowed in bursts of up to ``rate``.
+    The keys are kept in the order they were last used, and a key idle for ``per``
+    seconds has a full bucket again, so :meth:`sweep` forgets it without looking
+    at any key that is still in use.
+
+    Args:
+        rate (int): Uses allowed in a burst
+        per (float): Seconds for an empty bucket to fill up again
+        bucket (str): What the uses are counted per, ``user``, ``channel`` or ``guild``. Defaults to ``user``.
+    """
+
+    def __init__(self, rate: int, per: float, *, bucket: str = USER) -> None:
+        if bucket not in BUCKETS:
+            raise ValueError(f"bucket must be one of {', '.join(BUCKETS)}")
+        if rate < 1 or per <= 0:
+            raise ValueError("rate must be at least 1 and per more than 0")
+
+        self.rate = rate
+        self.per = per
+        self.bucket = bucket
+
+        # [tokens left, when they were counted] by key, least recently used first
+        self._keys: "collections.OrderedDict[t.Any, t.List[float]]" = (
+            collections.OrderedDict()
+        )
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def consume(self, key: t.Any, now: t.Optional[float] = None) -> float:
+        """Takes a token for a key
+
+        Returns:
+            float: 0 if a token was taken, otherwise the seconds until there is one
+        """
+
+        if now is None:
+            now = time.monotonic()
+
+        state = self._keys.get(key)
+        if state is None:
+            self._keys[key] = [self.rate - 1.0, now]
+            return 0.0
+
+        self._keys.move_to_end(key)
+        tokens = min(self.rate, state[0] + (now - state[1]) * self.rate / self.per)
+        state[1] = now
+
+        if tokens < 1:
+            state[0] = tokens
+            return (1 - tokens) * self.per / self.rate
+
+        state[0] = tokens - 1
+        return 0.0
+
+    def sweep(self, now: t.Optional[float] = None) -> int:
+        """Forgets the keys idle long enough to have a full bucket again
+
+        Returns:
+            int: The number of keys forgotten
+        """
+
+        if now is None:
+            now = time.monotonic()
+
+        keys = self._keys
+        cutoff = now - self.per
+        evicted = 0
+        while keys:
+            key, state = next(iter(keys.items()))
+            if state[1] > cutoff:
+                break
+
+            del keys[key]
+            evicted += 1
+
+        if evicted and not keys:
+            # Dicts do not shrink as keys are removed, so the table of a burst is freed
+            self._keys = collections.OrderedDict()
+
+        return evicted
+
+
+class MaxConcurrency:
+    """Allows ``number`` invocations of a command to run at once, per user, channel or guild
+
+    Keys are only kept while an invocation of theirs is running.
+
+    Args:
+        number (int): Invocations that can run at once
+        bucket (str): What the invocations are counted per, ``user``, ``channel`` or ``guild``. Defaults to ``user``.
+    """
+
+    def __init__(self, number: int, *, bucket: str = USER) -> None:
+        if bucket not in BUCKETS:
+            raise ValueError(f"bucket must be one of {', '.join(BUCKETS)}")
+        if number < 1:
+            raise ValueError("number must be at least 1")
+
+        self.number = number
+        self.bucket = bucket
+        self._running: t.Dict[t.Any, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._running)
+
+    def full(self, key: t.Any) -> bool:
+        return self._running.get(key, 0) >= self.number
+
+    def acquire(self, key: t.Any) -> None:
+        self._running[key] = self._running.get(key, 0) + 1
+
+    def release(self, key: t.Any) -> None:
+        running = self._running.get(key, 0) - 1
+        if running > 0:
+            self._running[key] = running
+        else:
+            self._running.pop(key, None)
+
+
+class CommandLimits:
+    """The cooldown and concurrency limit of a command, checked before it runs
+
+    Args:
+        cooldown (t.Optional[Cooldown]): Defaults to None.
+        max_concurrency (t.Optional[MaxConcurrency]): Defaults to None.
+    """
+
+    def __init__(
+        self,
+        cooldown: t.Optional[Cooldown] = None,
+        max_concurrency: t.Optional[MaxConcurrency] = None,
+    ) -> None:
+        self.cooldown = cooldown
+        self.max_concurrency = max_concurrency
+
+    def acquire(
+        self, user_id: int, channel_id: t.Optional[int], guild_id: t.Optional[int]
+    ) -> t.Any:
+        """Counts an invocation against the limits, or raises if it is over one
+
+        Args:
+            user_id (int): The id of the user that invoked the command
+            channel_id (t.Optional[int]): The id of the channel it was invoked in
+            guild_id (t.Optional[int]): The id of the guild it was invoked in, None in direct messages
+
+        Raises:
+            errors.MaxConcurrencyReached: Too many invocations of the key are running
+            errors.CommandOnCooldown: The key has used the command too often
+
+        Returns:
+            t.Any: The key to :meth:`release` once the invocation has finished
+        """
+
+        concurrency = self.max_concurrency
+        key = None
+        if concurrency is not None:
+            key = _key(concurrency.bucket, user_id, channel_id, guild_id)
+            if concurrency.full(key):
+                raise errors.MaxConcurrencyReached(
+                    f"This command can only run {concurrency.number} times at once per {concurrency.bucket}",
+                    number=concurrency.number,
+                    bucket=concurrency.bucket,
+                )
+
+        cooldown = self.cooldown
+        if cooldown is not None:
+            retry_after = cooldown.consume(
+                _key(cooldown.bucket, user_id, channel_id, guild_id)
+            )
+            if retry_after:
+                raise errors.CommandOnCooldown(
+                    f"This command is on cooldown, try again in {retry_after:.2f}s",
+                    retry_after=retry_after,
+                    bucket=cooldown.bucket,
+                )
+
+        if concurrency is not None:
+            concurrency.acquire(key)
+
+        return key
+
+    def release(self, key: t.Any) -> None:
+        if self.max_concurrency is not None:
+            self.max_concurrency.release(key)
+
+
+class CooldownSweeper:
+    """Forgets the idle keys of the cooldowns of every command, on a timer
+
+    Args:
+        bot (Bot): The bot whose commands are swept
+        interval (float): Seconds between sweeps. Defaults to 60.
+    """
+
+    def __init__(self, bot, *, interval: float = 60.0) -> None:
+        self.bot = bot
+        self.interval = interval
+        self.evicted = 0
+        self._task: t.Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def sweep(self) -> int:
+        now = time.monotonic()
+        evicted = 0
+        for command in self.bot.commands:
+            if command.limits is not None and command.limits.cooldown is not None:
+                evicted += command.limits.cooldown.sweep(now)
+
+        self.evicted += evicted
+        return evicted
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            self.sweep()
@@ -0,0 +1,209 @@
+import asyncio
+import itertools
+import time
+import traceback
+import typing as t
+
+BLOCK = "block"
+DROP_OLDEST = "drop_oldest"
+DROP = "drop"
+
+OVERFLOW_POLICIES = (BLOCK, DROP_OLDEST, DROP)
+
+Handler = t.Callable[[t.Dict[str, t.Any]], t.Awaitable[None]]
+ErrorHandler = t.Callable[[str, Exception], t.Awaitable[None]]
+
+
+class DispatchMetrics:
+    """Live counters for the event dispatcher"""
+
+    def __init__(self) -> None:
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+
+        # event name -> [count, total seconds, max seconds]
+        self.handler_latency: t.Dict[str, t.List[float]] = {}
+
+    def record(self, event: str, elapsed: float) -> None:
+        stats = self.handler_latency.get(event)
+        if stats is None:
+            stats = self.handler_latency[event] = [0, 0.0, 0.0]
+
+        stats[0] += 1
+        stats[1] += elapsed
+        if elapsed > stats[2]:
+            stats[2] = elapsed
+
+        self.processed += 1
+
+
+class EventDispatcher:
+    """Runs the handlers for gateway events on a fixed pool of workers.
+
+    Every worker has its own bounded queue. When ordering is enabled, every event
+    of the same channel or guild goes to the same worker, so they are handled in the
+    order they were received. Events without a channel or guild are spread over the
+    workers in turn.
+
+    Args:
+        workers (int): The number of workers handling events. Defaults to 16.
+        max_queue_size (int): Max number of events waiting across all workers. Defaults to 10000.
+        overflow (str): What to do with a new event when a queue is full. ``"block"`` waits for space, ``"drop_oldest"`` drops the oldest waiting event and ``"drop"`` drops the new event if its type is in ``droppable_events``, waiting otherwise. Defaults to ``"block"``.
+        droppable_events (t.Optional[t.Iterable[str]]): The event types the ``"drop"`` policy may drop. Defaults to None.
+        ordering (t.Optional[str]): ``"channel"`` or ``"guild"`` to keep the events of one channel or guild in order, None to not keep any order. Defaults to ``"channel"``.
+        on_error (t.Optional[ErrorHandler]): Coroutine called with the event name and exception when a handler raises, the traceback is printed if None. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        *,
+        workers: int = 16,
+        max_queue_size: int = 10000,
+        overflow: str = BLOCK,
+        droppable_events: t.Optional[t.Iterable[str]] = None,
+        ordering: t.Optional[str] = "channel",
+        on_error: t.Optional[ErrorHandler] = None,
+    ) -> None:
+
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {', '.join(OVERFLOW_POLICIES)}")
+
+        if ordering not in (None, "channel", "guild"):
+            raise ValueError('ordering must be "channel", "guild" or None')
+
+        self.worker_count = workers
+        self.max_queue_size = max_queue_size
+        self.overflow = overflow
+        self.droppable_events = frozenset(droppable_events or ())
+        self.ordering_key = None if ordering is None else f"{ordering}_id"
+
+        self.on_error = on_error or self._print_error
+        self.metrics = DispatchMetrics()
+
+        self._handlers: t.Dict[str, t.List[Handler]] = {}
+        self._queues: t.List[asyncio.Queue] = []
+        self._workers: t.List[asyncio.Task] = []
+        self._next_worker = itertools.cycle(range(workers))
+
+    def add_handler(self, event: str, handler: Handler) -> None:
+        """Registers a coroutine to be called with the data of every ``event``
+
+        Args:
+            event (str): The name of the event, e.g. ``MESSAGE_CREATE``
+            handler (Handler): The coroutine to call with the ``d`` field of the event
+        """
+
+        self._handlers.setdefault(event, []).append(handler)
+
+    def remove_handler(self, event: str, handler: Handler) -> None:
+        handlers = self._handlers.get(event, [])
+        if handler in handlers:
+            handlers.remove(handler)
+
+    def has_handlers(self, event: str) -> bool:
+        return bool(self._handlers.get(event))
+
+    @property
+    def events(self) -> t.Set[str]:
+        """The events with at least one handler"""
+
+        return {event for event, handlers in self._handlers.items() if handlers}
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(queue.qsize() for queue in self._queues)
+
+    def start(self) -> None:
+        """Starts the workers, this needs to be called inside the running event loop"""
+
+        if self._workers:
+            return
+
+        size = max(1, self.max_queue_size // self.worker_count)
+        self._queues = [asyncio.Queue(size) for _ in range(self.worker_count)]
+        self._workers = [
+            asyncio.ensure_future(self._worker(queue)) for queue in self._queues
+        ]
+
+    async def dispatch(self, event_data: t.Dict[str, t.Any]) -> None:
+        """Queues a dispatch event for its handlers
+
+        Waits when the queue is full and the overflow policy is to block, which holds
+        back the events the gateway has not handed over yet, while the gateway keeps
+        reading its heartbeat ACKs.
+
+        Args:
+            event_data (t.Dict[str, t.Any]): The full payload of the event
+        """
+
+        event = event_data["t"]
+        if not self._handlers.get(event):
+            return
+
+        if not self._workers:
+            self.start()
+
+        self.metrics.received += 1
+        queue = self._queues[self._pick_worker(event_data["d"])]
+
+        if not queue.full():
+            queue.put_nowait(event_data)
+            return
+
+        if self.overflow == DROP_OLDEST:
+            queue.get_nowait()
+            queue.task_done()
+            self.metrics.dropped += 1
+            queue.put_nowait(event_data)
+        elif self.overflow == DROP and event in self.droppable_events:
+            self.metrics.dropped += 1
+        else:
+            await queue.put(event_data)
+
+    def _pick_worker(self, data: t.Any) -> int:
+        if self.ordering_key is not None and isinstance(data, dict):
+            key = data.get(self.ordering_key)
+            if key is not None:
+                return hash(key) % self.worker_count
+
+        return next(self._next_worker)
+
+    async def _worker(self, queue: asyncio.Queue) -> None:
+        metrics = self.metrics
+
+        while True:
+            event_data = await queue.get()
+            event = event_data["t"]
+            start = time.perf_counter()
+
+            try:
+                for handler in self._handlers.get(event, ()):
+                    try:
+                        await handler(event_data["d"])
+                    except Exception as exc:
+                        await self.on_error(event, exc)
+            finally:
+                metrics.record(event, time.perf_counter() - start)
+                queue.task_done()
+
+    @staticmethod
+    async def _print_error(event: str, exc: Exception) -> None:
+        traceback.print_exception(type(exc), exc, exc.__traceback__)
+
+    async def join(self) -> None:
+        """Waits until every queued event has been handled"""
+
+        for queue in self._queues:
+            await queue.join()
+
+    async def close(self) -> None:
+        """Stops the workers, dropping any events still queued"""
+
+        for worker in self._workers:
+            worker.cancel()
+
+        await asyncio.gather(*self._workers, return_exceptions=True)
+
+        self._workers = []
+        self._queues = []
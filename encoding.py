@@ -0,0 +1,123 @@
+import json
+import re
+import typing as t
+import zlib
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+ZLIB_SUFFIX = b"\x00\x00\xff\xff"
+
+# The fields of a gateway payload before "d", in the order discord sends them
+_HEAD = (
+    r'\{ ?"t": ?(?:null|"([A-Z0-9_]+)"), ?"s": ?(?:null|(\d+)), ?"op": ?(\d+), ?"d":'
+)
+_HEAD_STR = re.compile(_HEAD)
+_HEAD_BYTES = re.compile(_HEAD.encode())
+
+
+def peek(
+    data: t.Union[str, bytes],
+) -> t.Optional[t.Tuple[int, t.Optional[str], t.Optional[int]]]:
+    """Reads ``t``, ``s`` and ``op`` of a gateway payload without parsing it
+
+    Discord sends these fields first, in that order, so they are matched at the
+    start of the payload, and an event can be skipped without decoding the rest.
+    Payloads in any other layout are not matched, and have to be decoded.
+
+    Args:
+        data (t.Union[str, bytes]): The JSON text of the payload
+
+    Returns:
+        t.Optional[t.Tuple[int, t.Optional[str], t.Optional[int]]]: The op, event name and sequence, or None if the payload does not start with them
+    """
+
+    match = (_HEAD_STR if isinstance(data, str) else _HEAD_BYTES).match(data)
+    if match is None:
+        return None
+
+    event, sequence, op = match.groups()
+    if isinstance(event, bytes):
+        event = event.decode()
+
+    return int(op), event, None if sequence is None else int(sequence)
+
+
+class Decoder:
+    """Turns a raw payload from discord into python objects.
+
+    Subclass this and override :meth:`loads` to use a different parser for both the
+    gateway and the http client.
+    """
+
+    def loads(self, data: t.Union[str, bytes]) -> t.Any:
+        raise NotImplementedError
+
+
+class JSONDecoder(Decoder):
+    """Decoder using the standard library ``json`` module"""
+
+    def loads(self, data: t.Union[str, bytes]) -> t.Any:
+        return json.loads(data)
+
+
+class OrjsonDecoder(Decoder):
+    """Decoder using ``orjson``, which needs to be installed separately"""
+
+    def __init__(self) -> None:
+        if orjson is None:
+            raise RuntimeError("orjson needs to be installed to use the OrjsonDecoder")
+
+    def loads(self, data: t.Union[str, bytes]) -> t.Any:
+        return orjson.loads(data)
+
+
+def default_decoder() -> Decoder:
+    """The fastest decoder available, ``orjson`` if it is installed or ``json`` if not"""
+
+    if orjson is not None:
+        return OrjsonDecoder()
+
+    return JSONDecoder()
+
+
+class ZlibStreamInflater:
+    """Inflates the frames of a ``compress=zlib-stream`` gateway connection.
+
+    The whole connection shares one zlib context, and a message can be split over
+    several frames, so frames are buffered until one ends with the ``Z_SYNC_FLUSH``
+    suffix. One inflater must be used per connection, and reset on reconnect.
+    """
+
+    def __init__(self) -> None:
+        self._inflator = zlib.decompressobj()
+        self._buffer = bytearray()
+
+    def reset(self) -> None:
+        self._inflator = zlib.decompressobj()
+        self._buffer.clear()
+
+    def feed(self, frame: bytes) -> t.Optional[bytes]:
+        """Adds a frame to the stream
+
+        Args:
+            frame (bytes): The binary frame received from the gateway
+
+        Returns:
+            t.Optional[bytes]: The inflated message, or None if the message is not complete yet
+        """
+
+        if not self._buffer and frame[-4:] == ZLIB_SUFFIX:
+            # The usual case of a message in a single frame skips the buffer
+            return self._inflator.decompress(frame)
+
+        self._buffer += frame
+        if self._buffer[-4:] != ZLIB_SUFFIX:
+            return None
+
+        data = self._inflator.decompress(self._buffer)
+        self._buffer.clear()
+        return data
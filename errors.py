@@ -2,6 +2,16 @@ class BaseError(Exception):
     pass
 
 
+class HTTPException(BaseError):
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(f"{status}: {message}")
+        self.status = status
+
+
+class GatewayError(BaseError):
+    pass
+
+
 class CommandError(BaseError):
     pass
 
@@ -14,4 +24,33 @@ class NotEnoughArguments(CommandError):
     pass
 
 
-__all__ = ["CommandError", "TooManyArguments", "NotEnoughArguments"]
+class CommandLimited(CommandError):
+    """A command was not run, as it is over one of its limits"""
+
+    def __init__(self, message: str, *, bucket: str) -> None:
+        super().__init__(message)
+        self.bucket = bucket
+
+
+class CommandOnCooldown(CommandLimited):
+    def __init__(self, message: str, *, retry_after: float, bucket: str) -> None:
+        super().__init__(message, bucket=bucket)
+        self.retry_after = retry_after
+
+
+class MaxConcurrencyReached(CommandLimited):
+    def __init__(self, message: str, *, number: int, bucket: str) -> None:
+        super().__init__(message, bucket=bucket)
+        self.number = number
+
+
+__all__ = [
+    "HTTPException",
+    "GatewayError",
+    "CommandError",
+    "TooManyArguments",
+    "NotEnoughArguments",
+    "CommandLimited",
+    "CommandOnCooldown",
+    "MaxConcurrencyReached",
+]
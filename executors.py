@@ -0,0 +1,136 @@
+import asyncio
+import concurrent.futures
+import time
+import types
+import typing as t
+
+# Where the callback of a command runs
+LOOP = "loop"
+THREAD = "thread"
+PROCESS = "process"
+EXECUTION_MODES = (LOOP, THREAD, PROCESS)
+
+
+def _run_timed(func, args, kwargs) -> t.Tuple[float, t.Any]:
+    # Top level, so process pools can pickle it
+    started = time.time()
+    return started, func(*args, **kwargs)
+
+
+class CommandPool:
+    """An executor for the callbacks of commands, created when it is first used.
+
+    Counts the callbacks waiting for or running on a worker, and records how long
+    they waited for one, in the metrics of the bot.
+
+    Args:
+        name (str): The name of the pool in the metrics, ``thread`` or ``process``
+        factory (t.Callable[[], concurrent.futures.Executor]): Creates the executor
+        metrics (t.Optional[BotMetrics]): The registry the pool is recorded in. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        factory: t.Callable[[], concurrent.futures.Executor],
+        metrics=None,
+    ) -> None:
+        self.name = name
+        self.factory = factory
+        self.executor: t.Optional[concurrent.futures.Executor] = None
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+
+        self._pending = self._wait = None
+        if metrics is not None:
+            self._pending = metrics.pool_pending.labels(name)
+            self._wait = metrics.pool_wait.labels(name)
+
+    @property
+    def pending(self) -> int:
+        """Callbacks submitted that have not finished"""
+
+        return self.submitted - self.completed - self.failed
+
+    async def run(self, func: t.Callable[..., t.Any], *args, **kwargs) -> t.Any:
+        """Runs ``func`` on a worker of the pool, and waits for what it returns"""
+
+        if self.executor is None:
+            self.executor = self.factory()
+
+        self.submitted += 1
+        submitted = time.time()
+        if self._pending is not None:
+            self._pending.inc()
+
+        future = asyncio.get_running_loop().run_in_executor(
+            self.executor, _run_timed, func, args, kwargs
+        )
+
+        try:
+            started, result = await future
+        except BaseException:
+            self.failed += 1
+            if self._pending is not None:
+                self._pending.dec()
+            raise
+
+        self.completed += 1
+        if self._pending is not None:
+            self._pending.dec()
+            self._wait.observe(max(0.0, started - submitted))  # type: ignore
+
+        return result
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait)
+            self.executor = None
+
+
+@types.coroutine
+def watch_blocking(
+    coroutine: t.Coroutine,
+    threshold: float,
+    report: t.Callable[[float], None],
+) -> t.Generator[t.Any, t.Any, t.Any]:
+    """Drives a coroutine like a task would, timing every step it runs on the loop.
+
+    A step is the code between two awaits that suspend, which holds the event loop
+    for as long as it runs. ``report`` is called with the duration of every step
+    longer than ``threshold``.
+
+    Args:
+        coroutine (t.Coroutine): The coroutine to run
+        threshold (float): Seconds a step may hold the loop without being reported
+        report (t.Callable[[float], None]): Called with the duration of a slow step
+    """
+
+    value: t.Any = None
+    error: t.Optional[BaseException] = None
+
+    while True:
+        start = time.perf_counter()
+        try:
+            if error is None:
+                yielded = coroutine.send(value)
+            else:
+                yielded = coroutine.throw(error)
+        except StopIteration as stop:
+            return stop.value
+        finally:
+            elapsed = time.perf_counter() - start
+            if elapsed > threshold:
+                report(elapsed)
+
+        try:
+            value = yield yielded
+            error = None
+        except GeneratorExit:
+            coroutine.close()
+            raise
+        except BaseException as exc:
+            value = None
+            error = exc
@@ -0,0 +1,634 @@
+import asyncio
+import itertools
+import json
+import random
+import time
+import typing as t
+
+import websockets
+
+from . import dispatch, errors
+from .encoding import Decoder, ZlibStreamInflater, default_decoder, peek
+from .user import User
+
+GATEWAY_URL = "wss://gateway.discord.gg"
+GATEWAY_QUERY = "?v=9&encoding=json"
+
+DISPATCH = 0
+HEARTBEAT = 1
+IDENTIFY = 2
+RESUME = 6
+RECONNECT = 7
+REQUEST_GUILD_MEMBERS = 8
+INVALID_SESSION = 9
+HELLO = 10
+HEARTBEAT_ACK = 11
+
+# Gateway intents, the groups of events discord sends to a connection
+GUILDS = 1 << 0
+GUILD_MEMBERS = 1 << 1
+GUILD_BANS = 1 << 2
+GUILD_EMOJIS_AND_STICKERS = 1 << 3
+GUILD_INTEGRATIONS = 1 << 4
+GUILD_WEBHOOKS = 1 << 5
+GUILD_INVITES = 1 << 6
+GUILD_VOICE_STATES = 1 << 7
+GUILD_PRESENCES = 1 << 8
+GUILD_MESSAGES = 1 << 9
+GUILD_MESSAGE_REACTIONS = 1 << 10
+GUILD_MESSAGE_TYPING = 1 << 11
+DIRECT_MESSAGES = 1 << 12
+DIRECT_MESSAGE_REACTIONS = 1 << 13
+DIRECT_MESSAGE_TYPING = 1 << 14
+MESSAGE_CONTENT = 1 << 15
+
+# Intents that have to be enabled for the bot in the developer portal, which are
+# never derived from the listeners and have to be asked for with ``intents``
+PRIVILEGED_INTENTS = GUILD_MEMBERS | GUILD_PRESENCES | MESSAGE_CONTENT
+
+# The intent every dispatch event needs, events missing from here need none
+EVENT_INTENTS = {
+    "GUILD_CREATE": GUILDS,
+    "GUILD_UPDATE": GUILDS,
+    "GUILD_DELETE": GUILDS,
+    "GUILD_ROLE_CREATE": GUILDS,
+    "GUILD_ROLE_UPDATE": GUILDS,
+    "GUILD_ROLE_DELETE": GUILDS,
+    "CHANNEL_CREATE": GUILDS,
+    "CHANNEL_UPDATE": GUILDS,
+    "CHANNEL_DELETE": GUILDS,
+    "CHANNEL_PINS_UPDATE": GUILDS,
+    "THREAD_CREATE": GUILDS,
+    "THREAD_UPDATE": GUILDS,
+    "THREAD_DELETE": GUILDS,
+    "THREAD_LIST_SYNC": GUILDS,
+    "THREAD_MEMBER_UPDATE": GUILDS,
+    "STAGE_INSTANCE_CREATE": GUILDS,
+    "STAGE_INSTANCE_UPDATE": GUILDS,
+    "STAGE_INSTANCE_DELETE": GUILDS,
+    "GUILD_MEMBER_ADD": GUILD_MEMBERS,
+    "GUILD_MEMBER_UPDATE": GUILD_MEMBERS,
+    "GUILD_MEMBER_REMOVE": GUILD_MEMBERS,
+    "THREAD_MEMBERS_UPDATE": GUILD_MEMBERS,
+    "GUILD_BAN_ADD": GUILD_BANS,
+    "GUILD_BAN_REMOVE": GUILD_BANS,
+    "GUILD_EMOJIS_UPDATE": GUILD_EMOJIS_AND_STICKERS,
+    "GUILD_STICKERS_UPDATE": GUILD_EMOJIS_AND_STICKERS,
+    "GUILD_INTEGRATIONS_UPDATE": GUILD_INTEGRATIONS,
+    "INTEGRATION_CREATE": GUILD_INTEGRATIONS,
+    "INTEGRATION_UPDATE": GUILD_INTEGRATIONS,
+    "INTEGRATION_DELETE": GUILD_INTEGRATIONS,
+    "WEBHOOKS_UPDATE": GUILD_WEBHOOKS,
+    "INVITE_CREATE": GUILD_INVITES,
+    "INVITE_DELETE": GUILD_INVITES,
+    "VOICE_STATE_UPDATE": GUILD_VOICE_STATES,
+    "PRESENCE_UPDATE": GUILD_PRESENCES,
+    "MESSAGE_CREATE": GUILD_MESSAGES,
+    "MESSAGE_UPDATE": GUILD_MESSAGES,
+    "MESSAGE_DELETE": GUILD_MESSAGES,
+    "MESSAGE_DELETE_BULK": GUILD_MESSAGES,
+    "MESSAGE_REACTION_ADD": GUILD_MESSAGE_REACTIONS,
+    "MESSAGE_REACTION_REMOVE": GUILD_MESSAGE_REACTIONS,
+    "MESSAGE_REACTION_REMOVE_ALL": GUILD_MESSAGE_REACTIONS,
+    "MESSAGE_REACTION_REMOVE_EMOJI": GUILD_MESSAGE_REACTIONS,
+    "TYPING_START": GUILD_MESSAGE_TYPING,
+}
+
+# Dispatch events the connection itself needs, so they are never skipped
+GATEWAY_EVENTS = frozenset({"READY", "RESUMED", "GUILD_MEMBERS_CHUNK"})
+
+
+def intents_for(events: t.Iterable[str]) -> int:
+    """The intents needed to receive some events, leaving out privileged intents
+
+    The cache needs :data:`GUILDS`, so it is always included.
+
+    Args:
+        events (t.Iterable[str]): The names of the dispatch events
+
+    Returns:
+        int: The intents, as the bit field IDENTIFY takes
+    """
+
+    intents = GUILDS
+    for event in events:
+        intents |= EVENT_INTENTS.get(event, 0)
+
+    return intents & ~PRIVILEGED_INTENTS
+
+
+# Close codes after which reconnecting can never succeed
+FATAL_CLOSE_CODES = {4004, 4010, 4011, 4012, 4013, 4014}
+
+
+class ReconnectWebSocket(Exception):
+    """Raised internally to drop the current connection and open a new one"""
+
+    def __init__(self, resume: bool = True) -> None:
+        self.resume = resume
+
+
+class IdentifyLimiter:
+    """Bounds how often sessions can be identified.
+
+    Discord allows one IDENTIFY per 5 seconds in each of ``max_concurrency``
+    buckets, and a shard uses the bucket ``shard_id % max_concurrency``.
+
+    Args:
+        max_concurrency (int): The ``max_concurrency`` given by ``/gateway/bot``. Defaults to 1.
+    """
+
+    def __init__(self, max_concurrency: int = 1, *, interval: float = 5.0) -> None:
+        self.max_concurrency = max_concurrency
+        self.interval = interval
+
+        self._locks: t.Dict[int, asyncio.Lock] = {}
+        self._last: t.Dict[int, float] = {}
+
+    async def acquire(self, shard_id: int = 0) -> None:
+        """Waits until the shard is allowed to identify
+
+        Args:
+            shard_id (int): The id of the shard that wants to identify. Defaults to 0.
+        """
+
+        key = shard_id % self.max_concurrency
+        lock = self._locks.setdefault(key, asyncio.Lock())
+
+        async with lock:
+            wait = self._last.get(key, 0) + self.interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            self._last[key] = time.monotonic()
+
+
+class Gateway:
+    """A connection to the discord gateway.
+
+    Keeps the session alive with heartbeats, and when the connection drops it
+    resumes the session so no events are missed, only identifying again if discord
+    says the session can not be resumed.
+
+    Args:
+        bot (Bot): The bot the events are dispatched to
+        url (str): The url of the gateway, without a query string. Defaults to ``GATEWAY_URL``.
+        shard_id (t.Optional[int]): The id of this shard, None when not sharding. Defaults to None.
+        shard_count (t.Optional[int]): The total number of shards. Defaults to None.
+        identify_limiter (t.Optional[IdentifyLimiter]): Limiter shared by every connection of the bot. Defaults to None.
+        max_backoff (float): Max number of seconds to wait between reconnect attempts. Defaults to 60.
+        compress (bool): If the connection should use ``zlib-stream`` transport compression. Defaults to False.
+        decoder (t.Optional[Decoder]): Decoder for the payloads, the fastest available if None. Defaults to None.
+        max_pending_events (t.Optional[int]): Max number of events received and not handed to the dispatcher yet, the ``max_queue_size`` of the dispatcher if None. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        bot,
+        *,
+        url: str = GATEWAY_URL,
+        shard_id: t.Optional[int] = None,
+        shard_count: t.Optional[int] = None,
+        identify_limiter: t.Optional[IdentifyLimiter] = None,
+        max_backoff: float = 60.0,
+        compress: bool = False,
+        decoder: t.Optional[Decoder] = None,
+        max_pending_events: t.Optional[int] = None,
+    ) -> None:
+
+        self.bot = bot
+        self.url = url.rstrip("/")
+        self.shard_id = shard_id
+        self.shard_count = shard_count
+        self.identify_limiter = identify_limiter or IdentifyLimiter()
+        self.max_backoff = max_backoff
+        self.compress = compress
+        self.decoder = decoder or default_decoder()
+        self._inflater = ZlibStreamInflater() if compress else None
+
+        self.session_id: t.Optional[str] = None
+        self.sequence: t.Optional[int] = None
+        self.resume_url: t.Optional[str] = None
+
+        self.heartbeat_interval: t.Optional[float] = None
+        self.latency = float("inf")
+
+        self.websocket = None
+        self._last_heartbeat = 0.0
+        self._last_ack = 0.0
+        self._heartbeat_task: t.Optional[asyncio.Task] = None
+        self._attempt = 0
+        self._closed = False
+
+        # Dispatch events read from the socket and waiting for the dispatcher, so
+        # heartbeat ACKs are still read while it pushes back, and the events survive
+        # a reconnect. When it is full the overflow policy of the dispatcher applies,
+        # and blocking stops reading the socket until there is space again.
+        self.max_pending_events = max_pending_events or bot.dispatcher.max_queue_size
+        self._events: t.Optional[asyncio.Queue] = None
+        self._forwarder: t.Optional[asyncio.Task] = None
+        self._paused = False
+        self._reading_since = 0.0
+
+        # Chunks of REQUEST_GUILD_MEMBERS, by the nonce of their request
+        self._member_requests: t.Dict[str, asyncio.Queue] = {}
+        self._nonces = itertools.count()
+
+        # One of connecting, identifying, resuming, connected, disconnected or closed
+        self.status = "disconnected"
+
+    @property
+    def pending_events(self) -> int:
+        """Events received and not handed to the dispatcher yet"""
+
+        return self._events.qsize() if self._events is not None else 0
+
+    @property
+    def can_resume(self) -> bool:
+        return self.session_id is not None and self.sequence is not None
+
+    async def run(self) -> None:
+        """Keeps the connection open until :meth:`close` is called"""
+
+        while not self._closed:
+            try:
+                await self._connect_once()
+            except ReconnectWebSocket as exc:
+                if not exc.resume:
+                    self.session_id = None
+                    self.sequence = None
+                continue
+            except (
+                OSError,
+                asyncio.TimeoutError,
+                websockets.ConnectionClosed,
+                websockets.InvalidHandshake,
+            ) as exc:
+                code = getattr(exc, "code", None)
+                if code in FATAL_CLOSE_CODES:
+                    raise errors.GatewayError(
+                        f"The gateway closed the connection with the code {code}"
+                    ) from exc
+
+            if self._closed:
+                return
+
+            # Exponential backoff with jitter before reconnecting, so a fleet of
+            # bots does not reconnect in lockstep after an outage
+            delay = min(self.max_backoff, 2**self._attempt) * random.uniform(0.5, 1.0)
+            self._attempt += 1
+            await asyncio.sleep(delay)
+
+    async def close(self) -> None:
+        """Stops the connection without reconnecting
+
+        The events already received are still handed to the dispatcher, see :meth:`join`.
+        """
+
+        self._closed = True
+        self.status = "closed"
+        self._stop_heartbeat()
+
+        if self._events is not None and self._events.empty():
+            # Wakes the forwarder up, so it sees the connection is closed
+            self._events.put_nowait(None)
+
+        if self.websocket is not None:
+            await self.websocket.close()
+
+    async def join(self) -> None:
+        """Waits until every event received before :meth:`close` was handed to the dispatcher"""
+
+        if self._forwarder is not None:
+            await self._forwarder
+
+    async def _forward(self, event_data: t.Dict[str, t.Any]) -> None:
+        if self._closed:
+            return
+
+        if self._events is None:
+            self._events = asyncio.Queue(self.max_pending_events)
+            self._forwarder = asyncio.ensure_future(self._forward_events())
+
+        events = self._events
+        if not events.full():
+            events.put_nowait(event_data)
+            return
+
+        dispatcher = self.bot.dispatcher
+        if dispatcher.overflow == dispatch.DROP_OLDEST:
+            events.get_nowait()
+            dispatcher.metrics.dropped += 1
+            events.put_nowait(event_data)
+        elif (
+            dispatcher.overflow == dispatch.DROP
+            and event_data["t"] in dispatcher.droppable_events
+        ):
+            dispatcher.metrics.dropped += 1
+        else:
+            # Stops reading the socket until the dispatcher catches up, which
+            # pushes back on discord. The heartbeats are still sent meanwhile.
+            self._paused = True
+            try:
+                await events.put(event_data)
+            finally:
+                self._paused = False
+                self._reading_since = time.perf_counter()
+
+    async def _forward_events(self) -> None:
+        events: asyncio.Queue = self._events  # type: ignore
+        while True:
+            if self._closed and events.empty() and not self._paused:
+                # Every event received before close was handed over
+                return
+
+            event_data = await events.get()
+            if event_data is None:
+                continue
+
+            try:
+                # Waiting here pushes back when the dispatcher is full, without
+                # holding up the receive loop
+                await self.bot.handle_events(event_data)
+            except Exception as exc:
+                await self.bot.on_error(event_data["t"], exc)
+
+    async def _connect_once(self) -> None:
+        self.status = "connecting"
+
+        if not self.can_resume:
+            # Waiting for the identify bucket before connecting, so heartbeat ACKs
+            # are never left unread while the connection is waiting to identify
+            await self.identify_limiter.acquire(self.shard_id or 0)
+        url = self.resume_url if self.can_resume and self.resume_url else self.url
+
+        headers = {
+            "Authorization": f"Bot {self.bot.token}",
+            "bot": "True",
+            "Content-type": "application/json",
+        }
+
+        query = GATEWAY_QUERY
+        if self._inflater is not None:
+            query += "&compress=zlib-stream"
+            self._inflater.reset()
+
+        # Discord's heartbeats tell a dead connection apart, and the keepalive pings
+        # of websockets would go unanswered while reading is paused
+        async with websockets.connect(  # type: ignore
+            uri=f"{url}/{query}",
+            extra_headers=headers,
+            max_size=None,
+            ping_interval=None,
+        ) as websocket:
+            self.websocket = websocket
+
+            try:
+                hello = None
+                while hello is None:
+                    hello = self.decode(await websocket.recv())
+
+                if hello["op"] != HELLO:
+                    raise ReconnectWebSocket()
+
+                self.heartbeat_interval = hello["d"]["heartbeat_interval"] / 1000
+                self._last_ack = time.perf_counter()
+                self._heartbeat_task = asyncio.ensure_future(self._heartbeat())
+
+                if self.can_resume:
+                    self.status = "resuming"
+                    await self.resume()
+                else:
+                    self.status = "identifying"
+                    await self.identify()
+
+                async for data in websocket:
+                    await self.received(data)
+            finally:
+                self._stop_heartbeat()
+                self.websocket = None
+                self.status = "closed" if self._closed else "disconnected"
+
+                # Closing with 1000 would invalidate the session, so any other close
+                # uses a code that keeps it resumable
+                if not self._closed and not websocket.closed:
+                    await websocket.close(code=4000)
+
+    def _stop_heartbeat(self) -> None:
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+
+    async def _heartbeat(self) -> None:
+        interval = self.heartbeat_interval
+
+        # Discord asks for the first heartbeat after a random fraction of the interval
+        await asyncio.sleep(interval * random.random())  # type: ignore
+
+        while True:
+            if (
+                self._last_ack < self._last_heartbeat
+                and not self._paused
+                and self._reading_since < self._last_heartbeat
+            ):
+                # The last heartbeat was never acknowledged, though the socket was
+                # read all along, so the connection is a zombie. Closing it with a
+                # non 1000 code keeps the session resumable.
+                self.status = "disconnected"
+                await self.websocket.close(code=4000)  # type: ignore
+                return
+
+            await self.send_heartbeat()
+            await asyncio.sleep(interval)  # type: ignore
+
+    async def send(self, payload: t.Dict[str, t.Any]) -> None:
+        await self.websocket.send(json.dumps(payload))  # type: ignore
+
+    async def send_heartbeat(self) -> None:
+        self._last_heartbeat = time.perf_counter()
+        await self.send({"op": HEARTBEAT, "d": self.sequence})
+
+    async def identify(self) -> None:
+        payload: t.Dict[str, t.Any] = {
+            "op": IDENTIFY,
+            "d": {
+                "token": self.bot.token,
+                "intents": self.bot.intents,
+                "properties": {
+                    "$os": "linux",
+                    "$browser": "books_discord_py",
+                    "$device": "books_discord_py",
+                },
+            },
+        }
+
+        if self.shard_id is not None:
+            payload["d"]["shard"] = [self.shard_id, self.shard_count]
+
+        await self.send(payload)
+
+    async def resume(self) -> None:
+        await self.send(
+            {
+                "op": RESUME,
+                "d": {
+                    "token": self.bot.token,
+                    "session_id": self.session_id,
+                    "seq": self.sequence,
+                },
+            }
+        )
+
+    async def request_members(
+        self,
+        guild_id: int,
+        *,
+        query: str = "",
+        limit: int = 0,
+        user_ids: t.Optional[t.List[int]] = None,
+        presences: bool = False,
+        timeout: float = 30.0,
+    ) -> t.AsyncIterator[t.Dict[str, t.Any]]:
+        """Asks for the members of a guild, and yields them as their chunks arrive
+
+        Args:
+            guild_id (int): The id of the guild
+            query (str): Only members whose name starts with this. Defaults to "".
+            limit (int): Max number of members, 0 for every member. Defaults to 0.
+            user_ids (t.Optional[t.List[int]]): Only these members, instead of a query. Defaults to None.
+            presences (bool): If the chunks should include presences. Defaults to False.
+            timeout (float): Seconds to wait for each chunk. Defaults to 30.
+
+        Raises:
+            asyncio.TimeoutError: A chunk did not arrive in time
+
+        Yields:
+            t.Dict[str, t.Any]: The payload of every member
+        """
+
+        nonce = f"{self.shard_id or 0}:{next(self._nonces)}"
+        chunks: asyncio.Queue = asyncio.Queue()
+        self._member_requests[nonce] = chunks
+
+        data: t.Dict[str, t.Any] = {
+            "guild_id": str(guild_id),
+            "limit": limit,
+            "presences": presences,
+            "nonce": nonce,
+        }
+        if user_ids is not None:
+            data["user_ids"] = [str(user_id) for user_id in user_ids]
+        else:
+            data["query"] = query
+
+        try:
+            await self.send({"op": REQUEST_GUILD_MEMBERS, "d": data})
+
+            while True:
+                chunk = await asyncio.wait_for(chunks.get(), timeout)
+                for member in chunk["members"]:
+                    yield member
+
+                if chunk["chunk_index"] + 1 >= chunk["chunk_count"]:
+                    return
+        finally:
+            del self._member_requests[nonce]
+
+    def inflate(self, data: t.Union[str, bytes]) -> t.Optional[t.Union[str, bytes]]:
+        """Undoes the transport compression of a frame, and records it
+
+        Args:
+            data (t.Union[str, bytes]): The raw frame
+
+        Returns:
+            t.Optional[t.Union[str, bytes]]: The JSON text of the payload, or None if the frame is only part of one
+        """
+
+        if self._inflater is not None and isinstance(data, bytes):
+            data = self._inflater.feed(data)  # type: ignore
+            if data is None:
+                return None
+
+        recorder = self.bot.recorder
+        if recorder is not None:
+            recorder.record(self.shard_id or 0, data)
+
+        return data
+
+    def decode(self, data: t.Union[str, bytes]) -> t.Optional[t.Dict[str, t.Any]]:
+        """Decodes a frame received from the gateway
+
+        Args:
+            data (t.Union[str, bytes]): The raw frame
+
+        Returns:
+            t.Optional[t.Dict[str, t.Any]]: The payload, or None if the frame is only part of one
+        """
+
+        text = self.inflate(data)
+        if text is None:
+            return None
+
+        return self.decoder.loads(text)
+
+    async def received(self, data: t.Union[str, bytes]) -> None:
+        """Handles a single frame received from the gateway
+
+        Args:
+            data (t.Union[str, bytes]): The raw frame
+        """
+
+        text = self.inflate(data)
+        if text is None:
+            return
+
+        if self.bot.filter_events:
+            # Events nothing listens to are skipped before the payload is parsed,
+            # only their sequence is kept for heartbeats and resuming
+            head = peek(text)
+            if head is not None and head[0] == DISPATCH:
+                if not self.bot.wants_event(head[1]):
+                    self.sequence = head[2]
+                    self.bot.metrics.events_skipped.labels(head[1]).inc()
+                    return
+
+        event_data = self.decoder.loads(text)
+        op = event_data["op"]
+
+        if op == DISPATCH:
+            self.sequence = event_data["s"]
+
+            if event_data["t"] == "READY":
+                ready = event_data["d"]
+                self.session_id = ready["session_id"]
+                self.resume_url = ready.get("resume_gateway_url")
+                self.bot.user = User(ready["user"], self.bot)
+
+            elif event_data["t"] == "GUILD_MEMBERS_CHUNK":
+                chunks = self._member_requests.get(event_data["d"].get("nonce"))
+                if chunks is not None:
+                    chunks.put_nowait(event_data["d"])
+
+            if event_data["t"] in ("READY", "RESUMED"):
+                self.status = "connected"
+                self._attempt = 0
+
+            await self._forward(event_data)
+
+        elif op == HEARTBEAT:
+            await self.send_heartbeat()
+
+        elif op == HEARTBEAT_ACK:
+            self._last_ack = time.perf_counter()
+            self.latency = self._last_ack - self._last_heartbeat
+            self.bot.metrics.heartbeat_latency.labels(str(self.shard_id or 0)).observe(
+                self.latency
+            )
+
+        elif op == RECONNECT:
+            raise ReconnectWebSocket(resume=True)
+
+        elif op == INVALID_SESSION:
+            # Discord asks for a random wait of 1-5 seconds before identifying again
+            await asyncio.sleep(random.uniform(1, 5))
+            raise ReconnectWebSocket(resume=bool(event_data["d"]))
@@ -1,56 +1,162 @@
 import typing as t
-import sys
+
+from . import bulk
+from .member import Member
+from .utils import (
+    LazyPayloadField,
+    PayloadField,
+    paginate,
+    payload_fields,
+    slim_payload,
+    snowflake,
+)
 
 
 class Guild:
-    def __getitem__(self, key: t.Any):
-        pass
+    __slots__ = ("bot", "_data", "_lazy", "id", "name", "owner_id")
+
+    def __getitem__(self, channel_id: int):
+        """The cached channel of the guild with an id
+
+        Raises:
+            KeyError: If no channel of the guild has this id
+        """
+
+        channel = self.bot.state.get_channel(channel_id)
+        if channel is None or channel.guild_id != self.id:
+            raise KeyError(channel_id)
+
+        return channel
 
     def __init__(self, bot, json):
         self.bot = bot
+        self._lazy: t.Optional[t.Dict[str, t.Any]] = None
+        # The large lists sent with GUILD_CREATE, like channels and members, are
+        # cached separately or not at all, so they are left out with the rest
+        self._data = slim_payload({}, json, _PAYLOAD_FIELDS)
 
-        # print(json)
-
-        self.roles = json["roles"]
-        self.id = json["id"]
+        self.id = int(json["id"])
         self.name = json["name"]
+        self.owner_id = snowflake(json.get("owner_id"))
+
+    def _update(self, json: t.Dict[str, t.Any]) -> None:
+        """Updates the guild in place from a full or partial payload
+
+        Args:
+            json (t.Dict[str, t.Any]): The payload, e.g. of a GUILD_UPDATE event
+        """
+
+        slim_payload(self._data, json, _PAYLOAD_FIELDS)
+        self._lazy = None
+
+        self.name = json.get("name", self.name)
+        if "owner_id" in json:
+            self.owner_id = snowflake(json["owner_id"])
+
+    def _payload(self) -> t.Dict[str, t.Any]:
+        """The payload the guild can be built from again, without the fields it leaves out"""
+
+        return {
+            "id": str(self.id),
+            "name": self.name,
+            "owner_id": None if self.owner_id is None else str(self.owner_id),
+            **self._data,
+        }
+
+    roles = LazyPayloadField("roles", (), tuple)
+    features = LazyPayloadField("features", frozenset(), frozenset)
+    stickers = LazyPayloadField("stickers", (), tuple)
+    emojis = LazyPayloadField("emojis", (), tuple)
+
+    icon = PayloadField("icon")
+    description = PayloadField("description")
+    splash = PayloadField("splash")
+    discovery_splash = PayloadField("discovery_splash")
+    banner = PayloadField("banner")
+    region = PayloadField("region")
+    afk_channel_id = PayloadField("afk_channel_id", convert=int)
+    afk_timeout = PayloadField("afk_timeout")
+    system_channel_id = PayloadField("system_channel_id", convert=int)
+    widget_enabled = PayloadField("widget_enabled")
+    widget_channel_id = PayloadField("widget_channel_id", convert=int)
+    verification_level = PayloadField("verification_level")
+    default_message_notifications = PayloadField("default_message_notifications")
+    mfa_level = PayloadField("mfa_level")
+    explicit_content_filter = PayloadField("explicit_content_filter")
+    max_presences = PayloadField("max_presences")
+    max_members = PayloadField("max_members")
+    max_video_channel_users = PayloadField("max_video_channel_users")
+    vanity_url_code = PayloadField("vanity_url_code")
+    premium_tier = PayloadField("premium_tier")
+    premium_subscription_count = PayloadField("premium_subscription_count")
+    system_channel_flags = PayloadField("system_channel_flags")
+    preferred_locale = PayloadField("preferred_locale")
+    rules_channel_id = PayloadField("rules_channel_id", convert=int)
+    public_updates_channel_id = PayloadField("public_updates_channel_id", convert=int)
+    nsfw = PayloadField("nsfw")
+    nsfw_level = PayloadField("nsfw_level")
+
+    async def move_channels(
+        self, positions: t.Mapping[int, int], *, reason: t.Optional[str] = None
+    ) -> bulk.BulkResult:
+        """Sets the position of many channels of the guild with one request
+
+        Args:
+            positions (t.Mapping[int, int]): The new position of every channel, by channel id
+            reason (t.Optional[str]): The reason shown in the audit log. Defaults to None.
+
+        Returns:
+            bulk.BulkResult: The outcome for every channel
+        """
+
+        return await bulk.move_channels(
+            self.bot.http, self.id, positions, reason=reason
+        )
+
+    async def fetch_members(
+        self,
+        limit: t.Optional[int] = None,
+        *,
+        after: t.Optional[int] = None,
+        via_gateway: bool = False,
+        query: str = "",
+    ) -> t.AsyncIterator[Member]:
+        """Walks the members of the guild, in order of user id
+
+        By default the members are paged over REST, 1000 at a time with the next
+        page requested one ahead of the caller. With ``via_gateway`` they are
+        streamed from the member chunks the gateway sends for a REQUEST_GUILD_MEMBERS,
+        which needs the GUILD_MEMBERS intent but no REST requests.
+
+        Args:
+            limit (t.Optional[int]): Max number of members, None for every member. Defaults to None.
+            after (t.Optional[int]): Only members with a larger user id, over REST. Defaults to None.
+            via_gateway (bool): Stream the members from the gateway instead. Defaults to False.
+            query (str): Only members whose name starts with this, over the gateway. Defaults to "".
+
+        Yields:
+            Member: The members, one at a time
+        """
+
+        if via_gateway:
+            gateway = self.bot.gateway_for_guild(self.id)
+            async for member_json in gateway.request_members(
+                self.id, query=query, limit=limit or 0
+            ):
+                yield Member(member_json, self.id, self.bot)
+            return
+
+        async def fetch_page(size: int, cursor: t.Optional[int], forward: bool):
+            return await self.bot.http.get_members(self.id, limit=size, after=cursor)
+
+        async for member_json in paginate(
+            fetch_page,
+            limit=limit,
+            page_size=1000,
+            after=after or 0,
+            id_of=lambda member: int(member["user"]["id"]),
+        ):
+            yield Member(member_json, self.id, self.bot)
+
 
-        # print(self.name)
-        # print(json["name"])
-
-        self.icon = json["icon"]
-        self.description = json["description"]
-        self.splash = json["splash"]
-        self.discovery_splash = json["discovery_splash"]
-        self.features = json["features"]
-        self.stickers = json["stickers"]
-        self.banner = json["banner"]
-        self.owner_id = json["owner_id"]
-        self.region = json["region"]
-        self.afk_channel_id = json["afk_channel_id"]
-        self.afk_timeout = json["afk_timeout"]
-        self.system_channel_id = json["system_channel_id"]
-        self.widget_enabled = json["widget_enabled"]
-        self.widget_channel_id = json["widget_channel_id"]
-        self.verification_level = json["verification_level"]
-        self.roles = json["roles"]
-
-        self.default_message_notifications = json["default_message_notifications"]
-        self.mfa_level = json["mfa_level"]
-        self.explicit_content_filter = json["explicit_content_filter"]
-        self.max_presences = json["max_presences"]
-        self.max_members = json["max_members"]
-        self.max_video_channel_users = json["max_video_channel_users"]
-        self.vanity_url_code = json["vanity_url_code"]
-        self.premium_tier = json["premium_tier"]
-        self.premium_subscription_count = json["premium_subscription_count"]
-        self.system_channel_flags = json["system_channel_flags"]
-        self.preferred_locale = json["preferred_locale"]
-        self.rules_channel_id = json["rules_channel_id"]
-        self.public_updates_channel_id = json["public_updates_channel_id"]
-        self.nsfw = json["nsfw"]
-        self.nsfw_level = json["nsfw_level"]
-
-        # json.pop("emojis", None)
-        # json.pop("roles", None)
-        # print(json)
+_PAYLOAD_FIELDS = payload_fields(Guild)
@@ -1,25 +1,301 @@
 import aiohttp
 import asyncio
+import time
 import typing as t
+from . import errors
 from .embed import Embed as discordEmbed
+from .encoding import Decoder, default_decoder
+from .metrics import BotMetrics
+from .ratelimit import RateLimiter
+
+BASE_URL = "https://discord.com/api/v9"
+
+
+class Route:
+    """An endpoint of the discord api.
+
+    Args:
+        method (str): The http method of the endpoint
+        path (str): The path of the endpoint, with the parameters as format fields e.g. ``/channels/{channel_id}``
+    """
+
+    def __init__(self, method: str, path: str, **parameters: t.Any) -> None:
+        self.method = method
+        self.path = path
+        self.url_path = path.format(**parameters)
+
+        # The major parameters split discord's rate limit buckets
+        self.channel_id = parameters.get("channel_id")
+        self.guild_id = parameters.get("guild_id")
+        self.webhook_id = parameters.get("webhook_id")
+        self.token = parameters.get("token")
+
+    @property
+    def key(self) -> str:
+        return f"{self.method} {self.path}"
+
+    @property
+    def major_parameters(self) -> str:
+        if self.webhook_id is not None:
+            # Every interaction token of a webhook has a bucket of its own
+            return f"{self.channel_id}:{self.guild_id}:{self.webhook_id}:{self.token}"
+
+        return f"{self.channel_id}:{self.guild_id}"
 
 
 class DiscordHttpClient:
-    def __init__(self, loop: t.Optional[asyncio.AbstractEventLoop] = None) -> None:
+    """Client for the discord REST api.
+
+    All requests share one pooled ``aiohttp.ClientSession`` so connections are kept
+    alive between calls. The session is created lazily the first time a request is
+    made, inside the running event loop, and is bound to that loop until :meth:`close`.
+
+    Args:
+        loop (t.Optional[asyncio.AbstractEventLoop]): The event loop the bot runs on. Defaults to None.
+        base_url (str): The root url of the discord api. Defaults to ``BASE_URL``.
+        connection_limit (int): Max number of open connections in the pool. Defaults to 100.
+        connection_limit_per_host (int): Max number of open connections to one host, 0 for no limit. Defaults to 0.
+        keepalive_timeout (float): Seconds an idle connection is kept open for reuse. Defaults to 30.
+        dns_cache_ttl (t.Optional[int]): Seconds resolved hosts are cached for, None to cache forever. Defaults to 300.
+        global_rate_limit (int): Requests allowed per second across every route. Defaults to 50.
+        max_retries (int): How many times a rate limited request is retried. Defaults to 5.
+        decoder (t.Optional[Decoder]): Decoder for the response bodies, the fastest available if None. Defaults to None.
+        metrics (t.Optional[BotMetrics]): Registry the latency and status of every request is recorded in. Defaults to None.
+        response_cache_ttl (float): Seconds the responses of GET endpoints the gateway does not keep up to date are cached for, 0 to not cache them. Defaults to 0.
+    """
+
+    def __init__(
+        self,
+        loop: t.Optional[asyncio.AbstractEventLoop] = None,
+        *,
+        base_url: str = BASE_URL,
+        connection_limit: int = 100,
+        connection_limit_per_host: int = 0,
+        keepalive_timeout: float = 30.0,
+        dns_cache_ttl: t.Optional[int] = 300,
+        global_rate_limit: int = 50,
+        max_retries: int = 5,
+        decoder: t.Optional[Decoder] = None,
+        metrics: t.Optional[BotMetrics] = None,
+        response_cache_ttl: float = 0.0,
+    ) -> None:
 
         self.loop = loop
-        self.__session = aiohttp.ClientSession()
+        self.base_url = base_url.rstrip("/")
+
+        self.connection_limit = connection_limit
+        self.connection_limit_per_host = connection_limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+
+        self._session: t.Optional[aiohttp.ClientSession] = None
+
+        self.ratelimiter = RateLimiter(global_rate_limit)
+        self.max_retries = max_retries
+        self.decoder = decoder or default_decoder()
+        self.metrics = metrics
+
+        # GET requests in flight by url path and query, and cached responses by url
+        # path and then query, so a route drops the responses of every query at once
+        self._inflight: t.Dict[t.Tuple[str, str], asyncio.Future] = {}
+        self._response_cache: t.Dict[str, t.Dict[str, t.Tuple[float, t.Any]]] = {}
+        self.response_cache_ttl = response_cache_ttl
+
+        self.coalesced_hits = 0
+        self.cache_hits = 0
 
     def login(self, token):
         self.token = token
-        # headers = {
-        # "Authorization": f'Bot {token}'
-        # }
 
-        # async with self.__session as session:
-        # async with session.get(url='https://discord.com/api/v8/users/@me', headers=headers) as data:
-        # async with session.request(method="PUT", url='https://discord.com/api/v8/auth/login', headers=headers) as data:
-        # return data, await data.json()
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """The pooled session, created on first use in the running event loop."""
+
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.connection_limit,
+                limit_per_host=self.connection_limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=self.dns_cache_ttl,
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+            self.loop = asyncio.get_running_loop()
+
+        return self._session
+
+    async def close(self) -> None:
+        """Closes the pooled session and every connection it holds open"""
+
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+        self._session = None
+
+    async def request(
+        self, route: Route, **kwargs
+    ) -> t.Tuple[aiohttp.ClientResponse, t.Any]:
+        """Makes a request to the discord api over the pooled session.
+
+        The request waits for its rate limit bucket and the global rate limit first,
+        and is retried after ``retry_after`` if discord still answers with a 429.
+
+        Args:
+            route (Route): The endpoint to make the request to
+
+        Raises:
+            errors.HTTPException: The request was still rate limited after ``max_retries`` retries
+
+        Returns:
+            t.Tuple[aiohttp.ClientResponse, t.Any]: The response, and its decoded json body
+        """
+
+        url = f"{self.base_url}{route.url_path}"
+        ratelimiter = self.ratelimiter
+        metrics = self.metrics
+        started = time.perf_counter()
+
+        for _ in range(self.max_retries + 1):
+            await ratelimiter.acquire_global()
+            bucket = ratelimiter.get_bucket(route)
+            await bucket.acquire()
+
+            try:
+                async with self.session.request(
+                    route.method, url, **kwargs
+                ) as response:
+                    if response.content_type == "application/json":
+                        data = self.decoder.loads(await response.read())
+                    else:
+                        data = await response.text()
+            except BaseException:
+                bucket.release()
+                raise
+
+            ratelimiter.learn_hash(route, response.headers.get("X-RateLimit-Bucket"))
+
+            if metrics is not None:
+                metrics.rest_responses.labels(route.key, response.status).inc()
+                if response.status == 429:
+                    # Labelled without the major parameters, to keep one series per bucket
+                    metrics.rate_limited.labels(bucket.key.split(":", 1)[0]).inc()
+
+            if response.status != 429:
+                bucket.update(response.headers)
+                if metrics is not None:
+                    metrics.rest_latency.labels(route.key).observe(
+                        time.perf_counter() - started
+                    )
+
+                return response, data
+
+            retry_after = float(
+                data.get("retry_after", 0)
+                if isinstance(data, dict)
+                else response.headers.get("Retry-After", 1)
+            )
+
+            is_global = (
+                isinstance(data, dict) and data.get("global", False)
+            ) or response.headers.get("X-RateLimit-Global") == "true"
+
+            if is_global:
+                bucket.release()
+                await ratelimiter.block_global(retry_after)
+            else:
+                bucket.block(retry_after)
+
+        raise errors.HTTPException(
+            response.status, f"{route.key} was still rate limited after retrying"
+        )
+
+    async def get(self, route: Route, *, cache: bool = False, **kwargs) -> t.Any:
+        """Makes a GET request, sharing it with identical requests already in flight.
+
+        Every caller asking for the same path and query while a request is in flight
+        waits for that request, so they share one round trip and one decoded body.
+        The body is shared between them, and must not be changed.
+
+        Args:
+            route (Route): The endpoint to make the request to
+            cache (bool): Whether the response can be cached for ``response_cache_ttl``, for endpoints the gateway does not keep up to date. Defaults to False.
+
+        Returns:
+            t.Any: The decoded json body of the response
+        """
+
+        params = kwargs.get("params")
+        query = str(sorted(params.items())) if params else ""
+        key = (route.url_path, query)
+
+        if cache and self.response_cache_ttl > 0:
+            responses = self._response_cache.get(route.url_path)
+            cached = responses.get(query) if responses is not None else None
+            if cached is not None:
+                if cached[0] > time.monotonic():
+                    self.cache_hits += 1
+                    if self.metrics is not None:
+                        self.metrics.rest_cache_hits.labels(route.key).inc()
+
+                    return cached[1]
+
+                del responses[query]  # type: ignore
+                if not responses:
+                    del self._response_cache[route.url_path]
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._get(route, key, cache, **kwargs))
+            self._inflight[key] = task
+            task.add_done_callback(lambda task: self._finished(key, task))
+        else:
+            self.coalesced_hits += 1
+            if self.metrics is not None:
+                self.metrics.rest_coalesced.labels(route.key).inc()
+
+        # Shielded, so a cancelled caller does not cancel the request for the others
+        return await asyncio.shield(task)
+
+    def _finished(self, key: t.Tuple[str, str], task: asyncio.Future) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+        # Retrieved here too, in case every caller was cancelled before it finished
+        if not task.cancelled():
+            task.exception()
+
+    async def _get(
+        self, route: Route, key: t.Tuple[str, str], cache: bool, **kwargs
+    ) -> t.Any:
+        response, data = await self.request(route, **kwargs)
+
+        # Not cached if the route was invalidated while the request was in flight
+        if (
+            cache
+            and self.response_cache_ttl > 0
+            and response.status == 200
+            and self._inflight.get(key) is asyncio.current_task()
+        ):
+            url_path, query = key
+            self._response_cache.setdefault(url_path, {})[query] = (
+                time.monotonic() + self.response_cache_ttl,
+                data,
+            )
+
+        return data
+
+    def invalidate(self, route: t.Optional[Route] = None) -> None:
+        """Removes the cached responses of a route whatever their query, or every cached response if no route is given
+
+        The responses to requests still in flight for the route are not cached either.
+        """
+
+        if route is None:
+            self._response_cache.clear()
+            self._inflight.clear()
+        else:
+            self._response_cache.pop(route.url_path, None)
+            for key in [key for key in self._inflight if key[0] == route.url_path]:
+                del self._inflight[key]
 
     async def send_message(
         self,
@@ -50,45 +326,244 @@ class DiscordHttpClient:
                 elif type(embed) == dict:
                     message_data["embeds"].append(embed)
 
-        url = f"https://discord.com/api/v9/channels/{channel_id}/messages"
+        route = Route("POST", "/channels/{channel_id}/messages", channel_id=channel_id)
+
+        data, data_json = await self.request(route, headers=headers, json=message_data)
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, json=message_data) as data:
+        if data.status != 200:
+            print(f"The discord API returned the http status: {data.status}")
+            print(data_json)
+            return  # type: ignore
 
-                if data.status != 200:
-                    print(f"The discord API returned the http status: {data.status}")
-                    print(await data.json())
-                    return  # type: ignore
+        try:
+            if discord_code := data_json["code"]:
+                print(discord_code)
+                return  # type: ignore
+        except KeyError:
+            pass
 
-                data_json = await data.json()
+        return data_json
+
+    async def get_gateway_bot(self) -> t.Dict[str, t.Any]:
+        headers = {"Authorization": f"Bot {self.token}"}
 
-                try:
-                    if discord_code := data_json["code"]:
-                        print(discord_code)
-                        return  # type: ignore
-                except KeyError:
-                    pass
+        route = Route("GET", "/gateway/bot")
 
-                return data_json
+        return await self.get(route, cache=True, headers=headers)
 
     async def get_channel(self, channel_id: int) -> aiohttp.ClientResponse:
 
         headers = {"Authorization": f"Bot {self.token}"}
 
-        url = f"https://discord.com/api/v9/channels/{channel_id}"
+        route = Route("GET", "/channels/{channel_id}", channel_id=channel_id)
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                return await response.json()
+        return await self.get(route, headers=headers)
 
     async def get_guild(self, guild_id: int) -> aiohttp.ClientResponse:
         headers = {"Authorization": f"Bot {self.token}"}
 
-        url = f"https://discord.com/api/v9/guilds/{guild_id}"
+        route = Route("GET", "/guilds/{guild_id}", guild_id=guild_id)
+
+        return await self.get(route, headers=headers)
+
+    async def get_user(self, user_id: int) -> t.Dict[str, t.Any]:
+        headers = {"Authorization": f"Bot {self.token}"}
+
+        route = Route("GET", "/users/{user_id}", user_id=user_id)
+
+        return await self.get(route, headers=headers)
+
+    async def get_messages(
+        self,
+        channel_id: int,
+        *,
+        limit: int = 100,
+        before: t.Optional[int] = None,
+        after: t.Optional[int] = None,
+    ) -> t.List[t.Dict[str, t.Any]]:
+        headers = {"Authorization": f"Bot {self.token}"}
+
+        params = {"limit": str(limit)}
+        if before is not None:
+            params["before"] = str(before)
+        if after is not None:
+            params["after"] = str(after)
+
+        route = Route("GET", "/channels/{channel_id}/messages", channel_id=channel_id)
+
+        return await self._get_page(route, headers=headers, params=params)
+
+    async def get_members(
+        self, guild_id: int, *, limit: int = 1000, after: t.Optional[int] = None
+    ) -> t.List[t.Dict[str, t.Any]]:
+        headers = {"Authorization": f"Bot {self.token}"}
+
+        params = {"limit": str(limit)}
+        if after is not None:
+            params["after"] = str(after)
+
+        route = Route("GET", "/guilds/{guild_id}/members", guild_id=guild_id)
+
+        return await self._get_page(route, headers=headers, params=params)
+
+    async def _get_page(self, route: Route, **kwargs) -> t.List[t.Dict[str, t.Any]]:
+        # Pages are not coalesced, as no two walks ask for the same page at once
+        response, data = await self.request(route, **kwargs)
+        self._raise_for_status(route, response, data)
+
+        return data
+
+    @staticmethod
+    def _raise_for_status(route: Route, response: aiohttp.ClientResponse, data) -> None:
+        if response.status >= 300:
+            message = data.get("message") if isinstance(data, dict) else data
+            raise errors.HTTPException(response.status, f"{route.key}: {message}")
+
+    async def modify_channel(
+        self,
+        channel_id: int,
+        payload: t.Dict[str, t.Any],
+        *,
+        reason: t.Optional[str] = None,
+    ) -> t.Dict[str, t.Any]:
+        """Changes a channel with a payload in the form discord takes
+
+        Raises:
+            errors.HTTPException: Discord did not accept the change
+        """
+
+        headers = {"Authorization": f"Bot {self.token}"}
+        if reason:
+            headers["X-Audit-Log-Reason"] = reason
+
+        route = Route("PATCH", "/channels/{channel_id}", channel_id=channel_id)
+
+        response, data = await self.request(route, headers=headers, json=payload)
+        self._raise_for_status(route, response, data)
+        return data
+
+    async def edit_channel_positions(
+        self,
+        guild_id: int,
+        positions: t.List[t.Dict[str, t.Any]],
+        *,
+        reason: t.Optional[str] = None,
+    ) -> None:
+        headers = {"Authorization": f"Bot {self.token}"}
+        if reason:
+            headers["X-Audit-Log-Reason"] = reason
+
+        route = Route("PATCH", "/guilds/{guild_id}/channels", guild_id=guild_id)
+
+        response, data = await self.request(route, headers=headers, json=positions)
+        self._raise_for_status(route, response, data)
+
+    async def get_message(self, channel_id: int, message_id: int) -> t.Dict[str, t.Any]:
+        headers = {"Authorization": f"Bot {self.token}"}
+
+        route = Route(
+            "GET",
+            "/channels/{channel_id}/messages/{message_id}",
+            channel_id=channel_id,
+            message_id=message_id,
+        )
+
+        return await self.get(route, headers=headers)
+
+    async def delete_message(
+        self, channel_id: int, message_id: int, *, reason: t.Optional[str] = None
+    ) -> None:
+        headers = {"Authorization": f"Bot {self.token}"}
+        if reason:
+            headers["X-Audit-Log-Reason"] = reason
+
+        route = Route(
+            "DELETE",
+            "/channels/{channel_id}/messages/{message_id}",
+            channel_id=channel_id,
+            message_id=message_id,
+        )
+
+        response, data = await self.request(route, headers=headers)
+        self._raise_for_status(route, response, data)
+
+    async def bulk_delete_messages(
+        self,
+        channel_id: int,
+        message_ids: t.List[int],
+        *,
+        reason: t.Optional[str] = None,
+    ) -> None:
+        headers = {"Authorization": f"Bot {self.token}"}
+        if reason:
+            headers["X-Audit-Log-Reason"] = reason
+
+        route = Route(
+            "POST",
+            "/channels/{channel_id}/messages/bulk-delete",
+            channel_id=channel_id,
+        )
+
+        response, data = await self.request(
+            route,
+            headers=headers,
+            json={"messages": [str(message_id) for message_id in message_ids]},
+        )
+        self._raise_for_status(route, response, data)
+
+    async def create_followup_message(
+        self, application_id: int, token: str, payload: t.Dict[str, t.Any]
+    ) -> t.Dict[str, t.Any]:
+        """Sends a message in reply to an interaction, after its first response
+
+        The interaction token authorizes the request, for 15 minutes after the
+        interaction, so the bot token is not sent.
+
+        Raises:
+            errors.HTTPException: Discord did not accept the message
+        """
+
+        route = Route(
+            "POST",
+            "/webhooks/{webhook_id}/{token}",
+            webhook_id=application_id,
+            token=token,
+        )
+
+        response, data = await self.request(route, json=payload)
+        self._raise_for_status(route, response, data)
+        return data
+
+    async def edit_original_response(
+        self, application_id: int, token: str, payload: t.Dict[str, t.Any]
+    ) -> t.Dict[str, t.Any]:
+        """Changes the first response to an interaction, e.g. to fill in a deferred one
+
+        Raises:
+            errors.HTTPException: Discord did not accept the change
+        """
+
+        route = Route(
+            "PATCH",
+            "/webhooks/{webhook_id}/{token}/messages/@original",
+            webhook_id=application_id,
+            token=token,
+        )
+
+        response, data = await self.request(route, json=payload)
+        self._raise_for_status(route, response, data)
+        return data
+
+    async def delete_original_response(self, application_id: int, token: str) -> None:
+        route = Route(
+            "DELETE",
+            "/webhooks/{webhook_id}/{token}/messages/@original",
+            webhook_id=application_id,
+            token=token,
+        )
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                return await response.json()
+        response, data = await self.request(route)
+        self._raise_for_status(route, response, data)
 
     async def edit_channel(
         self,
@@ -124,12 +599,11 @@ class DiscordHttpClient:
         if parent_id:
             data["parent_id"] = parent_id  # type: ignore
 
-        url = f"https://discord.com/api/v9/channels/{channel_id}"
+        route = Route("PATCH", "/channels/{channel_id}", channel_id=channel_id)
 
-        async with aiohttp.ClientSession() as session:
-            async with session.patch(url, headers=headers, json=data) as response:
+        response, response_json = await self.request(route, headers=headers, json=data)
 
-                if response.status == 400:
-                    raise ValueError(f"One or more arguments were invalid")
+        if response.status == 400:
+            raise ValueError(f"One or more arguments were invalid")
 
-                return await response.json()
+        return response_json
@@ -0,0 +1,449 @@
+import asyncio
+import time
+import typing as t
+
+from aiohttp import web
+
+from . import errors
+from .context import Context
+from .embed import Embed
+from .message import Message
+from .user import User
+from .utils import snowflake
+
+try:
+    import nacl.exceptions
+    import nacl.signing
+except ImportError:
+    nacl = None
+
+# Interaction types
+PING = 1
+APPLICATION_COMMAND = 2
+
+# Interaction response types
+PONG = 1
+CHANNEL_MESSAGE = 4
+DEFERRED_CHANNEL_MESSAGE = 5
+
+# Message flag for a response only the user of the interaction sees
+EPHEMERAL = 1 << 6
+
+# Discord fails the interaction if the first response takes longer than this
+RESPONSE_DEADLINE = 3.0
+
+
+def _require_nacl() -> None:
+    if nacl is None:
+        raise RuntimeError(
+            "PyNaCl is needed to verify interaction requests, install it with "
+            "`pip install PyNaCl`"
+        )
+
+
+def public_key(secret: bytes) -> str:
+    """The public key of a secret key made for testing, in hex like the developer portal shows
+
+    Args:
+        secret (bytes): A 32 byte secret key
+    """
+
+    _require_nacl()
+    return nacl.signing.SigningKey(secret).verify_key.encode().hex()
+
+
+class SignatureVerifier:
+    """Checks the Ed25519 signatures discord puts on every interaction request
+
+    Needs PyNaCl, which checks a signature in a few microseconds.
+
+    Args:
+        public_key (str): The public key of the application, in hex as shown in the developer portal
+
+    Raises:
+        RuntimeError: PyNaCl is not installed
+    """
+
+    def __init__(self, public_key: str) -> None:
+        _require_nacl()
+        self.public_key = bytes.fromhex(public_key)
+        self._verify_key = nacl.signing.VerifyKey(self.public_key)
+
+    def verify(self, signature: str, timestamp: str, body: bytes) -> bool:
+        """If a request is signed by discord
+
+        Args:
+            signature (str): The ``X-Signature-Ed25519`` header, in hex
+            timestamp (str): The ``X-Signature-Timestamp`` header
+            body (bytes): The raw body of the request
+        """
+
+        try:
+            signature_bytes = bytes.fromhex(signature)
+        except ValueError:
+            return False
+
+        try:
+            self._verify_key.verify(timestamp.encode() + body, signature_bytes)
+        except (nacl.exceptions.BadSignatureError, ValueError):
+            return False
+
+        return True
+
+
+def sign_request(
+    secret: bytes, body: bytes, timestamp: t.Optional[str] = None
+) -> t.Dict[str, str]:
+    """The headers discord would send with a request, for testing an endpoint locally
+
+    Args:
+        secret (bytes): A 32 byte secret key made for testing, e.g. with ``os.urandom(32)``
+        body (bytes): The body of the request
+        timestamp (t.Optional[str]): The timestamp to sign, now if None. Defaults to None.
+
+    Returns:
+        t.Dict[str, str]: The signature and timestamp headers
+    """
+
+    _require_nacl()
+    timestamp = timestamp or str(int(time.time()))
+    signature = (
+        nacl.signing.SigningKey(secret).sign(timestamp.encode() + body).signature
+    )
+
+    return {
+        "X-Signature-Ed25519": signature.hex(),
+        "X-Signature-Timestamp": timestamp,
+        "Content-Type": "application/json",
+    }
+
+
+def _message_payload(
+    content: t.Optional[str],
+    tts: t.Optional[bool],
+    embeds: t.Optional[t.List[t.Any]],
+    ephemeral: bool,
+) -> t.Dict[str, t.Any]:
+    payload: t.Dict[str, t.Any] = {"content": content, "tts": bool(tts)}
+
+    if embeds:
+        payload["embeds"] = [
+            embed.to_dict() if isinstance(embed, Embed) else embed for embed in embeds
+        ]
+
+    if ephemeral:
+        payload["flags"] = EPHEMERAL
+
+    return payload
+
+
+class InteractionContext(Context):
+    """The context of a command run from a slash command interaction.
+
+    The first message sent within the deadline goes back as the response to the
+    interaction itself. After that, or once the response was deferred, messages
+    are sent over the webhook of the interaction, the first of them filling in the
+    deferred response.
+
+    :attr:`message` stands in for the message of a message command, with the id
+    of the interaction and no content, so commands can read its author, channel
+    and guild whichever way they were run.
+
+    Args:
+        bot (Bot): The bot the command was run on
+        interaction (t.Dict[str, t.Any]): The payload of the interaction
+    """
+
+    def __init__(self, bot, interaction: t.Dict[str, t.Any]) -> None:
+        self.interaction = interaction
+        self.id = int(interaction["id"])
+        self.application_id = int(interaction["application_id"])
+        self.token = interaction["token"]
+        self.channel_id = snowflake(interaction.get("channel_id"))
+
+        member = interaction.get("member") or {}
+        user = member.get("user") or interaction.get("user")
+        self.author = User(user, bot) if user is not None else None
+
+        channel = (
+            bot.state.get_channel(self.channel_id)
+            if self.channel_id is not None
+            else None
+        )
+        message_json = {
+            "id": interaction["id"],
+            "channel_id": interaction.get("channel_id"),
+            "guild_id": interaction.get("guild_id"),
+            "content": "",
+            "author": user,
+        }
+        super().__init__(bot, Message(bot)._fill(message_json, channel))
+
+        loop = asyncio.get_running_loop()
+        # The payload of the immediate response, or None once it was deferred
+        self._initial: asyncio.Future = loop.create_future()
+        # Done once the first response went out, as webhook messages have to follow it
+        self._acknowledged: asyncio.Future = loop.create_future()
+        self._original_sent = False
+
+    @property
+    def deferred(self) -> bool:
+        return self._initial.done() and self._initial.result() is None
+
+    async def send(
+        self,
+        content: t.Optional[str] = None,
+        *,
+        tts: t.Optional[bool] = False,
+        embeds: t.Optional[t.List[t.Any]] = None,
+        ephemeral: bool = False,
+    ) -> t.Optional[t.Dict[str, t.Any]]:
+        """Replies to the interaction
+
+        Args:
+            content (t.Optional[str]): The content of the message. Defaults to None.
+            tts (t.Optional[bool]): If it should be a text-to-speech message. Defaults to False.
+            embeds (t.Optional[t.List[t.Any]]): Embeds or embed dictionaries to send. Defaults to None.
+            ephemeral (bool): If only the user of the interaction should see it. Defaults to False.
+
+        Returns:
+            t.Optional[t.Dict[str, t.Any]]: The json of the message, None when it is the immediate response
+        """
+
+        payload = _message_payload(content, tts, embeds, ephemeral)
+        if not self._initial.done():
+            self._initial.set_result(payload)
+            return None
+
+        await asyncio.shield(self._acknowledged)
+
+        http = self.bot.http
+        if self.deferred and not self._original_sent:
+            self._original_sent = True
+            return await http.edit_original_response(
+                self.application_id, self.token, payload
+            )
+
+        return await http.create_followup_message(
+            self.application_id, self.token, payload
+        )
+
+
+class InteractionServer:
+    """Receives slash commands over http, as an alternative to the gateway.
+
+    Every request is checked against the public key of the application, and the
+    command named by the interaction runs like a message command would, with the
+    options as its arguments. The command answers with the first message it sends
+    if that happens within ``defer_after`` seconds, otherwise the response is
+    deferred and its messages follow over the webhook of the interaction.
+
+    Nothing is kept between requests, so any number of servers can run behind a
+    load balancer, each answering the interactions sent to it.
+
+    Args:
+        bot (Bot): The bot the commands are registered on
+        public_key (str): The public key of the application, in hex
+        host (str): The interface to listen on. Defaults to ``127.0.0.1``.
+        port (int): The port to listen on. Defaults to 8080.
+        path (str): The path discord sends the interactions to. Defaults to ``/interactions``.
+        defer_after (float): Seconds to wait for a message before deferring. Defaults to 1.5.
+    """
+
+    def __init__(
+        self,
+        bot,
+        public_key: str,
+        *,
+        host: str = "127.0.0.1",
+        port: int = 8080,
+        path: str = "/interactions",
+        defer_after: float = 1.5,
+    ) -> None:
+        if not 0 < defer_after < RESPONSE_DEADLINE:
+            raise ValueError(
+                f"defer_after must be between 0 and {RESPONSE_DEADLINE} seconds"
+            )
+
+        self.bot = bot
+        self.verifier = SignatureVerifier(public_key)
+        self.host = host
+        self.port = port
+        self.path = path
+        self.defer_after = defer_after
+
+        self.url: t.Optional[str] = None
+        self._runner: t.Optional[web.AppRunner] = None
+        self._tasks: t.Set[asyncio.Future] = set()
+
+        self.received = 0
+        self.rejected = 0
+        self.immediate = 0
+        self.deferred = 0
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        body = await request.read()
+        if not self.verifier.verify(
+            request.headers.get("X-Signature-Ed25519", ""),
+            request.headers.get("X-Signature-Timestamp", ""),
+            body,
+        ):
+            self.rejected += 1
+            return web.Response(status=401, text="invalid request signature")
+
+        self.received += 1
+        interaction = self.bot.decoder.loads(body)
+
+        if interaction["type"] == PING:
+            return web.json_response({"type": PONG})
+
+        if interaction["type"] != APPLICATION_COMMAND:
+            return web.Response(status=400, text="unsupported interaction type")
+
+        data = interaction["data"]
+        command = self.bot._command_index.get(data["name"])
+        if command is None:
+            return web.Response(status=404, text="unknown command")
+
+        context = InteractionContext(self.bot, interaction)
+        options = {
+            option["name"]: option.get("value") for option in data.get("options", ())
+        }
+
+        task = asyncio.ensure_future(self._run(command, context, options))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        try:
+            await asyncio.wait(
+                (task, context._initial),
+                timeout=self.defer_after,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+
+            if context._initial.done():
+                self.immediate += 1
+                reply = {"type": CHANNEL_MESSAGE, "data": context._initial.result()}
+            else:
+                self.deferred += 1
+                context._initial.set_result(None)
+                reply = {"type": DEFERRED_CHANNEL_MESSAGE}
+
+            response = web.json_response(reply)
+            await response.prepare(request)
+            await response.write_eof()
+        finally:
+            # Also when the request was dropped, so the command is not left waiting
+            if not context._initial.done():
+                context._initial.set_result(None)
+            if not context._acknowledged.done():
+                context._acknowledged.set_result(None)
+
+        return response
+
+    async def _run(self, command, context: InteractionContext, options) -> None:
+        bot = self.bot
+
+        try:
+            await self._invoke(command, context, options)
+        except Exception as exc:
+            # Raised by on_command_error, with no gateway event to report it under
+            await bot.on_error("INTERACTION_CREATE", exc)
+
+        # A deferred response that no message filled in would show as loading
+        await asyncio.shield(context._acknowledged)
+        if context.deferred and not context._original_sent:
+            try:
+                await bot.http.delete_original_response(
+                    context.application_id, context.token
+                )
+            except Exception as exc:
+                await bot.on_error("INTERACTION_CREATE", exc)
+
+    async def _invoke(self, command, context: InteractionContext, options) -> None:
+        bot = self.bot
+        started = time.perf_counter()
+        limits = command.limits
+        acquired = False
+        try:
+            if limits is not None:
+                key = limits.acquire(
+                    context.author.id, context.channel_id, context.guild_id
+                )
+                acquired = True
+
+            args, kwargs = await command.plan.convert(
+                bot, command.plan.words_from_options(options)
+            )
+            await command.call_command(context, *args, **kwargs)
+
+        except Exception as e:
+            status = "limited" if isinstance(e, errors.CommandLimited) else "error"
+            bot.metrics.commands.labels(command.name, status).inc()
+            await bot.on_command_error(e, context)
+
+        else:
+            bot.metrics.commands.labels(command.name, "ok").inc()
+
+        finally:
+            if acquired:
+                limits.release(key)  # type: ignore
+            bot.metrics.command_latency.labels(command.name).observe(
+                time.perf_counter() - started
+            )
+
+    async def start(self) -> str:
+        """Starts the server, and returns the url to give discord"""
+
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+
+        port = site._server.sockets[0].getsockname()[1]  # type: ignore
+        self.url = f"http://{self.host}:{port}{self.path}"
+        return self.url
+
+    async def stop(self) -> None:
+        """Stops taking interactions, the commands still running are left to finish"""
+
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def join(self, timeout: t.Optional[float] = None) -> bool:
+        """Waits for the commands still running
+
+        Args:
+            timeout (t.Optional[float]): Max seconds to wait, the commands are cancelled after that. No limit if None. Defaults to None.
+
+        Returns:
+            bool: If every command finished in time
+        """
+
+        if not self._tasks:
+            return True
+
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+
+        return not pending
+
+    async def close(self, timeout: t.Optional[float] = None) -> bool:
+        """Stops taking interactions, and waits for the commands still running
+
+        Args:
+            timeout (t.Optional[float]): Max seconds to wait for the commands, which are cancelled after that. No limit if None. Defaults to None.
+
+        Returns:
+            bool: If every command finished in time
+        """
+
+        await self.stop()
+        return await self.join(timeout)
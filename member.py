@@ -0,0 +1,36 @@
+import typing as t
+
+from .user import User
+from .utils import LazyPayloadField, PayloadField, payload_fields, slim_payload
+
+
+class Member:
+    """A user in a guild, as returned by the members endpoints and member chunks"""
+
+    __slots__ = ("_bot", "_data", "_lazy", "id", "guild_id", "user")
+
+    def __init__(self, json: t.Dict[str, t.Any], guild_id: int, bot) -> None:
+        self._bot = bot
+        # The user is kept as a User, and only the fields read through
+        # PayloadField are kept from the rest
+        self._data = slim_payload({}, json, _PAYLOAD_FIELDS)
+        self._lazy: t.Optional[t.Dict[str, t.Any]] = None
+
+        self.user = User(json["user"], bot)
+        self.id = self.user.id
+        self.guild_id = guild_id
+
+    @property
+    def display_name(self) -> t.Optional[str]:
+        return self.nick or self.user.username
+
+    nick = PayloadField("nick")
+    roles = LazyPayloadField("roles", (), lambda roles: tuple(map(int, roles)))
+    joined_at = PayloadField("joined_at")
+    premium_since = PayloadField("premium_since")
+    deaf = PayloadField("deaf", False)
+    mute = PayloadField("mute", False)
+    pending = PayloadField("pending", False)
+
+
+_PAYLOAD_FIELDS = payload_fields(Member)
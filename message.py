@@ -1,17 +1,85 @@
 import typing as t
 from .guild import Guild
 from .embed import Embed
+from .utils import snowflake
 
 
 class Message:
+    __slots__ = (
+        "bot",
+        "content",
+        "id",
+        "channel",
+        "author",
+        "guild_id",
+        "reference_id",
+    )
+
     def __init__(self, bot) -> None:
         self.bot = bot
 
     async def setup(self, message_json):
+        channel = await self.bot.get_text_channel(message_json["channel_id"])
+        return self._fill(message_json, channel)
+
+    def _fill(self, message_json, channel) -> "Message":
+        """Fills the message from its payload, for a channel that is already known"""
+
         self.content = message_json["content"]
-        self.id = message_json["id"]
-        self.channel = await self.bot.get_text_channel(message_json["channel_id"])
-        self.author = message_json["author"]
-        self.guild_id = message_json["guild_id"]
+        self.id = int(message_json["id"])
+        self.channel = channel
+        # Shared with the user cache, like the author of a cached message
+        self.author = self.bot.state.message_author(message_json)
+        self.guild_id = snowflake(message_json.get("guild_id"))
+
+        # The message this one replies to, see Bot.fetch_message
+        reference = message_json.get("message_reference")
+        self.reference_id = (
+            snowflake(reference.get("message_id")) if reference else None
+        )
 
         return self
+
+
+class CachedMessage:
+    """A message kept in the message cache of the bot.
+
+    Only what handling edits, deletes and replies needs is kept, with the ids as
+    ints and the author shared with the user cache, so thousands of messages
+    take little memory.
+
+    Args:
+        message_json (t.Dict[str, t.Any]): The payload of the message
+        author (t.Optional[User]): The cached user that sent it
+    """
+
+    __slots__ = (
+        "id",
+        "channel_id",
+        "guild_id",
+        "author",
+        "content",
+        "edited_timestamp",
+        "reference_id",
+    )
+
+    def __init__(self, message_json: t.Dict[str, t.Any], author) -> None:
+        self.id = int(message_json["id"])
+        self.channel_id = int(message_json["channel_id"])
+        self.guild_id = snowflake(message_json.get("guild_id"))
+        self.author = author
+        self.content = message_json.get("content", "")
+        self.edited_timestamp = message_json.get("edited_timestamp")
+
+        reference = message_json.get("message_reference")
+        self.reference_id = (
+            snowflake(reference.get("message_id")) if reference else None
+        )
+
+    def _update(self, message_json: t.Dict[str, t.Any]) -> None:
+        """Updates the message in place from a full or partial MESSAGE_UPDATE payload"""
+
+        if "content" in message_json:
+            self.content = message_json["content"]
+        if "edited_timestamp" in message_json:
+            self.edited_timestamp = message_json["edited_timestamp"]
@@ -0,0 +1,449 @@
+import asyncio
+import bisect
+import time
+import typing as t
+
+from aiohttp import web
+
+# The content type of version 0.0.4 of the Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(
+    names: t.Sequence[str], values: t.Sequence[str], extra: str = ""
+) -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class _GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: t.Tuple[float, ...]) -> None:
+        self.bounds = bounds
+        # One slot per bound, plus one for +Inf, allocated once
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metric:
+    """A family of metrics with the same name, one child per set of label values.
+
+    Children are created the first time a set of label values is used and then
+    reused, so recording is a dict lookup and an addition, without any locks.
+    Hot paths can hold on to the child returned by :meth:`labels`.
+
+    Args:
+        name (str): The name of the metric
+        documentation (str): The help text of the metric
+        labelnames (t.Sequence[str]): The names of the labels. Defaults to no labels.
+    """
+
+    type = "untyped"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: t.Sequence[str] = ()
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+        self._children: t.Dict[t.Tuple[str, ...], t.Any] = {}
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def _new_child(self) -> t.Any:
+        raise NotImplementedError
+
+    def labels(self, *values: t.Any) -> t.Any:
+        """The child for a set of label values, created if it is new"""
+
+        try:
+            return self._children[values]
+        except KeyError:
+            if len(values) != len(self.labelnames):
+                raise ValueError(
+                    f"{self.name} takes the labels {', '.join(self.labelnames)}"
+                )
+
+            child = self._children[values] = self._new_child()
+            return child
+
+    def samples(self) -> t.Iterator[t.Tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        lines.extend(
+            f"{name}{labels} {value!r}" for name, labels, value in self.samples()
+        )
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """A value that only goes up, or is read from ``function`` when exported
+
+    Args:
+        function (t.Optional[t.Callable[[], float]]): Called for the value when there are no labels, for a count kept elsewhere. Defaults to None.
+    """
+
+    type = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: t.Sequence[str] = (),
+        function: t.Optional[t.Callable[[], float]] = None,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._children[()].inc(amount)
+
+    def samples(self) -> t.Iterator[t.Tuple[str, str, float]]:
+        if self.function is not None:
+            yield self.name, "", float(self.function())
+            return
+
+        for values, child in list(self._children.items()):
+            yield self.name, _format_labels(self.labelnames, values), child.value
+
+
+class Gauge(Metric):
+    """A value that can go up and down, or be read from ``function`` when exported
+
+    Args:
+        function (t.Optional[t.Callable[[], float]]): Called for the value when there are no labels. Defaults to None.
+    """
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: t.Sequence[str] = (),
+        function: t.Optional[t.Callable[[], float]] = None,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self._children[()].set(value)
+
+    def samples(self) -> t.Iterator[t.Tuple[str, str, float]]:
+        if self.function is not None:
+            yield self.name, "", float(self.function())
+            return
+
+        for values, child in list(self._children.items()):
+            yield self.name, _format_labels(self.labelnames, values), child.value
+
+
+class Histogram(Metric):
+    """Counts of observed values in buckets, with their sum and count
+
+    Args:
+        buckets (t.Sequence[float]): The upper bounds of the buckets. Defaults to ``DEFAULT_BUCKETS``.
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: t.Sequence[str] = (),
+        buckets: t.Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._children[()].observe(value)
+
+    def samples(self) -> t.Iterator[t.Tuple[str, str, float]]:
+        for values, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), child.counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == "+Inf" else f'le="{bound!r}"'
+                yield (
+                    f"{self.name}_bucket",
+                    _format_labels(self.labelnames, values, le),
+                    cumulative,
+                )
+
+            labels = _format_labels(self.labelnames, values)
+            yield f"{self.name}_sum", labels, child.sum
+            yield f"{self.name}_count", labels, child.count
+
+
+class MetricsRegistry:
+    """A collection of metrics that can be exported together"""
+
+    def __init__(self) -> None:
+        self._metrics: t.Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"A metric called {metric.name} is already registered")
+
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(
+        self, name: str, documentation: str, labelnames=(), function=None
+    ) -> Counter:
+        return self.register(Counter(name, documentation, labelnames, function))  # type: ignore
+
+    def gauge(
+        self, name: str, documentation: str, labelnames=(), function=None
+    ) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, function))  # type: ignore
+
+    def histogram(
+        self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))  # type: ignore
+
+    def get(self, name: str) -> t.Optional[Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text exposition format"""
+
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+    def snapshot(self) -> t.Dict[str, t.Dict[str, float]]:
+        """Every sample of every metric, by metric name and then by sample"""
+
+        snapshot: t.Dict[str, t.Dict[str, float]] = {}
+        for metric in self._metrics.values():
+            samples = snapshot[metric.name] = {}
+            for name, labels, value in metric.samples():
+                samples[f"{name}{labels}"] = value
+
+        return snapshot
+
+
+class BotMetrics(MetricsRegistry):
+    """The registry of a bot, with the metrics the library records"""
+
+    def __init__(self) -> None:
+        super().__init__()
+
+        self.rest_latency = self.histogram(
+            "discord_rest_request_seconds",
+            "Time taken by REST requests, including rate limit waits",
+            ("route",),
+        )
+        self.rest_responses = self.counter(
+            "discord_rest_responses_total",
+            "REST responses by route and status",
+            ("route", "status"),
+        )
+        self.rate_limited = self.counter(
+            "discord_rest_rate_limited_total",
+            "429 responses by rate limit bucket",
+            ("bucket",),
+        )
+        self.rest_coalesced = self.counter(
+            "discord_rest_coalesced_total",
+            "GET requests that waited for an identical request already in flight",
+            ("route",),
+        )
+        self.rest_cache_hits = self.counter(
+            "discord_rest_cache_hits_total",
+            "GET requests answered from the response cache",
+            ("route",),
+        )
+        self.heartbeat_latency = self.histogram(
+            "discord_gateway_heartbeat_seconds",
+            "Round trip time of gateway heartbeats",
+            ("shard",),
+        )
+        self.events = self.counter(
+            "discord_gateway_events_total",
+            "Dispatch events received by type",
+            ("event",),
+        )
+        self.events_skipped = self.counter(
+            "discord_gateway_events_skipped_total",
+            "Dispatch events skipped without being parsed, as nothing listens to them",
+            ("event",),
+        )
+        self.commands = self.counter(
+            "discord_commands_total",
+            "Command invocations by command and outcome",
+            ("command", "status"),
+        )
+        self.command_latency = self.histogram(
+            "discord_command_seconds",
+            "Time taken to convert arguments and run commands",
+            ("command",),
+        )
+        self.pool_pending = self.gauge(
+            "discord_command_pool_pending",
+            "Command callbacks waiting for or running on a pool worker",
+            ("pool",),
+        )
+        self.pool_wait = self.histogram(
+            "discord_command_pool_wait_seconds",
+            "Time command callbacks waited for a pool worker",
+            ("pool",),
+        )
+        self.loop_blocked = self.counter(
+            "discord_command_loop_blocked_total",
+            "Times a command held the event loop for longer than the threshold",
+            ("command",),
+        )
+        self.loop_lag = self.histogram(
+            "discord_event_loop_lag_seconds",
+            "How late the event loop runs a callback scheduled to run immediately",
+        )
+
+
+class EventLoopLagMonitor:
+    """Measures how long the event loop takes to get round to a sleeping task
+
+    Args:
+        histogram (Histogram): The histogram the lag is recorded in
+        interval (float): Seconds between measurements. Defaults to 0.5.
+    """
+
+    def __init__(self, histogram: Histogram, *, interval: float = 0.5) -> None:
+        self.histogram = histogram
+        self.interval = interval
+        self._task: t.Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        observe = self.histogram.observe
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            observe(max(0.0, time.perf_counter() - start - self.interval))
+
+
+class MetricsServer:
+    """Serves a registry over http at ``/metrics`` for Prometheus to scrape
+
+    Args:
+        registry (MetricsRegistry): The metrics to serve
+        host (str): The interface to listen on. Defaults to ``127.0.0.1``.
+        port (int): The port to listen on. Defaults to 9100.
+    """
+
+    def __init__(
+        self, registry: MetricsRegistry, *, host: str = "127.0.0.1", port: int = 9100
+    ) -> None:
+        self.registry = registry
+        self.host = host
+        self.port = port
+
+        self.url: t.Optional[str] = None
+        self._runner: t.Optional[web.AppRunner] = None
+
+    async def _metrics(self, request: web.Request) -> web.Response:
+        return web.Response(
+            body=self.registry.render().encode(),
+            headers={"Content-Type": CONTENT_TYPE},
+        )
+
+    async def start(self) -> str:
+        """Starts the server, and returns the url of the metrics"""
+
+        app = web.Application()
+        app.router.add_get("/metrics", self._metrics)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+
+        port = site._server.sockets[0].getsockname()[1]  # type: ignore
+        self.url = f"http://{self.host}:{port}/metrics"
+        return self.url
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
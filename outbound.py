@@ -0,0 +1,205 @@
+import asyncio
+import typing as t
+
+MAX_CONTENT_LENGTH = 2000
+MAX_EMBEDS = 10
+
+
+class _ChannelBuffer:
+    __slots__ = ("parts", "futures", "length", "timer", "last")
+
+    def __init__(self) -> None:
+        self.parts: t.List[str] = []
+        self.futures: t.List[asyncio.Future] = []
+        self.length = 0
+        self.timer: t.Optional[asyncio.TimerHandle] = None
+        # The last send of the channel, which the next one waits for to keep the order
+        self.last: t.Optional[asyncio.Future] = None
+
+
+class SendQueue:
+    """Outbound queue that merges the plain text messages sent to a channel.
+
+    Plain text sent to a channel within ``window`` seconds of the first pending send
+    is joined with newlines into as few messages as fit in 2000 characters. A send
+    with embeds takes the pending text as its content when it fits, and goes out
+    straight away, as does a tts send after the pending text. Every channel sends
+    its messages one after another, in the order they were queued.
+
+    Args:
+        http (DiscordHttpClient): The client the messages are sent with
+        window (float): Seconds plain text waits for more text to merge with. Defaults to 0.05.
+    """
+
+    def __init__(self, http, *, window: float = 0.05) -> None:
+        self.http = http
+        self.window = window
+
+        self._buffers: t.Dict[int, _ChannelBuffer] = {}
+
+        self.sends = 0
+        self.messages = 0
+
+    def send(
+        self,
+        channel_id: int,
+        content: t.Optional[str],
+        tts: t.Optional[bool] = False,
+        embeds: t.Optional[t.List[t.Any]] = None,
+    ) -> asyncio.Future:
+        """Queues a message, and returns a future for the json of the message it went out in
+
+        Args:
+            channel_id (int): The id of the channel to send the message to
+            content (t.Optional[str]): The content of the message
+            tts (t.Optional[bool]): If it should be a text-to-speech message. Defaults to False.
+            embeds (t.Optional[t.List[t.Any]]): Embeds or embed dictionaries to send. Defaults to None.
+
+        Returns:
+            asyncio.Future: Resolved once the message is delivered, or with the error if it was not
+        """
+
+        self.sends += 1
+        future = asyncio.get_running_loop().create_future()
+
+        buffer = self._buffers.get(channel_id)
+        if buffer is None:
+            buffer = self._buffers[channel_id] = _ChannelBuffer()
+
+        if embeds:
+            self._send_embeds(channel_id, buffer, content, tts, list(embeds), future)
+            return future
+
+        if tts or content is None or len(content) > MAX_CONTENT_LENGTH:
+            self.flush(channel_id)
+            self._schedule(channel_id, buffer, content, tts, None, [future])
+            return future
+
+        added = len(content) + (1 if buffer.parts else 0)
+        if buffer.length + added > MAX_CONTENT_LENGTH:
+            self.flush(channel_id)
+            added = len(content)
+
+        buffer.parts.append(content)
+        buffer.futures.append(future)
+        buffer.length += added
+
+        if buffer.timer is None:
+            buffer.timer = asyncio.get_running_loop().call_later(
+                self.window, self.flush, channel_id
+            )
+
+        return future
+
+    def _send_embeds(
+        self,
+        channel_id: int,
+        buffer: _ChannelBuffer,
+        content: t.Optional[str],
+        tts: t.Optional[bool],
+        embeds: t.List[t.Any],
+        future: asyncio.Future,
+    ) -> None:
+        futures = [future]
+
+        # The pending text rides along as the content when the message has none
+        if buffer.parts and content is None and not tts:
+            content = "\n".join(buffer.parts)
+            futures = buffer.futures + futures
+            self._reset(buffer)
+        else:
+            self.flush(channel_id)
+
+        chunks = [
+            embeds[index : index + MAX_EMBEDS]
+            for index in range(0, len(embeds), MAX_EMBEDS)
+        ]
+        for index, chunk in enumerate(chunks):
+            last = index == len(chunks) - 1
+            self._schedule(
+                channel_id,
+                buffer,
+                content if index == 0 else None,
+                tts,
+                chunk,
+                futures if last else [],
+            )
+
+    def flush(self, channel_id: int) -> None:
+        """Sends the pending text of a channel now"""
+
+        buffer = self._buffers.get(channel_id)
+        if buffer is None or not buffer.parts:
+            return
+
+        content = "\n".join(buffer.parts)
+        futures = buffer.futures
+        self._reset(buffer)
+        self._schedule(channel_id, buffer, content, False, None, futures)
+
+    @staticmethod
+    def _reset(buffer: _ChannelBuffer) -> None:
+        if buffer.timer is not None:
+            buffer.timer.cancel()
+            buffer.timer = None
+
+        buffer.parts = []
+        buffer.futures = []
+        buffer.length = 0
+
+    def _schedule(
+        self,
+        channel_id: int,
+        buffer: _ChannelBuffer,
+        content: t.Optional[str],
+        tts: t.Optional[bool],
+        embeds: t.Optional[t.List[t.Any]],
+        futures: t.List[asyncio.Future],
+    ) -> None:
+        self.messages += 1
+        buffer.last = asyncio.ensure_future(
+            self._deliver(
+                channel_id, buffer, buffer.last, content, tts, embeds, futures
+            )
+        )
+
+    async def _deliver(
+        self,
+        channel_id: int,
+        buffer: _ChannelBuffer,
+        previous: t.Optional[asyncio.Future],
+        content: t.Optional[str],
+        tts: t.Optional[bool],
+        embeds: t.Optional[t.List[t.Any]],
+        futures: t.List[asyncio.Future],
+    ) -> None:
+        if previous is not None and not previous.done():
+            await asyncio.wait((previous,))
+
+        try:
+            message = await self.http.send_message(channel_id, content, tts, embeds)
+        except Exception as exc:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(exc)
+        else:
+            for future in futures:
+                if not future.done():
+                    future.set_result(message)
+        finally:
+            # Channels with nothing pending or in flight are forgotten
+            if buffer.last is asyncio.current_task() and not buffer.parts:
+                if self._buffers.get(channel_id) is buffer:
+                    del self._buffers[channel_id]
+
+    async def close(self) -> None:
+        """Sends the pending text of every channel, and waits for every send"""
+
+        for channel_id in list(self._buffers):
+            self.flush(channel_id)
+
+        pending = [
+            buffer.last for buffer in self._buffers.values() if buffer.last is not None
+        ]
+        if pending:
+            await asyncio.wait(pending)
@@ -0,0 +1,153 @@
+import asyncio
+import time
+import typing as t
+
+Resolver = t.Callable[
+    [t.Any, t.Optional[int]], t.Awaitable[t.Union[str, t.Iterable[str]]]
+]
+
+
+class PrefixMatcher:
+    """Finds which of a set of prefixes a message starts with.
+
+    The prefixes are grouped by their first character, so a message is checked
+    with one dict lookup, and only against the prefixes that start like it does,
+    longest first. Most messages are not commands and stop at the lookup.
+
+    Args:
+        prefixes (t.Iterable[str]): The prefixes to match
+    """
+
+    __slots__ = ("prefixes", "_by_first")
+
+    def __init__(self, prefixes: t.Iterable[str]) -> None:
+        self.prefixes = tuple(dict.fromkeys(prefix for prefix in prefixes if prefix))
+
+        by_first: t.Dict[str, t.List[str]] = {}
+        for prefix in self.prefixes:
+            by_first.setdefault(prefix[0], []).append(prefix)
+
+        self._by_first = {
+            first: tuple(sorted(candidates, key=len, reverse=True))
+            for first, candidates in by_first.items()
+        }
+
+    def match(self, content: str) -> t.Optional[str]:
+        """The longest prefix the content starts with, or None"""
+
+        candidates = self._by_first.get(content[:1])
+        if candidates is None:
+            return None
+
+        for prefix in candidates:
+            if content.startswith(prefix):
+                return prefix
+
+        return None
+
+
+class PrefixResolver:
+    """The prefixes of every guild, from a static prefix or an async resolver.
+
+    The prefixes a resolver returns for a guild are cached for ``ttl`` seconds, and
+    concurrent lookups of a guild that is not cached share one call to the resolver.
+    With ``mention``, mentioning the bot also works as a prefix everywhere.
+
+    Args:
+        bot (Bot): The bot the prefixes are for
+        default (t.Union[str, t.Iterable[str]]): The prefixes used without a resolver, and in direct messages
+        resolver (t.Optional[Resolver]): Coroutine called with the bot and a guild id that returns its prefixes. Defaults to None.
+        ttl (float): Seconds the prefixes of a guild are cached for. Defaults to 300.
+        mention (bool): If mentioning the bot works as a prefix. Defaults to False.
+    """
+
+    def __init__(
+        self,
+        bot,
+        default: t.Union[str, t.Iterable[str]],
+        *,
+        resolver: t.Optional[Resolver] = None,
+        ttl: float = 300.0,
+        mention: bool = False,
+    ) -> None:
+        self.bot = bot
+        self.default = (default,) if isinstance(default, str) else tuple(default)
+        self.resolver = resolver
+        self.ttl = ttl
+        self.mention = mention
+
+        self._default_matcher = self._matcher(self.default)
+        self._cache: t.Dict[int, t.Tuple[float, PrefixMatcher]] = {}
+        self._inflight: t.Dict[int, asyncio.Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def _matcher(self, prefixes: t.Iterable[str]) -> PrefixMatcher:
+        prefixes = list(prefixes)
+        user = self.bot.user
+        if self.mention and user is not None:
+            prefixes += [f"<@{user.id}> ", f"<@!{user.id}> "]
+
+        return PrefixMatcher(prefixes)
+
+    def cached(self, guild_id: t.Optional[int]) -> t.Optional[PrefixMatcher]:
+        """The matcher of a guild if it is known and fresh, without waiting"""
+
+        if self.resolver is None or guild_id is None:
+            return self._default_matcher
+
+        entry = self._cache.get(guild_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+
+        return None
+
+    async def get(self, guild_id: t.Optional[int]) -> PrefixMatcher:
+        """The matcher of a guild, calling the resolver if it is not cached"""
+
+        matcher = self.cached(guild_id)
+        if matcher is not None:
+            return matcher
+
+        self.misses += 1
+        task = self._inflight.get(guild_id)  # type: ignore
+        if task is None:
+            task = asyncio.ensure_future(self._resolve(guild_id))  # type: ignore
+            self._inflight[guild_id] = task  # type: ignore
+            task.add_done_callback(lambda task: self._finished(guild_id, task))  # type: ignore
+
+        return await asyncio.shield(task)
+
+    def _finished(self, guild_id: int, task: asyncio.Future) -> None:
+        if self._inflight.get(guild_id) is task:
+            del self._inflight[guild_id]
+
+    async def _resolve(self, guild_id: int) -> PrefixMatcher:
+        prefixes = await self.resolver(self.bot, guild_id)  # type: ignore
+        if isinstance(prefixes, str):
+            prefixes = (prefixes,)
+
+        matcher = self._matcher(prefixes)
+
+        # Not cached if the guild was invalidated while the resolver ran
+        if self._inflight.get(guild_id) is asyncio.current_task():
+            self._cache[guild_id] = (time.monotonic() + self.ttl, matcher)
+
+        return matcher
+
+    def invalidate(self, guild_id: t.Optional[int] = None) -> None:
+        """Forgets the prefixes of a guild, or of every guild if no id is given
+
+        Call this when the prefixes of a guild are changed, so the next message
+        resolves them again.
+        """
+
+        if guild_id is None:
+            self._cache.clear()
+            self._inflight.clear()
+            self._default_matcher = self._matcher(self.default)
+        else:
+            self._cache.pop(guild_id, None)
+            self._inflight.pop(guild_id, None)
@@ -0,0 +1,229 @@
+import asyncio
+import math
+import typing as t
+
+# Number of buckets kept before idle ones are first swept
+SWEEP_MIN_BUCKETS = 1024
+
+
+class Bucket:
+    """A single discord rate limit bucket.
+
+    Requests waiting on the bucket are queued in order behind a lock, and only let
+    through while the bucket has requests remaining. When it runs out, the queue
+    sleeps until the reset the discord api told us about.
+    """
+
+    def __init__(self, key: str) -> None:
+        self.key = key
+
+        self.limit: t.Optional[int] = None
+        # Until the first response comes back we don't know the limit, so only
+        # one request is let through to discover it
+        self.remaining: float = 1
+        self.reset_at: t.Optional[float] = None
+
+        self._lock = asyncio.Lock()
+        self._updated = asyncio.Event()
+
+    async def acquire(self) -> None:
+        """Waits until a request can be made in this bucket, and reserves it"""
+
+        loop = asyncio.get_running_loop()
+
+        async with self._lock:
+            while True:
+                now = loop.time()
+
+                if self.reset_at is not None and now >= self.reset_at:
+                    self.remaining = self.limit or 1
+                    self.reset_at = None
+
+                if self.remaining > 0:
+                    self.remaining -= 1
+                    return
+
+                if self.reset_at is None:
+                    # Waiting on the response to the first request in the bucket
+                    self._updated.clear()
+                    await self._updated.wait()
+                else:
+                    await asyncio.sleep(self.reset_at - now)
+
+    def update(self, headers: t.Mapping[str, str]) -> None:
+        """Updates the bucket from the ``X-RateLimit-*`` headers of a response
+
+        Args:
+            headers (t.Mapping[str, str]): The headers of the response
+        """
+
+        loop = asyncio.get_running_loop()
+
+        if "X-RateLimit-Remaining" not in headers:
+            # Routes without rate limit headers are not limited
+            self.limit = None
+            self.remaining = math.inf
+            self.reset_at = None
+        else:
+            now = loop.time()
+            remaining = int(headers["X-RateLimit-Remaining"])
+
+            # Responses can arrive out of order, so once the limit is known the lower
+            # count wins, as it accounts for requests that are still in flight.
+            # ``acquire`` refills the bucket itself when the window resets.
+            if self.limit is not None:
+                remaining = min(remaining, self.remaining)  # type: ignore
+
+            self.limit = int(headers.get("X-RateLimit-Limit", 1))
+            self.remaining = remaining
+            self.reset_at = now + float(headers.get("X-RateLimit-Reset-After", 0))
+
+        self._updated.set()
+
+    def idle(self, now: float) -> bool:
+        """If nothing is waiting on the bucket and it has no window running, so forgetting it loses nothing
+
+        Args:
+            now (float): The time of the event loop
+        """
+
+        if self._lock.locked():
+            return False
+        if self.reset_at is None:
+            return self.remaining > 0
+
+        return now >= self.reset_at
+
+    def release(self) -> None:
+        """Gives back a reserved request that never got a response"""
+
+        self.remaining += 1
+        self._updated.set()
+
+    def block(self, retry_after: float) -> None:
+        """Empties the bucket until ``retry_after`` seconds from now
+
+        Args:
+            retry_after (float): The number of seconds until requests can be made again
+        """
+
+        self.remaining = 0
+        self.reset_at = asyncio.get_running_loop().time() + retry_after
+        self._updated.set()
+
+
+class RateLimiter:
+    """Keeps track of every rate limit bucket, and the global rate limit.
+
+    Routes are mapped to discord's bucket hashes as they are learned from the
+    ``X-RateLimit-Bucket`` header, and buckets are split by the major parameter of
+    the route, so requests to different channels or guilds run in parallel.
+
+    Args:
+        global_limit (int): The number of requests allowed per second across every route. Defaults to 50.
+    """
+
+    def __init__(self, global_limit: int = 50) -> None:
+        self.global_limit = global_limit
+
+        self._hashes: t.Dict[str, str] = {}
+        self._buckets: t.Dict[str, Bucket] = {}
+        # Interaction webhooks get a bucket per token, so idle buckets are forgotten
+        # whenever the number of buckets doubles
+        self._sweep_at = SWEEP_MIN_BUCKETS
+
+        self._global_open: t.Optional[asyncio.Event] = None
+        self._global_window = 0.0
+        self._global_count = 0
+
+    def get_bucket(self, route) -> Bucket:
+        """Gets the bucket a route belongs to, creating it if it is new
+
+        Args:
+            route (http.Route): The route of the request
+        """
+
+        bucket_hash = self._hashes.get(route.key, route.key)
+        key = f"{bucket_hash}:{route.major_parameters}"
+
+        try:
+            return self._buckets[key]
+        except KeyError:
+            pass
+
+        # Requests made before the hash was known are queued on a bucket keyed by
+        # the route, which carries over to the hash so they keep their place
+        bucket = self._buckets.pop(f"{route.key}:{route.major_parameters}", None)
+        if bucket is None:
+            bucket = Bucket(key)
+            if len(self._buckets) >= self._sweep_at:
+                self.sweep()
+                self._sweep_at = max(SWEEP_MIN_BUCKETS, len(self._buckets) * 2)
+
+        self._buckets[key] = bucket
+        return bucket
+
+    def sweep(self) -> int:
+        """Forgets the buckets nothing is waiting on and whose window has reset
+
+        Returns:
+            int: The number of buckets forgotten
+        """
+
+        now = asyncio.get_running_loop().time()
+        idle = [key for key, bucket in self._buckets.items() if bucket.idle(now)]
+        for key in idle:
+            del self._buckets[key]
+
+        return len(idle)
+
+    def learn_hash(self, route, bucket_hash: t.Optional[str]) -> None:
+        """Records which discord bucket a route belongs to
+
+        Args:
+            route (http.Route): The route of the request
+            bucket_hash (t.Optional[str]): The value of the ``X-RateLimit-Bucket`` header
+        """
+
+        if bucket_hash:
+            self._hashes[route.key] = bucket_hash
+            self.get_bucket(route)
+
+    async def acquire_global(self) -> None:
+        """Waits until the global rate limit allows another request"""
+
+        if self._global_open is None:
+            self._global_open = asyncio.Event()
+            self._global_open.set()
+
+        loop = asyncio.get_running_loop()
+
+        while True:
+            await self._global_open.wait()
+
+            now = loop.time()
+            if now >= self._global_window:
+                self._global_window = now + 1
+                self._global_count = 0
+
+            if self._global_count < self.global_limit:
+                self._global_count += 1
+                return
+
+            await asyncio.sleep(self._global_window - now)
+
+    async def block_global(self, retry_after: float) -> None:
+        """Stops every request until ``retry_after`` seconds have passed
+
+        Args:
+            retry_after (float): The number of seconds until requests can be made again
+        """
+
+        if self._global_open is None:
+            self._global_open = asyncio.Event()
+
+        self._global_open.clear()
+        try:
+            await asyncio.sleep(retry_after)
+        finally:
+            self._global_open.set()
@@ -0,0 +1,233 @@
+import asyncio
+import gzip
+import os
+import struct
+import time
+import typing as t
+
+from .encoding import peek
+from .testing import FakeRestServer
+from .user import User
+
+MAGIC = b"BDGR\x01"
+
+# Seconds since the epoch, shard id and length of the payload of every frame
+_HEADER = struct.Struct("<dHI")
+_GZIP_MAGIC = b"\x1f\x8b"
+
+
+class GatewayRecorder:
+    """Appends the frames received from the gateway to a file, as they arrive.
+
+    Every frame is written as the JSON text of its payload, after any transport
+    compression is inflated, behind a small header with the time it arrived and the
+    shard it arrived on. The file is only ever appended to, so a bot can keep
+    recording over several runs, and with ``compress`` every run adds a gzip member.
+
+    The writes are flushed every ``flush_frames`` frames or ``flush_interval``
+    seconds, whichever comes first, so a crash loses at most that much of the
+    recording.
+
+    Args:
+        path (str): The file to append the recording to
+        compress (bool): If the recording should be gzip compressed. Defaults to False.
+        flush_frames (int): Max number of frames buffered before they are written out. Defaults to 1000.
+        flush_interval (float): Max seconds a frame stays buffered, checked as frames arrive. Defaults to 1.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        compress: bool = False,
+        flush_frames: int = 1000,
+        flush_interval: float = 1.0,
+    ) -> None:
+        self.path = path
+        self.compress = compress
+        self.flush_frames = flush_frames
+        self.flush_interval = flush_interval
+        self.frames = 0
+
+        self._file: t.Optional[t.BinaryIO] = None
+        self._buffered = 0
+        self._flushed_at = 0.0
+
+    def _open(self) -> t.BinaryIO:
+        new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+
+        if self.compress:
+            file = gzip.open(self.path, "ab", compresslevel=6)
+        else:
+            file = open(self.path, "ab")
+
+        if new:
+            file.write(MAGIC)
+
+        return file  # type: ignore
+
+    def record(self, shard_id: int, frame: t.Union[str, bytes]) -> None:
+        """Appends a frame, flushing the buffered writes when it is time to"""
+
+        now = time.time()
+        if self._file is None:
+            self._file = self._open()
+            self._flushed_at = now
+
+        if isinstance(frame, str):
+            frame = frame.encode()
+
+        self._file.write(_HEADER.pack(now, shard_id, len(frame)))
+        self._file.write(frame)
+        self.frames += 1
+
+        self._buffered += 1
+        if (
+            self._buffered >= self.flush_frames
+            or now - self._flushed_at >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        if self._file is not None:
+            self._file.flush()
+            self._buffered = 0
+            self._flushed_at = time.time()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read_recording(path: str) -> t.Iterator[t.Tuple[float, int, bytes]]:
+    """Reads back the frames of a recording, compressed or not
+
+    Args:
+        path (str): The file of the recording
+
+    A recording cut short, like by a crash, is read up to its last whole frame.
+
+    Yields:
+        t.Tuple[float, int, bytes]: The time every frame arrived, its shard id and its payload
+    """
+
+    with open(path, "rb") as raw:
+        compressed = raw.read(2) == _GZIP_MAGIC
+
+    with gzip.open(path, "rb") if compressed else open(path, "rb") as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a gateway recording")
+
+        while True:
+            try:
+                header = file.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    return
+
+                timestamp, shard_id, length = _HEADER.unpack(header)
+                frame = file.read(length)
+            except EOFError:
+                # A gzip member that was never closed
+                return
+
+            if len(frame) < length:
+                return
+
+            yield timestamp, shard_id, frame
+
+
+class ReplayDriver:
+    """Feeds a recording through :meth:`Bot.handle_events`, as a live connection would.
+
+    The dispatch events are handled in order, either as fast as possible or spaced
+    out like they arrived, sped up by ``speed``. Events the bot does not want are
+    skipped without being parsed, as the gateway skips them when ``filter_events``
+    is on. The REST requests the bot makes while handling them go to a local
+    stand-in for the discord api, started for the length of the replay.
+
+    Args:
+        bot (Bot): The bot to feed the events to
+        path (str): The file of the recording
+        speed (t.Optional[float]): How much faster than real time to replay, None for as fast as possible. Defaults to None.
+        stub_rest (bool): Start a :class:`testing.FakeRestServer` and send the REST requests to it for the length of the replay. Defaults to True.
+    """
+
+    def __init__(
+        self,
+        bot,
+        path: str,
+        *,
+        speed: t.Optional[float] = None,
+        stub_rest: bool = True,
+    ) -> None:
+        self.bot = bot
+        self.path = path
+        self.speed = speed
+        self.stub_rest = stub_rest
+
+    async def run(self) -> t.Dict[str, t.Any]:
+        """Replays the whole recording, and waits for the bot to handle every event
+
+        Returns:
+            t.Dict[str, t.Any]: The number of frames, events handled and events skipped, and how fast
+        """
+
+        bot = self.bot
+        rest = None
+        base_url = bot.http.base_url
+        if self.stub_rest:
+            rest = FakeRestServer(rate_limit=10**9)
+            bot.http.base_url = await rest.start()
+
+        loads = bot.decoder.loads
+        frames = events = skipped = 0
+        first_frame: t.Optional[float] = None
+
+        start = time.perf_counter()
+        try:
+            for timestamp, _, frame in read_recording(self.path):
+                if self.speed is not None:
+                    if first_frame is None:
+                        first_frame = timestamp
+
+                    due = start + (timestamp - first_frame) / self.speed
+                    delay = due - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+
+                frames += 1
+                if bot.filter_events:
+                    head = peek(frame)
+                    if head is not None and head[0] == 0:
+                        if not bot.wants_event(head[1]):
+                            skipped += 1
+                            bot.metrics.events_skipped.labels(head[1]).inc()
+                            continue
+
+                payload = loads(frame)
+                if payload["op"] != 0:
+                    continue
+
+                if payload["t"] == "READY":
+                    bot.user = User(payload["d"]["user"], bot)
+
+                events += 1
+                await bot.handle_events(payload)
+
+            await bot.dispatcher.join()
+            await bot.join_commands()
+            elapsed = time.perf_counter() - start
+        finally:
+            if rest is not None:
+                await bot.http.close()
+                await rest.close()
+                bot.http.base_url = base_url
+
+        return {
+            "frames": frames,
+            "events": events,
+            "skipped": skipped,
+            "elapsed_s": elapsed,
+            "events_per_second": events / elapsed if elapsed else 0.0,
+        }
@@ -0,0 +1,423 @@
+import collections
+import typing as t
+
+from .channel import TextChannel
+from .guild import Guild
+from .message import CachedMessage
+from .storage import StateBackend
+from .user import User
+
+
+class MessageCache:
+    """The latest messages the bot has seen, up to a fixed number.
+
+    Messages are kept in a ring in the order they arrived, with an index by id.
+    Once the ring is full every new message evicts the oldest one. A message that
+    is deleted, or pushed out by the cap of its channel, only leaves the index, and
+    its slot in the ring is freed when the ring comes round to it. So there are
+    never more than ``max_messages`` messages in memory, however many channels
+    there are.
+
+    Args:
+        max_messages (int): Max messages cached across every channel
+        max_per_channel (t.Optional[int]): Max messages cached per channel, so one busy channel can not evict every other. None for no limit. Defaults to None.
+    """
+
+    def __init__(
+        self, max_messages: int, *, max_per_channel: t.Optional[int] = None
+    ) -> None:
+        if max_messages < 1 or (max_per_channel is not None and max_per_channel < 1):
+            raise ValueError("max_messages and max_per_channel must be at least 1")
+
+        self.max_messages = max_messages
+        self.max_per_channel = max_per_channel
+
+        self._ring: t.Deque[CachedMessage] = collections.deque()
+        self._index: t.Dict[int, CachedMessage] = {}
+
+        # The messages of every channel in order, only kept with a per channel cap
+        self._channels: t.Dict[int, t.Deque[CachedMessage]] = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    @property
+    def hit_rate(self) -> float:
+        """The fraction of lookups, updates and deletes that found their message"""
+
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def _lookup(self, message: t.Optional[CachedMessage]) -> t.Optional[CachedMessage]:
+        if message is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return message
+
+    def _forget(self, message: CachedMessage) -> None:
+        # A newer copy of the same message may have replaced it in the index
+        if self._index.get(message.id) is message:
+            del self._index[message.id]
+
+    def get(self, message_id: int) -> t.Optional[CachedMessage]:
+        return self._lookup(self._index.get(message_id))
+
+    def add(self, message: CachedMessage) -> None:
+        ring = self._ring
+        if len(ring) >= self.max_messages:
+            oldest = ring.popleft()
+            self._forget(oldest)
+
+            # The oldest message of all is also the oldest of its channel
+            channel = self._channels.get(oldest.channel_id)
+            if channel and channel[0] is oldest:
+                channel.popleft()
+                if not channel:
+                    del self._channels[oldest.channel_id]
+
+        ring.append(message)
+        self._index[message.id] = message
+
+        if self.max_per_channel is not None:
+            channel = self._channels.get(message.channel_id)
+            if channel is None:
+                channel = self._channels[message.channel_id] = collections.deque()
+            elif len(channel) >= self.max_per_channel:
+                self._forget(channel.popleft())
+
+            channel.append(message)
+
+    def update(self, message_json: t.Dict[str, t.Any]) -> t.Optional[CachedMessage]:
+        """Updates a cached message in place, from a full or partial payload"""
+
+        message = self._lookup(self._index.get(int(message_json["id"])))
+        if message is not None:
+            message._update(message_json)
+
+        return message
+
+    def remove(self, message_id: int) -> t.Optional[CachedMessage]:
+        return self._lookup(self._index.pop(message_id, None))
+
+    def remove_channel(self, channel_id: int) -> None:
+        if self.max_per_channel is not None:
+            messages: t.Iterable[CachedMessage] = self._channels.pop(channel_id, ())
+        else:
+            messages = [
+                message
+                for message in self._index.values()
+                if message.channel_id == channel_id
+            ]
+
+        for message in messages:
+            self._forget(message)
+
+    def clear(self) -> None:
+        self._ring.clear()
+        self._index.clear()
+        self._channels.clear()
+
+
+class ConnectionState:
+    """In memory cache of the guilds, channels and users the bot can see.
+
+    The cache is seeded from READY and GUILD_CREATE, and kept up to date from the
+    gateway events, so lookups only need the REST api when something is missing.
+    Users are kept in least recently used order, and the oldest are evicted when
+    there are more than ``max_users``.
+
+    With a ``backend``, everything stored is also written to it, and anything
+    missing from the cache is looked up in it, so processes sharing a backend
+    share what they learn from their events. Users evicted from the cache are
+    kept in the backend.
+
+    Unless ``max_messages`` is None, the latest messages are kept in a
+    :class:`MessageCache`, updated from MESSAGE_UPDATE, and the listeners of
+    MESSAGE_DELETE and MESSAGE_DELETE_BULK find the messages that were deleted
+    under ``cached_message`` and ``cached_messages`` in the data of the event.
+
+    Args:
+        bot (Bot): The bot the cached objects belong to
+        max_users (t.Optional[int]): Max number of users to cache, None for no limit. Defaults to 10000.
+        backend (t.Optional[StateBackend]): Store shared with other bots or processes. Defaults to None.
+        max_messages (t.Optional[int]): Max number of messages to cache, None to not cache messages. Defaults to 1000.
+        max_messages_per_channel (t.Optional[int]): Max number of messages to cache per channel, None for no limit. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        bot,
+        *,
+        max_users: t.Optional[int] = 10000,
+        backend: t.Optional[StateBackend] = None,
+        max_messages: t.Optional[int] = 1000,
+        max_messages_per_channel: t.Optional[int] = None,
+    ) -> None:
+        self.bot = bot
+        self.max_users = max_users
+        self.backend = backend
+
+        self.messages: t.Optional[MessageCache] = None
+        if max_messages is not None:
+            self.messages = MessageCache(
+                max_messages, max_per_channel=max_messages_per_channel
+            )
+
+        self.guilds: t.Dict[int, Guild] = {}
+        self.channels: t.Dict[int, TextChannel] = {}
+        self.users: "collections.OrderedDict[int, User]" = collections.OrderedDict()
+
+        self._guild_channels: t.Dict[int, t.Set[int]] = {}
+
+        self._parsers: t.Dict[str, t.Callable[[t.Dict[str, t.Any]], None]] = {
+            "READY": self.parse_ready,
+            "GUILD_CREATE": self.parse_guild_create,
+            "GUILD_UPDATE": self.parse_guild_update,
+            "GUILD_DELETE": self.parse_guild_delete,
+            "CHANNEL_CREATE": self.parse_channel_update,
+            "CHANNEL_UPDATE": self.parse_channel_update,
+            "CHANNEL_DELETE": self.parse_channel_delete,
+            "MESSAGE_CREATE": self.parse_message_create,
+        }
+        if self.messages is not None:
+            # Only parsed when there is a cache to keep up to date
+            self._parsers.update(
+                {
+                    "MESSAGE_UPDATE": self.parse_message_update,
+                    "MESSAGE_DELETE": self.parse_message_delete,
+                    "MESSAGE_DELETE_BULK": self.parse_message_delete_bulk,
+                }
+            )
+
+    def parse(self, event: str, data: t.Dict[str, t.Any]) -> None:
+        """Updates the cache from a gateway dispatch event
+
+        Args:
+            event (str): The name of the event, the ``t`` field of the payload
+            data (t.Dict[str, t.Any]): The data of the event, the ``d`` field of the payload
+        """
+
+        parser = self._parsers.get(event)
+        if parser is not None:
+            parser(data)
+
+    def parses(self, event: str) -> bool:
+        """If the cache is updated from an event"""
+
+        return event in self._parsers
+
+    @property
+    def events(self) -> t.Set[str]:
+        """The events the cache is updated from"""
+
+        return set(self._parsers)
+
+    def clear(self) -> None:
+        self.guilds.clear()
+        self.channels.clear()
+        self.users.clear()
+        self._guild_channels.clear()
+        if self.messages is not None:
+            self.messages.clear()
+
+    def get_guild(self, guild_id: int) -> t.Optional[Guild]:
+        guild_id = int(guild_id)
+
+        guild = self.guilds.get(guild_id)
+        if guild is None and self.backend is not None:
+            guild_json = self.backend.get("guild", guild_id)
+            if guild_json is not None:
+                guild = self._cache_guild(guild_json)
+
+        return guild
+
+    def get_channel(self, channel_id: int) -> t.Optional[TextChannel]:
+        channel_id = int(channel_id)
+
+        channel = self.channels.get(channel_id)
+        if channel is None and self.backend is not None:
+            channel_json = self.backend.get("channel", channel_id)
+            if channel_json is not None:
+                channel = self._cache_channel(channel_json)
+
+        return channel
+
+    def get_user(self, user_id: int) -> t.Optional[User]:
+        user_id = int(user_id)
+
+        user = self.users.get(user_id)
+        if user is not None:
+            self.users.move_to_end(user_id)
+        elif self.backend is not None:
+            user_json = self.backend.get("user", user_id)
+            if user_json is not None:
+                user = self._cache_user(user_json)
+
+        return user
+
+    def _cache_guild(self, guild_json: t.Dict[str, t.Any]) -> Guild:
+        guild_id = int(guild_json["id"])
+
+        guild = self.guilds.get(guild_id)
+        if guild is not None:
+            guild._update(guild_json)
+        else:
+            guild = self.guilds[guild_id] = Guild(self.bot, guild_json)
+
+        return guild
+
+    def _cache_channel(self, channel_json: t.Dict[str, t.Any]) -> TextChannel:
+        channel_id = int(channel_json["id"])
+
+        channel = self.channels.get(channel_id)
+        if channel is not None:
+            channel._update(channel_json)
+        else:
+            channel = self.channels[channel_id] = TextChannel(channel_json, self.bot)
+
+        guild_id = channel_json.get("guild_id")
+        if guild_id is not None:
+            self._guild_channels.setdefault(int(guild_id), set()).add(channel_id)
+
+        return channel
+
+    def _cache_user(self, user_json: t.Dict[str, t.Any]) -> User:
+        user_id = int(user_json["id"])
+
+        user = self.users.get(user_id)
+        if user is not None:
+            user._update(user_json)
+            self.users.move_to_end(user_id)
+        else:
+            user = self.users[user_id] = User(user_json, self.bot)
+
+        if self.max_users is not None:
+            while len(self.users) > self.max_users:
+                self.users.popitem(last=False)
+
+        return user
+
+    def store_guild(self, guild_json: t.Dict[str, t.Any]) -> Guild:
+        guild = self._cache_guild(guild_json)
+        if self.backend is not None:
+            self.backend.put("guild", guild.id, guild._payload())
+
+        return guild
+
+    def store_channel(self, channel_json: t.Dict[str, t.Any]) -> TextChannel:
+        channel = self._cache_channel(channel_json)
+        if self.backend is not None:
+            self.backend.put("channel", channel.id, channel._payload())
+
+        return channel
+
+    def store_user(self, user_json: t.Dict[str, t.Any]) -> User:
+        user = self._cache_user(user_json)
+        if self.backend is not None:
+            self.backend.put("user", user.id, user._payload())
+
+        return user
+
+    def remove_channel(self, channel_id: int) -> t.Optional[TextChannel]:
+        channel_id = int(channel_id)
+        channel = self.channels.pop(channel_id, None)
+
+        if channel is not None and channel.guild_id is not None:
+            self._guild_channels.get(channel.guild_id, set()).discard(channel.id)
+
+        if self.messages is not None:
+            self.messages.remove_channel(channel_id)
+
+        if self.backend is not None:
+            self.backend.delete("channel", channel_id)
+
+        return channel
+
+    def parse_ready(self, data: t.Dict[str, t.Any]) -> None:
+        # A new session starts from nothing, the guilds follow as GUILD_CREATE
+        shard = data.get("shard")
+        if shard is None:
+            self.clear()
+        else:
+            shard_id, shard_count = shard
+            for guild_id in list(self.guilds):
+                if (guild_id >> 22) % shard_count == shard_id:
+                    self.parse_guild_delete({"id": guild_id})
+
+        self.store_user(data["user"])
+
+    def parse_guild_create(self, data: t.Dict[str, t.Any]) -> None:
+        if data.get("unavailable"):
+            return
+
+        self.store_guild(data)
+
+        for channel_json in data.get("channels", []):
+            # Channels sent inside a guild don't include the guild id
+            channel_json["guild_id"] = data["id"]
+            self.store_channel(channel_json)
+
+        for member_json in data.get("members", []):
+            if "user" in member_json:
+                self.store_user(member_json["user"])
+
+    def parse_guild_update(self, data: t.Dict[str, t.Any]) -> None:
+        self.store_guild(data)
+
+    def parse_guild_delete(self, data: t.Dict[str, t.Any]) -> None:
+        guild_id = int(data["id"])
+
+        self.guilds.pop(guild_id, None)
+        channel_ids = self._guild_channels.pop(guild_id, ())
+        for channel_id in channel_ids:
+            self.channels.pop(channel_id, None)
+            if self.messages is not None:
+                self.messages.remove_channel(channel_id)
+
+        if self.backend is not None:
+            self.backend.delete("guild", guild_id)
+            for channel_id in channel_ids:
+                self.backend.delete("channel", channel_id)
+
+    def parse_channel_update(self, data: t.Dict[str, t.Any]) -> None:
+        if "guild_id" in data:
+            self.store_channel(data)
+
+    def parse_channel_delete(self, data: t.Dict[str, t.Any]) -> None:
+        self.remove_channel(data["id"])
+
+    def message_author(self, data: t.Dict[str, t.Any]) -> t.Optional[User]:
+        """The cached user that sent a message, cached from the payload if it is new"""
+
+        author = data.get("author")
+        if author is None:
+            return None
+
+        user = self.get_user(author["id"])
+        if user is None:
+            user = self.store_user(author)
+
+        return user
+
+    def parse_message_create(self, data: t.Dict[str, t.Any]) -> None:
+        author = self.message_author(data)
+        if self.messages is not None:
+            self.messages.add(CachedMessage(data, author))
+
+    def parse_message_update(self, data: t.Dict[str, t.Any]) -> None:
+        self.messages.update(data)  # type: ignore
+
+    def parse_message_delete(self, data: t.Dict[str, t.Any]) -> None:
+        data["cached_message"] = self.messages.remove(int(data["id"]))  # type: ignore
+
+    def parse_message_delete_bulk(self, data: t.Dict[str, t.Any]) -> None:
+        messages: MessageCache = self.messages  # type: ignore
+        removed = (messages.remove(int(message_id)) for message_id in data["ids"])
+        data["cached_messages"] = [
+            message for message in removed if message is not None
+        ]
@@ -0,0 +1,190 @@
+import asyncio
+import json
+import sqlite3
+import typing as t
+
+from .encoding import Decoder, default_decoder
+
+# The kinds of entity a backend stores, and the table each one is kept in
+KINDS = {"guild": "guilds", "channel": "channels", "user": "users"}
+
+
+class StateBackend:
+    """Where the payloads of the cached guilds, channels and users are kept.
+
+    The cache of a bot always keeps the objects it has used in memory, and looks up
+    anything it is missing in its backend before asking the REST api. Subclass this
+    and override :meth:`get`, :meth:`put` and :meth:`delete` to keep the payloads
+    somewhere else.
+    """
+
+    def get(self, kind: str, key: int) -> t.Optional[t.Dict[str, t.Any]]:
+        """The payload of an entity, or None if it is not stored
+
+        Args:
+            kind (str): ``guild``, ``channel`` or ``user``
+            key (int): The id of the entity
+        """
+
+        raise NotImplementedError
+
+    def put(self, kind: str, key: int, payload: t.Dict[str, t.Any]) -> None:
+        raise NotImplementedError
+
+    def delete(self, kind: str, key: int) -> None:
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        """Writes out any writes that are still batched"""
+
+    def close(self) -> None:
+        self.flush()
+
+
+class MemoryBackend(StateBackend):
+    """Keeps the payloads in dictionaries of this process
+
+    Bots in the same process that are given the same backend share what they store.
+    Without any backend, the cache of a bot only has the objects it made itself.
+    """
+
+    def __init__(self) -> None:
+        self._entities: t.Dict[str, t.Dict[int, t.Dict[str, t.Any]]] = {
+            kind: {} for kind in KINDS
+        }
+
+    def get(self, kind: str, key: int) -> t.Optional[t.Dict[str, t.Any]]:
+        payload = self._entities[kind].get(key)
+
+        # Copied, as the objects made from a payload update it in place
+        return None if payload is None else dict(payload)
+
+    def put(self, kind: str, key: int, payload: t.Dict[str, t.Any]) -> None:
+        self._entities[kind][key] = dict(payload)
+
+    def delete(self, kind: str, key: int) -> None:
+        self._entities[kind].pop(key, None)
+
+
+class SQLiteBackend(StateBackend):
+    """Keeps the payloads in an SQLite database that several processes can share.
+
+    Every process of a cluster opens the same file, so what one of them stores from
+    its gateway events the others read without asking the REST api. Writes are
+    batched, and committed together ``flush_interval`` seconds after the first one
+    or once there are ``batch_size`` of them. A process sees its own batched writes
+    straight away, the others once they are committed. The database is memory
+    mapped, so the processes reading it share the pages instead of each keeping a
+    copy.
+
+    Args:
+        path (str): The database file, created if it does not exist
+        batch_size (int): Writes that are committed at once. Defaults to 500.
+        flush_interval (float): Max seconds a write is batched for. Defaults to 0.05.
+        mmap_size (int): Bytes of the database that are memory mapped. Defaults to 256 MiB.
+        decoder (t.Optional[Decoder]): Decoder for the stored payloads, the fastest available if None. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        batch_size: int = 500,
+        flush_interval: float = 0.05,
+        mmap_size: int = 256 * 1024 * 1024,
+        decoder: t.Optional[Decoder] = None,
+    ) -> None:
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.decoder = decoder or default_decoder()
+
+        self._connection = sqlite3.connect(path, isolation_level=None, timeout=30.0)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+        for table in KINDS.values():
+            self._connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY, data BLOB NOT NULL)"
+            )
+
+        self._select = {
+            kind: f"SELECT data FROM {table} WHERE id = ?"
+            for kind, table in KINDS.items()
+        }
+        self._upsert = {
+            kind: f"INSERT OR REPLACE INTO {table} (id, data) VALUES (?, ?)"
+            for kind, table in KINDS.items()
+        }
+        self._remove = {
+            kind: f"DELETE FROM {table} WHERE id = ?" for kind, table in KINDS.items()
+        }
+
+        # The latest write of every entity not committed yet, None for a delete
+        self._pending: t.Dict[t.Tuple[str, int], t.Optional[bytes]] = {}
+        self._timer: t.Optional[asyncio.TimerHandle] = None
+
+        self.reads = 0
+        self.writes = 0
+        self.batches = 0
+
+    def get(self, kind: str, key: int) -> t.Optional[t.Dict[str, t.Any]]:
+        self.reads += 1
+
+        try:
+            data = self._pending[(kind, key)]
+        except KeyError:
+            row = self._connection.execute(self._select[kind], (key,)).fetchone()
+            data = None if row is None else row[0]
+
+        return None if data is None else self.decoder.loads(data)
+
+    def put(self, kind: str, key: int, payload: t.Dict[str, t.Any]) -> None:
+        self._write(kind, key, json.dumps(payload, separators=(",", ":")).encode())
+
+    def delete(self, kind: str, key: int) -> None:
+        self._write(kind, key, None)
+
+    def _write(self, kind: str, key: int, data: t.Optional[bytes]) -> None:
+        self.writes += 1
+        self._pending[(kind, key)] = data
+
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+        elif self._timer is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                # Nothing would run the timer, so outside of a loop writes are not batched
+                self.flush()
+            else:
+                self._timer = loop.call_later(self.flush_interval, self.flush)
+
+    def flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        if not self._pending:
+            return
+
+        pending, self._pending = self._pending, {}
+        connection = self._connection
+
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for (kind, key), data in pending.items():
+                if data is None:
+                    connection.execute(self._remove[kind], (key,))
+                else:
+                    connection.execute(self._upsert[kind], (key, data))
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+        connection.execute("COMMIT")
+        self.batches += 1
+
+    def close(self) -> None:
+        self.flush()
+        self._connection.close()
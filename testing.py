@@ -0,0 +1,631 @@
+"""Local stand-ins for the discord gateway and REST api, for tests, benchmarks and replays.
+
+:class:`FakeGateway` is a ``websockets`` server that behaves like the discord
+gateway and sends MESSAGE_CREATE events at a fixed rate, and :class:`FakeRestServer`
+is an ``aiohttp`` server that answers the REST endpoints the library uses, with
+configurable latency and rate limits. Both can be used as async context managers,
+which start and close them.
+"""
+
+import asyncio
+import json
+import time
+import typing as t
+from http import HTTPStatus
+
+import websockets
+from aiohttp import web
+
+
+def make_snowflake(counter: int) -> str:
+    """A snowflake id for now, with ``counter`` to tell apart ids made in the same millisecond"""
+
+    return str((int(time.time() * 1000) - 1420070400000) << 22 | counter)
+
+
+def guild_payload(guild_id: int, channel_ids: t.List[int]) -> t.Dict[str, t.Any]:
+    """A GUILD_CREATE payload with the fields discord sends"""
+
+    return {
+        "id": str(guild_id),
+        "name": f"guild {guild_id}",
+        "icon": None,
+        "description": None,
+        "splash": None,
+        "discovery_splash": None,
+        "features": ["COMMUNITY", "NEWS"],
+        "stickers": [],
+        "emojis": [],
+        "banner": None,
+        "owner_id": "80351110224678912",
+        "afk_channel_id": None,
+        "afk_timeout": 300,
+        "system_channel_id": str(channel_ids[0]) if channel_ids else None,
+        "widget_enabled": False,
+        "widget_channel_id": None,
+        "verification_level": 1,
+        "roles": [
+            {"id": str(guild_id), "name": "@everyone", "permissions": "104324673"}
+        ],
+        "default_message_notifications": 0,
+        "mfa_level": 0,
+        "explicit_content_filter": 0,
+        "max_presences": None,
+        "max_members": 250000,
+        "max_video_channel_users": 25,
+        "vanity_url_code": None,
+        "premium_tier": 0,
+        "premium_subscription_count": 0,
+        "system_channel_flags": 0,
+        "preferred_locale": "en-US",
+        "rules_channel_id": None,
+        "public_updates_channel_id": None,
+        "nsfw": False,
+        "nsfw_level": 0,
+        "channels": [channel_payload(channel_id) for channel_id in channel_ids],
+        "members": [],
+    }
+
+
+def channel_payload(
+    channel_id: int, guild_id: t.Optional[int] = None
+) -> t.Dict[str, t.Any]:
+    """A text channel payload with the fields discord sends"""
+
+    payload = {
+        "id": str(channel_id),
+        "type": 0,
+        "name": f"channel-{channel_id}",
+        "position": 0,
+        "parent_id": None,
+        "topic": None,
+        "last_message_id": None,
+        "permission_overwrites": [],
+        "nsfw": False,
+        "rate_limit_per_user": 0,
+    }
+
+    if guild_id is not None:
+        payload["guild_id"] = str(guild_id)
+
+    return payload
+
+
+def message_payload(
+    message_id: str, channel_id: int, guild_id: int, content: str
+) -> t.Dict[str, t.Any]:
+    """A MESSAGE_CREATE payload with the fields discord sends"""
+
+    return {
+        "id": message_id,
+        "channel_id": str(channel_id),
+        "guild_id": str(guild_id),
+        "content": content,
+        "author": {
+            "id": str(1000 + int(message_id) % 5000),
+            "username": "user",
+            "discriminator": "0001",
+            "avatar": None,
+        },
+        "timestamp": "2021-07-01T00:00:00.000000+00:00",
+        "edited_timestamp": None,
+        "tts": False,
+        "mention_everyone": False,
+        "mentions": [],
+        "mention_roles": [],
+        "attachments": [],
+        "embeds": [],
+        "pinned": False,
+        "type": 0,
+    }
+
+
+def dispatch_payload(
+    event: str, data: t.Any, sequence: t.Optional[int] = None
+) -> t.Dict[str, t.Any]:
+    """A dispatch payload, with its fields in the order discord sends them"""
+
+    return {"t": event, "s": sequence, "op": 0, "d": data}
+
+
+class FakeGateway:
+    """A stand-in discord gateway.
+
+    Answers IDENTIFY with READY and a GUILD_CREATE for every guild, acknowledges
+    heartbeats and RESUMEs, and then sends MESSAGE_CREATE events at ``message_rate``
+    per second. A ``command_ratio`` fraction of the messages are ``!ping`` commands
+    carrying the time they were sent, so the reply can be timed.
+
+    To test how a bot copes with a misbehaving gateway, heartbeats go unanswered
+    while ``ack_heartbeats`` is False, the next ``refuse_connections`` connections
+    are refused with a 503, and :meth:`send_op` and :meth:`disconnect` act on every
+    open connection. The close codes of the connections that ended are kept in
+    ``close_codes``.
+
+    Args:
+        guilds (int): The number of guilds the bot is in. Defaults to 10.
+        channels_per_guild (int): The number of text channels per guild. Defaults to 5.
+        message_rate (float): MESSAGE_CREATE events sent per second. Defaults to 1000.
+        command_ratio (float): The fraction of messages that are commands. Defaults to 0.02.
+        heartbeat_interval (int): The heartbeat interval in milliseconds sent in HELLO. Defaults to 41250.
+        shards (int): The shard count reported to the bot. Defaults to 1.
+    """
+
+    def __init__(
+        self,
+        *,
+        guilds: int = 10,
+        channels_per_guild: int = 5,
+        message_rate: float = 1000.0,
+        command_ratio: float = 0.02,
+        heartbeat_interval: int = 41250,
+        shards: int = 1,
+    ) -> None:
+
+        self.guild_ids = [100000 + index for index in range(guilds)]
+        self.channel_ids = {
+            guild_id: [guild_id * 100 + index for index in range(channels_per_guild)]
+            for guild_id in self.guild_ids
+        }
+        self.message_rate = message_rate
+        self.command_ratio = command_ratio
+        self.heartbeat_interval = heartbeat_interval
+        self.shards = shards
+
+        self.url: t.Optional[str] = None
+        self.events_sent = 0
+        self.commands_sent = 0
+        self.identifies = 0
+        self.resumes = 0
+
+        self.ack_heartbeats = True
+        self.refuse_connections = 0
+        self.connection_attempts: t.List[float] = []
+        self.close_codes: t.List[int] = []
+
+        self._server = None
+        self._counter = 0
+        self._websockets: t.Set[t.Any] = set()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Starts the server, and returns the url to connect to"""
+
+        self._server = await websockets.serve(
+            self._handler,
+            host,
+            port,
+            max_size=None,
+            process_request=self._process_request,
+        )
+        port = self._server.sockets[0].getsockname()[1]  # type: ignore
+        self.url = f"ws://{host}:{port}"
+        return self.url
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def __aenter__(self) -> "FakeGateway":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: t.Any) -> None:
+        await self.close()
+
+    async def _send(self, websocket, op: int, data: t.Any, event=None) -> None:
+        self._counter += 1
+        await websocket.send(
+            # In the order discord sends the fields, which lets events be peeked at
+            json.dumps({"t": event, "s": self._counter, "op": op, "d": data})
+        )
+
+    async def send_op(self, op: int, data: t.Any = None) -> None:
+        """Sends a payload to every open connection"""
+
+        for websocket in list(self._websockets):
+            await self._send(websocket, op, data)
+
+    async def disconnect(self, code: int = 1011) -> None:
+        """Closes every open connection with ``code``"""
+
+        for websocket in list(self._websockets):
+            await websocket.close(code=code)
+
+    async def _process_request(self, path: str, request_headers: t.Any) -> t.Any:
+        self.connection_attempts.append(time.perf_counter())
+        if self.refuse_connections > 0:
+            self.refuse_connections -= 1
+            return HTTPStatus.SERVICE_UNAVAILABLE, [], b"Service Unavailable"
+
+        return None
+
+    async def _heartbeat_ack(self, websocket) -> None:
+        if self.ack_heartbeats:
+            await websocket.send(json.dumps({"op": 11}))
+
+    async def _handler(self, websocket, path=None) -> None:
+        self._websockets.add(websocket)
+        sender = None
+        try:
+            await self._send(
+                websocket, 10, {"heartbeat_interval": self.heartbeat_interval}
+            )
+
+            first = json.loads(await websocket.recv())
+            while first["op"] == 1:
+                await self._heartbeat_ack(websocket)
+                first = json.loads(await websocket.recv())
+
+            shard = first["d"].get("shard", [0, 1])
+            if first["op"] == 6:
+                self.resumes += 1
+                await self._send(websocket, 0, {}, "RESUMED")
+            else:
+                self.identifies += 1
+                await self._ready(websocket, shard)
+
+            sender = asyncio.ensure_future(self._send_messages(websocket, shard))
+            async for message in websocket:
+                if json.loads(message)["op"] == 1:
+                    await self._heartbeat_ack(websocket)
+
+            self.close_codes.append(websocket.close_code)
+        except websockets.ConnectionClosed as exc:
+            self.close_codes.append(exc.code)
+        finally:
+            self._websockets.discard(websocket)
+            if sender is not None:
+                sender.cancel()
+
+    def _shard_guilds(self, shard: t.List[int]) -> t.List[int]:
+        shard_id, shard_count = shard
+        return [
+            guild_id
+            for guild_id in self.guild_ids
+            if (guild_id >> 22) % shard_count == shard_id
+        ]
+
+    async def _ready(self, websocket, shard: t.List[int]) -> None:
+        guild_ids = self._shard_guilds(shard)
+
+        await self._send(
+            websocket,
+            0,
+            {
+                "v": 9,
+                "session_id": f"session-{shard[0]}",
+                "resume_gateway_url": self.url,
+                "shard": shard,
+                "user": {"id": "1", "username": "benchmark", "bot": True},
+                "guilds": [
+                    {"id": str(guild_id), "unavailable": True} for guild_id in guild_ids
+                ],
+            },
+            "READY",
+        )
+
+        for guild_id in guild_ids:
+            await self._send(
+                websocket,
+                0,
+                guild_payload(guild_id, self.channel_ids[guild_id]),
+                "GUILD_CREATE",
+            )
+
+    async def _send_messages(self, websocket, shard: t.List[int]) -> None:
+        guild_ids = self._shard_guilds(shard)
+        if not guild_ids or self.message_rate <= 0:
+            return
+
+        channels = [
+            (guild_id, channel_id)
+            for guild_id in guild_ids
+            for channel_id in self.channel_ids[guild_id]
+        ]
+        command_every = (
+            max(1, round(1 / self.command_ratio)) if self.command_ratio > 0 else 0
+        )
+
+        tick = 0.01
+        per_tick = self.message_rate * tick
+        owed = 0.0
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+
+        while True:
+            owed += per_tick
+            while owed >= 1:
+                owed -= 1
+                index = self.events_sent
+                guild_id, channel_id = channels[index % len(channels)]
+
+                if command_every and index % command_every == 0:
+                    content = f"!ping {time.perf_counter()!r}"
+                    self.commands_sent += 1
+                else:
+                    content = "just a normal message"
+
+                await self._send(
+                    websocket,
+                    0,
+                    message_payload(
+                        make_snowflake(index % 4096), channel_id, guild_id, content
+                    ),
+                    "MESSAGE_CREATE",
+                )
+                self.events_sent += 1
+
+            next_tick += tick
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+
+
+class FakeRestServer:
+    """A stand-in discord REST api.
+
+    Serves ``/gateway/bot``, channels, guilds, messages and interaction webhooks, waits ``latency``
+    seconds before every response, and sends ``X-RateLimit-*`` headers with
+    ``rate_limit`` requests per ``rate_limit_window`` seconds in each channel or
+    guild bucket, answering with a 429 when a bucket is overrun.
+
+    Args:
+        gateway (t.Optional[FakeGateway]): The gateway returned by ``/gateway/bot``. Defaults to None.
+        latency (float): Seconds to wait before every response. Defaults to 0.
+        rate_limit (int): Requests allowed per bucket per window. Defaults to 50.
+        rate_limit_window (float): The length of a rate limit window in seconds. Defaults to 1.
+        max_concurrency (int): The identify ``max_concurrency`` returned by ``/gateway/bot``. Defaults to 1.
+        history_size (int): Messages in the history of every channel, with ids 1 to ``history_size``. Defaults to 10000.
+        member_count (int): Members of every guild, with user ids 1 to ``member_count``. Defaults to 10000.
+    """
+
+    def __init__(
+        self,
+        *,
+        gateway: t.Optional[FakeGateway] = None,
+        latency: float = 0.0,
+        rate_limit: int = 50,
+        rate_limit_window: float = 1.0,
+        max_concurrency: int = 1,
+        history_size: int = 10000,
+        member_count: int = 10000,
+    ) -> None:
+
+        self.gateway = gateway
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rate_limit_window = rate_limit_window
+        self.max_concurrency = max_concurrency
+        self.history_size = history_size
+        self.member_count = member_count
+
+        self.url: t.Optional[str] = None
+        self.requests = 0
+        self.rate_limited = 0
+        self.requests_by_route: t.Dict[str, int] = {}
+        self.round_trips: t.List[float] = []
+
+        self._buckets: t.Dict[str, t.List[float]] = {}
+        self._runner: t.Optional[web.AppRunner] = None
+
+        self.app = web.Application()
+        self.app.router.add_get("/api/v9/gateway/bot", self._gateway_bot)
+        self.app.router.add_get("/api/v9/channels/{channel_id}", self._get_channel)
+        self.app.router.add_patch("/api/v9/channels/{channel_id}", self._edit_channel)
+        self.app.router.add_post(
+            "/api/v9/channels/{channel_id}/messages", self._send_message
+        )
+        self.app.router.add_get(
+            "/api/v9/channels/{channel_id}/messages", self._get_messages
+        )
+        self.app.router.add_delete(
+            "/api/v9/channels/{channel_id}/messages/{message_id}", self._delete_message
+        )
+        self.app.router.add_post(
+            "/api/v9/channels/{channel_id}/messages/bulk-delete", self._bulk_delete
+        )
+        self.app.router.add_get("/api/v9/guilds/{guild_id}", self._get_guild)
+        self.app.router.add_patch(
+            "/api/v9/guilds/{guild_id}/channels", self._edit_channel_positions
+        )
+        self.app.router.add_get("/api/v9/guilds/{guild_id}/members", self._get_members)
+        self.app.router.add_post(
+            "/api/v9/webhooks/{webhook_id}/{token}", self._interaction_message
+        )
+        self.app.router.add_patch(
+            "/api/v9/webhooks/{webhook_id}/{token}/messages/@original",
+            self._interaction_message,
+        )
+        self.app.router.add_delete(
+            "/api/v9/webhooks/{webhook_id}/{token}/messages/@original",
+            self._delete_original,
+        )
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Starts the server, and returns the base url of the api"""
+
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+
+        port = site._server.sockets[0].getsockname()[1]  # type: ignore
+        self.url = f"http://{host}:{port}/api/v9"
+        return self.url
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def __aenter__(self) -> "FakeRestServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: t.Any) -> None:
+        await self.close()
+
+    async def _respond(
+        self, request: web.Request, bucket: str, body: t.Any, status: int = 200
+    ):
+        route = f"{request.method} {request.match_info.route.resource.canonical}"  # type: ignore
+        self.requests += 1
+        self.requests_by_route[route] = self.requests_by_route.get(route, 0) + 1
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        now = asyncio.get_running_loop().time()
+        window = self._buckets.get(bucket)
+        if window is None or now >= window[0]:
+            window = self._buckets[bucket] = [now + self.rate_limit_window, 0]
+
+        window[1] += 1
+        reset_after = window[0] - now
+        headers = {
+            "X-RateLimit-Limit": str(self.rate_limit),
+            "X-RateLimit-Remaining": str(max(0, self.rate_limit - int(window[1]))),
+            "X-RateLimit-Reset-After": f"{reset_after:.3f}",
+            "X-RateLimit-Bucket": route,
+        }
+
+        if window[1] > self.rate_limit:
+            self.rate_limited += 1
+            return web.json_response(
+                {
+                    "message": "You are being rate limited.",
+                    "retry_after": reset_after,
+                    "global": False,
+                },
+                status=429,
+                headers=headers,
+            )
+
+        if status == 204:
+            return web.Response(status=204, headers=headers)
+
+        return web.json_response(body, status=status, headers=headers)
+
+    async def _gateway_bot(self, request: web.Request):
+        return web.json_response(
+            {
+                "url": self.gateway.url if self.gateway else "ws://127.0.0.1",
+                "shards": self.gateway.shards if self.gateway else 1,
+                "session_start_limit": {
+                    "total": 1000,
+                    "remaining": 1000,
+                    "reset_after": 0,
+                    "max_concurrency": self.max_concurrency,
+                },
+            }
+        )
+
+    async def _get_channel(self, request: web.Request):
+        channel_id = int(request.match_info["channel_id"])
+        return await self._respond(
+            request,
+            f"channel:{channel_id}",
+            channel_payload(channel_id, channel_id // 100),
+        )
+
+    async def _get_messages(self, request: web.Request):
+        channel_id = int(request.match_info["channel_id"])
+        limit = int(request.query.get("limit", 50))
+
+        if "after" in request.query:
+            start = int(request.query["after"]) + 1
+            ids = range(start, min(start + limit, self.history_size + 1))
+        else:
+            end = min(
+                int(request.query.get("before", self.history_size + 1)),
+                self.history_size + 1,
+            )
+            ids = range(end - 1, max(end - 1 - limit, 0), -1)
+
+        return await self._respond(
+            request,
+            f"messages:{channel_id}",
+            [
+                message_payload(str(message_id), channel_id, 0, "history")
+                for message_id in ids
+            ],
+        )
+
+    async def _get_members(self, request: web.Request):
+        guild_id = int(request.match_info["guild_id"])
+        limit = int(request.query.get("limit", 1))
+        start = int(request.query.get("after", 0)) + 1
+
+        members = [
+            {
+                "user": {
+                    "id": str(user_id),
+                    "username": f"user{user_id}",
+                    "discriminator": "0001",
+                },
+                "nick": None,
+                "roles": [],
+                "joined_at": "2021-07-01T00:00:00.000000+00:00",
+                "deaf": False,
+                "mute": False,
+            }
+            for user_id in range(start, min(start + limit, self.member_count + 1))
+        ]
+        return await self._respond(request, f"members:{guild_id}", members)
+
+    async def _delete_message(self, request: web.Request):
+        channel_id = int(request.match_info["channel_id"])
+        return await self._respond(request, f"delete:{channel_id}", None, status=204)
+
+    async def _bulk_delete(self, request: web.Request):
+        channel_id = int(request.match_info["channel_id"])
+        data = await request.json()
+        if not 2 <= len(data["messages"]) <= 100:
+            return web.json_response({"message": "Invalid Form Body"}, status=400)
+
+        return await self._respond(request, f"bulk:{channel_id}", None, status=204)
+
+    async def _edit_channel_positions(self, request: web.Request):
+        guild_id = int(request.match_info["guild_id"])
+        return await self._respond(request, f"guild:{guild_id}", None, status=204)
+
+    async def _edit_channel(self, request: web.Request):
+        channel_id = int(request.match_info["channel_id"])
+        payload = channel_payload(channel_id, channel_id // 100)
+        payload.update(await request.json())
+        return await self._respond(request, f"channel:{channel_id}", payload)
+
+    async def _get_guild(self, request: web.Request):
+        guild_id = int(request.match_info["guild_id"])
+        payload = guild_payload(guild_id, [])
+        del payload["channels"], payload["members"]
+        return await self._respond(request, f"guild:{guild_id}", payload)
+
+    async def _interaction_message(self, request: web.Request):
+        token = request.match_info["token"]
+        data = await request.json()
+        return await self._respond(
+            request,
+            f"webhook:{token}",
+            message_payload(
+                make_snowflake(self.requests % 4096), 0, 0, data.get("content") or ""
+            ),
+        )
+
+    async def _delete_original(self, request: web.Request):
+        token = request.match_info["token"]
+        return await self._respond(request, f"webhook:{token}", None, status=204)
+
+    async def _send_message(self, request: web.Request):
+        channel_id = int(request.match_info["channel_id"])
+        data = await request.json()
+
+        content = data.get("content") or ""
+        if content.startswith("pong "):
+            self.round_trips.append(time.perf_counter() - float(content[5:]))
+
+        return await self._respond(
+            request,
+            f"channel:{channel_id}",
+            message_payload(
+                make_snowflake(self.requests % 4096), channel_id, 0, content
+            ),
+        )
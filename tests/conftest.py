@@ -0,0 +1,51 @@
+import asyncio
+import importlib
+import inspect
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The modules of the package, like http, would shadow the standard library with
+# the repo itself on the path, so it is imported as a package from its parent
+sys.path[:] = [path for path in sys.path if os.path.abspath(path or os.curdir) != ROOT]
+sys.path.insert(0, os.path.dirname(ROOT))
+
+# The tests import it as ``package``, whatever the checkout is called
+if "package" not in sys.modules:
+    sys.modules["package"] = importlib.import_module(os.path.basename(ROOT))
+
+# Seconds a coroutine test can run before it fails, so a hang does not stall the run
+TIMEOUT = 30.0
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_pyfunc_call(pyfuncitem):
+    """Runs coroutine tests on a new event loop"""
+
+    if not inspect.iscoroutinefunction(pyfuncitem.obj):
+        return None
+
+    kwargs = {
+        name: pyfuncitem.funcargs[name] for name in pyfuncitem._fixtureinfo.argnames
+    }
+    asyncio.run(asyncio.wait_for(pyfuncitem.obj(**kwargs), TIMEOUT))
+    return True
+
+
+@pytest.fixture
+def make_bot():
+    """Builds bots whose REST requests go to ``rest_url``"""
+
+    from package import Bot
+
+    def make_bot(rest_url=None, **options):
+        options.setdefault("debug", False)
+        if rest_url is not None:
+            options["http_options"] = {"base_url": rest_url}
+
+        return Bot(token="token", prefix="!", **options)
+
+    return make_bot
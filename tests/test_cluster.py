@@ -0,0 +1,120 @@
+import asyncio
+import functools
+import threading
+import time
+
+from package import AutoShardedBot
+from package.cluster import ClusterLauncher
+from package.testing import FakeGateway, FakeRestServer
+
+
+class StandInServers:
+    """A stand-in gateway and REST api, served from a thread so the launcher can block"""
+
+    def __init__(self, **gateway_options):
+        self.gateway_options = gateway_options
+        self.rest_url = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        self.rest_url = asyncio.run_coroutine_threadsafe(
+            self._start(), self._loop
+        ).result(10)
+        return self
+
+    def __exit__(self, *exc_info):
+        asyncio.run_coroutine_threadsafe(self._close(), self._loop).result(10)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(10)
+        self._loop.close()
+
+    async def _start(self):
+        self.gateway = FakeGateway(**self.gateway_options)
+        self.rest = FakeRestServer(gateway=self.gateway, max_concurrency=4)
+        await self.gateway.start()
+        return await self.rest.start()
+
+    async def _close(self):
+        await self.rest.close()
+        await self.gateway.close()
+
+
+def make_bot(*, rest_url, **shard_options):
+    return AutoShardedBot(
+        debug=False,
+        token="token",
+        prefix="!",
+        http_options={"base_url": rest_url},
+        **shard_options,
+    )
+
+
+def launch(servers, **options):
+    launcher = ClusterLauncher(
+        functools.partial(make_bot, rest_url=servers.rest_url),
+        token="token",
+        http_options={"base_url": servers.rest_url},
+        **options,
+    )
+    launcher.start()
+    return launcher
+
+
+def wait_for_shards(launcher, status, timeout=20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        shards = launcher.status()
+        if len(shards) == launcher.shard_count and all(
+            shard["status"] == status for shard in shards.values()
+        ):
+            return shards
+        time.sleep(0.05)
+
+    raise AssertionError(f"the shards are not {status}: {launcher.status()}")
+
+
+def stop(launcher, timeout=20.0):
+    """Stops the launcher, or fails and kills its processes if that hangs"""
+
+    stopper = threading.Thread(target=launcher.stop, daemon=True)
+    stopper.start()
+    stopper.join(timeout)
+    if stopper.is_alive():
+        for process in launcher.processes:
+            process.kill()
+        raise AssertionError("the cluster did not stop")
+
+
+def test_shards_run_over_processes():
+    with StandInServers(guilds=8, message_rate=0, shards=4) as servers:
+        launcher = launch(servers, processes=2, report_interval=0.05)
+        try:
+            shards = wait_for_shards(launcher, "connected")
+        finally:
+            stop(launcher)
+
+    assert launcher.clusters == {0: [0, 1], 1: [2, 3]}
+    assert {shard_id: shard["cluster"] for shard_id, shard in shards.items()} == {
+        0: 0,
+        1: 0,
+        2: 1,
+        3: 1,
+    }
+    assert all(process.exitcode == 0 for process in launcher.processes)
+    # The last report of every process is sent as it shuts down
+    assert all(shard["status"] == "closed" for shard in launcher.status().values())
+
+
+def test_stop_returns_with_a_backlog_of_reports():
+    # Reports sent faster than anything reads them fill the pipe of the queue
+    with StandInServers(guilds=2, message_rate=0, shards=2) as servers:
+        launcher = launch(servers, processes=2, report_interval=0.0001)
+        try:
+            wait_for_shards(launcher, "connected")
+            time.sleep(0.5)
+        finally:
+            stop(launcher)
+
+    assert all(process.exitcode == 0 for process in launcher.processes)
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from package import errors
+from package.cooldowns import CommandLimits, Cooldown, MaxConcurrency
+from package.testing import FakeRestServer, dispatch_payload, message_payload
+
+
+def test_cooldown_allows_bursts_of_rate():
+    cooldown = Cooldown(2, 10)
+
+    assert cooldown.consume("user", now=0) == 0
+    assert cooldown.consume("user", now=0) == 0
+    assert cooldown.consume("user", now=0) == pytest.approx(5)
+    assert cooldown.consume("other", now=0) == 0
+    # Half of ``per`` later one token has come back
+    assert cooldown.consume("user", now=5) == 0
+
+
+def test_sweep_forgets_only_idle_keys():
+    cooldown = Cooldown(1, 10)
+    cooldown.consume("idle", now=0)
+    cooldown.consume("busy", now=8)
+
+    assert cooldown.sweep(now=12) == 1
+    assert len(cooldown) == 1
+    assert cooldown.consume("busy", now=12) > 0
+
+
+def test_max_concurrency_is_counted_per_bucket():
+    limits = CommandLimits(max_concurrency=MaxConcurrency(1, bucket="channel"))
+
+    key = limits.acquire(user_id=1, channel_id=10, guild_id=100)
+    with pytest.raises(errors.MaxConcurrencyReached):
+        limits.acquire(user_id=2, channel_id=10, guild_id=100)
+    limits.acquire(user_id=2, channel_id=11, guild_id=100)
+
+    limits.release(key)
+    limits.acquire(user_id=2, channel_id=10, guild_id=100)
+
+
+async def test_commands_on_cooldown_are_not_run(make_bot):
+    async with FakeRestServer() as rest:
+        bot = make_bot(rest.url)
+        calls = []
+        failures = []
+
+        @bot.add_command(name="hi", cooldown=Cooldown(1, 60))
+        async def hi(ctx):
+            calls.append(ctx.message.id)
+
+        async def on_command_error(exc, context):
+            failures.append(exc)
+
+        bot.on_command_error = on_command_error
+        # Both sent by the same user
+        for message_id in (1, 5001):
+            message = message_payload(str(message_id), 10000000, 100000, "!hi")
+            await bot.handle_events(dispatch_payload("MESSAGE_CREATE", message))
+
+        await bot.dispatcher.join()
+        await bot.join_commands()
+        await bot.shutdown()
+
+    assert len(calls) == 1
+    assert len(failures) == 1
+    assert isinstance(failures[0], errors.CommandOnCooldown)
+    assert failures[0].retry_after > 59
@@ -0,0 +1,73 @@
+import json
+
+from package import gateway
+from package.encoding import peek
+from package.testing import dispatch_payload
+
+
+def frame(event, sequence, data=None):
+    return json.dumps(dispatch_payload(event, data or {}, sequence))
+
+
+def test_peek_reads_the_head_of_a_payload():
+    assert peek(frame("TYPING_START", 42)) == (0, "TYPING_START", 42)
+    assert peek(frame("TYPING_START", 42).encode()) == (0, "TYPING_START", 42)
+    assert peek('{"t":null,"s":null,"op":11,"d":null}') == (11, None, None)
+
+
+def test_peek_leaves_other_layouts_to_the_decoder():
+    assert peek('{"op":0,"t":"TYPING_START","s":1,"d":{}}') is None
+
+
+async def test_unwanted_events_are_skipped_before_parsing(make_bot):
+    bot = make_bot()
+    connection = gateway.Gateway(bot)
+
+    # Not valid json past the head, so it would fail if it were parsed
+    await connection.received('{"t":"TYPING_START","s":7,"op":0,"d":{not json')
+
+    assert connection.sequence == 7
+    assert connection.pending_events == 0
+    assert bot.metrics.events_skipped.labels("TYPING_START").value == 1
+
+
+async def test_events_with_a_listener_are_dispatched(make_bot):
+    bot = make_bot()
+    connection = gateway.Gateway(bot)
+    typing = []
+
+    async def on_typing(data):
+        typing.append(data["user_id"])
+
+    bot.add_listener("TYPING_START", on_typing)
+    await connection.received(frame("TYPING_START", 8, {"user_id": "5"}))
+    await connection.close()
+    await connection.join()
+    await bot.dispatcher.join()
+
+    assert connection.sequence == 8
+    assert typing == ["5"]
+    assert bot.metrics.events_skipped.labels("TYPING_START").value == 0
+
+
+def test_intents_follow_the_listeners(make_bot):
+    bot = make_bot()
+    intents = bot.intents
+
+    async def on_reaction(data):
+        pass
+
+    bot.add_listener("MESSAGE_REACTION_ADD", on_reaction)
+    bot.add_listener("GUILD_MEMBER_ADD", on_reaction)
+
+    assert intents & gateway.GUILDS
+    assert not intents & gateway.GUILD_MESSAGE_REACTIONS
+    assert bot.intents & gateway.GUILD_MESSAGE_REACTIONS
+    # Privileged intents have to be asked for explicitly
+    assert not bot.intents & gateway.GUILD_MEMBERS
+
+
+def test_explicit_intents_are_kept(make_bot):
+    bot = make_bot(intents=gateway.GUILDS | gateway.GUILD_MEMBERS)
+
+    assert bot.intents == gateway.GUILDS | gateway.GUILD_MEMBERS
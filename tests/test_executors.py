@@ -0,0 +1,47 @@
+import logging
+import threading
+import time
+
+from package.testing import FakeRestServer, dispatch_payload, message_payload
+
+
+async def run_command(bot, content):
+    message = message_payload("1", 10000000, 100000, content)
+    await bot.handle_events(dispatch_payload("MESSAGE_CREATE", message))
+    await bot.dispatcher.join()
+    await bot.join_commands()
+
+
+async def test_blocking_command_is_logged(make_bot, caplog):
+    async with FakeRestServer() as rest:
+        bot = make_bot(rest.url, loop_block_threshold=0.05)
+
+        @bot.add_command(name="block")
+        async def block(ctx):
+            time.sleep(0.1)
+
+        with caplog.at_level(logging.WARNING):
+            await run_command(bot, "!block")
+        await bot.shutdown()
+
+    assert bot.metrics.loop_blocked.labels("block").value == 1
+    assert "The command block blocked the event loop" in caplog.text
+
+
+async def test_thread_command_runs_off_the_loop(make_bot):
+    async with FakeRestServer() as rest:
+        bot = make_bot(rest.url, loop_block_threshold=0.05)
+        threads = []
+
+        @bot.add_command(name="work", execution="thread")
+        def work():
+            threads.append(threading.current_thread())
+            time.sleep(0.1)
+            return "done"
+
+        await run_command(bot, "!work")
+        await bot.shutdown()
+
+    assert threads and threads[0] is not threading.main_thread()
+    assert bot.metrics.loop_blocked.labels("work").value == 0
+    assert rest.requests_by_route["POST /api/v9/channels/{channel_id}/messages"] == 1
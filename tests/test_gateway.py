@@ -0,0 +1,126 @@
+import asyncio
+import random
+import time
+
+import pytest
+
+from package import errors, gateway
+from package.testing import FakeGateway
+
+
+@pytest.fixture(autouse=True)
+def short_waits(monkeypatch):
+    """Scales the random waits of the gateway down, keeping their shape"""
+
+    uniform = random.uniform
+    monkeypatch.setattr(random, "uniform", lambda low, high: uniform(low, high) / 20)
+
+
+async def wait_until(predicate, timeout=5.0):
+    deadline = time.perf_counter() + timeout
+    while not predicate():
+        if time.perf_counter() > deadline:
+            raise AssertionError("timed out waiting for the gateway")
+        await asyncio.sleep(0.01)
+
+
+class Connection:
+    """A gateway connection of a bot, running until the block exits"""
+
+    def __init__(self, bot, url, **options):
+        options.setdefault("identify_limiter", gateway.IdentifyLimiter(interval=0))
+        self.gateway = gateway.Gateway(bot, url=url, **options)
+        self.task = None
+
+    async def __aenter__(self):
+        self.task = asyncio.ensure_future(self.gateway.run())
+        return self.gateway
+
+    async def __aexit__(self, *exc_info):
+        await self.gateway.close()
+        await asyncio.wait_for(self.task, 5)
+
+
+def connected(connection):
+    return lambda: connection.status == "connected"
+
+
+async def test_unacknowledged_heartbeat_closes_with_4000_and_resumes(make_bot):
+    async with FakeGateway(message_rate=0, heartbeat_interval=50) as fake:
+        async with Connection(make_bot(), fake.url) as connection:
+            await wait_until(connected(connection))
+            session_id = connection.session_id
+
+            fake.ack_heartbeats = False
+            await wait_until(lambda: 4000 in fake.close_codes)
+            fake.ack_heartbeats = True
+            await wait_until(lambda: fake.resumes == 1)
+            await wait_until(connected(connection))
+
+            assert connection.session_id == session_id
+
+    assert fake.identifies == 1
+
+
+async def test_reconnect_request_resumes(make_bot):
+    async with FakeGateway(message_rate=0) as fake:
+        async with Connection(make_bot(), fake.url) as connection:
+            await wait_until(connected(connection))
+
+            await fake.send_op(gateway.RECONNECT)
+            await wait_until(lambda: fake.resumes == 1)
+            await wait_until(connected(connection))
+
+    assert fake.identifies == 1
+    assert fake.close_codes[0] == 4000
+
+
+@pytest.mark.parametrize(
+    "resumable, resumes, identifies", [(True, 1, 1), (False, 0, 2)]
+)
+async def test_invalid_session(make_bot, resumable, resumes, identifies):
+    async with FakeGateway(message_rate=0) as fake:
+        async with Connection(make_bot(), fake.url) as connection:
+            await wait_until(connected(connection))
+
+            await fake.send_op(gateway.INVALID_SESSION, resumable)
+            await wait_until(lambda: fake.resumes + fake.identifies == 2)
+            await wait_until(connected(connection))
+
+    assert (fake.resumes, fake.identifies) == (resumes, identifies)
+
+
+async def test_failed_connects_back_off(make_bot, monkeypatch):
+    # No jitter, so the waits can be compared
+    monkeypatch.setattr(random, "uniform", lambda low, high: high / 20)
+
+    async with FakeGateway(message_rate=0) as fake:
+        fake.refuse_connections = 4
+
+        async with Connection(make_bot(), fake.url) as connection:
+            await wait_until(connected(connection))
+
+            # A successful session starts the backoff over
+            assert connection._attempt == 0
+
+    attempts = fake.connection_attempts
+    gaps = [later - earlier for earlier, later in zip(attempts, attempts[1:])]
+
+    assert len(attempts) == 5
+    # The wait doubles after every failed attempt
+    for attempt, gap in enumerate(gaps):
+        assert 2**attempt / 20 <= gap < 2 ** (attempt + 1) / 20
+
+
+async def test_fatal_close_codes_stop_reconnecting(make_bot):
+    async with FakeGateway(message_rate=0) as fake:
+        connection = gateway.Gateway(make_bot(), url=fake.url)
+        running = asyncio.ensure_future(connection.run())
+        await wait_until(connected(connection))
+
+        await fake.disconnect(4004)
+
+        with pytest.raises(errors.GatewayError):
+            await asyncio.wait_for(running, 5)
+
+    assert fake.identifies == 1
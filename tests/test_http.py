@@ -0,0 +1,97 @@
+import asyncio
+
+from package import http
+from package.testing import FakeRestServer
+
+HISTORY = http.Route("GET", "/channels/{channel_id}/messages", channel_id=1)
+
+
+def make_client(url, **options):
+    client = http.DiscordHttpClient(base_url=url, **options)
+    client.login("token")
+    return client
+
+
+async def test_concurrent_lookups_share_one_request():
+    async with FakeRestServer(latency=0.05) as rest:
+        client = make_client(rest.url)
+        try:
+            channels = await asyncio.gather(
+                *(client.get_channel(10000000) for _ in range(1000))
+            )
+        finally:
+            await client.close()
+
+    assert rest.requests == 1
+    assert client.coalesced_hits == 999
+    assert all(channel is channels[0] for channel in channels)
+    assert channels[0]["id"] == "10000000"
+
+
+async def test_lookups_with_different_queries_are_not_shared():
+    async with FakeRestServer(latency=0.05) as rest:
+        client = make_client(rest.url)
+        try:
+            await asyncio.gather(
+                client.get(HISTORY, params={"limit": 5}),
+                client.get(HISTORY, params={"limit": 5}),
+                client.get(HISTORY, params={"limit": 10}),
+            )
+        finally:
+            await client.close()
+
+    assert rest.requests == 2
+
+
+async def test_a_cancelled_caller_does_not_cancel_the_others():
+    async with FakeRestServer(latency=0.1) as rest:
+        client = make_client(rest.url)
+        try:
+            first = asyncio.ensure_future(client.get_channel(10000000))
+            second = asyncio.ensure_future(client.get_channel(10000000))
+            await asyncio.sleep(0.02)
+            first.cancel()
+
+            channel = await second
+        finally:
+            await client.close()
+
+    assert channel["id"] == "10000000"
+    assert rest.requests == 1
+
+
+async def test_invalidate_drops_the_responses_of_every_query():
+    async with FakeRestServer() as rest:
+        client = make_client(rest.url, response_cache_ttl=60)
+        try:
+            for _ in range(2):
+                await client.get(HISTORY, cache=True, params={"limit": 5})
+                await client.get(HISTORY, cache=True, params={"limit": 10})
+            assert rest.requests == 2
+            assert client.cache_hits == 2
+
+            client.invalidate(HISTORY)
+            await client.get(HISTORY, cache=True, params={"limit": 5})
+            await client.get(HISTORY, cache=True, params={"limit": 10})
+        finally:
+            await client.close()
+
+    assert rest.requests == 4
+
+
+async def test_responses_in_flight_are_not_cached_after_invalidate():
+    async with FakeRestServer(latency=0.1) as rest:
+        client = make_client(rest.url, response_cache_ttl=60)
+        try:
+            stale = asyncio.ensure_future(
+                client.get(HISTORY, cache=True, params={"limit": 5})
+            )
+            await asyncio.sleep(0.02)
+            client.invalidate(HISTORY)
+            await stale
+
+            await client.get(HISTORY, cache=True, params={"limit": 5})
+        finally:
+            await client.close()
+
+    assert rest.requests == 2
@@ -0,0 +1,153 @@
+import asyncio
+import json
+
+import aiohttp
+import pytest
+
+from package import interactions
+from package.testing import FakeRestServer, channel_payload
+
+# A fixed key, so the signatures are the same on every run
+SECRET = bytes(range(32))
+
+
+def command_interaction(name, **options):
+    return {
+        "id": "900000000000000001",
+        "application_id": "800000000000000001",
+        "type": interactions.APPLICATION_COMMAND,
+        "token": "interaction-token",
+        "guild_id": "100000",
+        "channel_id": "10000000",
+        "member": {"user": {"id": "42", "username": "user", "discriminator": "0001"}},
+        "data": {
+            "name": name,
+            "options": [
+                {"name": option, "value": value} for option, value in options.items()
+            ],
+        },
+    }
+
+
+class Server:
+    """An interactions server of a bot, with its REST requests going to a stand-in"""
+
+    def __init__(self, make_bot, **options):
+        self.make_bot = make_bot
+        self.options = options
+
+    async def __aenter__(self):
+        self.rest = FakeRestServer()
+        await self.rest.start()
+        self.bot = self.make_bot(self.rest.url)
+        self.server = interactions.InteractionServer(
+            self.bot, interactions.public_key(SECRET), port=0, **self.options
+        )
+        self.url = await self.server.start()
+        self.session = aiohttp.ClientSession()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+        await self.server.close(timeout=5)
+        await self.bot.http.close()
+        await self.rest.close()
+
+    async def post(self, body, headers=None):
+        if headers is None:
+            headers = interactions.sign_request(SECRET, body)
+
+        async with self.session.post(self.url, data=body, headers=headers) as response:
+            if response.content_type == "application/json":
+                return response.status, await response.json()
+
+            return response.status, await response.text()
+
+
+async def test_ping_gets_a_pong(make_bot):
+    async with Server(make_bot) as server:
+        status, reply = await server.post(b'{"type": 1}')
+
+    assert status == 200
+    assert reply == {"type": interactions.PONG}
+
+
+async def test_tampered_body_is_rejected(make_bot):
+    async with Server(make_bot) as server:
+        headers = interactions.sign_request(SECRET, b'{"type": 1}')
+        status, _ = await server.post(b'{"type": 1 }', headers)
+
+    assert status == 401
+    assert server.server.rejected == 1
+
+
+async def test_tampered_timestamp_is_rejected(make_bot):
+    async with Server(make_bot) as server:
+        headers = interactions.sign_request(SECRET, b'{"type": 1}', "1600000000")
+        headers["X-Signature-Timestamp"] = "1600000001"
+        status, _ = await server.post(b'{"type": 1}', headers)
+
+    assert status == 401
+
+
+@pytest.mark.parametrize("signature", ["", "not hex", "00" * 64])
+async def test_malformed_signatures_are_rejected(make_bot, signature):
+    async with Server(make_bot) as server:
+        headers = interactions.sign_request(SECRET, b'{"type": 1}')
+        headers["X-Signature-Ed25519"] = signature
+        status, _ = await server.post(b'{"type": 1}', headers)
+
+    assert status == 401
+    assert server.server.received == 0
+
+
+async def test_requests_signed_with_another_key_are_rejected(make_bot):
+    async with Server(make_bot) as server:
+        headers = interactions.sign_request(b"x" * 32, b'{"type": 1}')
+        status, _ = await server.post(b'{"type": 1}', headers)
+
+    assert status == 401
+
+
+async def test_command_answers_within_the_deadline(make_bot):
+    async with Server(make_bot) as server:
+        server.bot.state.store_channel(channel_payload(10000000, 100000))
+        seen = []
+
+        @server.bot.add_command(name="echo")
+        async def echo(ctx, text: str):
+            message = ctx.message
+            seen.append(
+                (message.id, message.author.id, message.channel.id, ctx.guild_id)
+            )
+            await ctx.send(f"{ctx.author.username}: {text}")
+
+        body = json.dumps(command_interaction("echo", text="hello")).encode()
+        status, reply = await server.post(body)
+
+    assert status == 200
+    assert reply["type"] == interactions.CHANNEL_MESSAGE
+    assert reply["data"]["content"] == "user: hello"
+    assert seen == [(900000000000000001, 42, 10000000, 100000)]
+
+
+async def test_slow_command_is_deferred_and_followed_up(make_bot):
+    async with Server(make_bot, defer_after=0.05) as server:
+
+        @server.bot.add_command(name="slow")
+        async def slow(ctx):
+            await asyncio.sleep(0.1)
+            await ctx.send("done")
+            await ctx.send("and more")
+
+        body = json.dumps(command_interaction("slow")).encode()
+        status, reply = await server.post(body)
+        assert await server.server.join(timeout=5)
+
+    by_route = server.rest.requests_by_route
+    assert status == 200
+    assert reply == {"type": interactions.DEFERRED_CHANNEL_MESSAGE}
+    assert (
+        by_route["PATCH /api/v9/webhooks/{webhook_id}/{token}/messages/@original"] == 1
+    )
+    assert by_route["POST /api/v9/webhooks/{webhook_id}/{token}"] == 1
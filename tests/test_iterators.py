@@ -0,0 +1,71 @@
+import asyncio
+import gc
+
+from package.guild import Guild
+from package.member import Member
+from package.testing import FakeRestServer, guild_payload
+from package.utils import paginate
+
+MEMBERS = "GET /api/v9/guilds/{guild_id}/members"
+
+
+async def test_members_are_walked_over_pages(make_bot):
+    async with FakeRestServer(member_count=2500) as rest:
+        bot = make_bot(rest.url)
+        guild = Guild(bot, guild_payload(100000, [10000000]))
+        try:
+            members = [member async for member in guild.fetch_members()]
+        finally:
+            await bot.http.close()
+
+    assert [member.id for member in members] == list(range(1, 2501))
+    assert rest.requests_by_route[MEMBERS] == 3
+
+
+def test_members_keep_only_the_fields_they_read():
+    member_json = {
+        "user": {"id": "42", "username": "user", "discriminator": "0001"},
+        "nick": None,
+        "roles": [],
+        "joined_at": "2021-07-01T00:00:00.000000+00:00",
+        "premium_since": None,
+        "deaf": False,
+        "mute": False,
+        "flags": 0,
+    }
+
+    member = Member(member_json, 100000, None)
+
+    assert set(member._data) == {"joined_at", "deaf", "mute"}
+    assert member.display_name == "user"
+    assert member.roles == ()
+    assert member.nick is None and member.pending is False
+
+    member = Member(dict(member_json, nick="nick", roles=["1", "2"]), 100000, None)
+    assert member.display_name == "nick"
+    assert member.roles == (1, 2)
+
+
+async def test_failed_prefetch_is_not_reported_after_the_walk_stops():
+    errors = []
+    asyncio.get_running_loop().set_exception_handler(
+        lambda loop, context: errors.append(context)
+    )
+
+    async def fetch_page(size, cursor, forward):
+        if cursor is not None:
+            raise ConnectionError("the second page failed")
+
+        return [{"id": str(item_id)} for item_id in range(size, 0, -1)]
+
+    pages = paginate(fetch_page, limit=None, page_size=2)
+    assert await pages.__anext__() == {"id": "2"}
+    # The next page is requested before the first is yielded, and fails meanwhile
+    await asyncio.sleep(0)
+    await pages.aclose()
+    await asyncio.sleep(0)
+
+    del pages
+    gc.collect()
+
+    assert errors == []
@@ -0,0 +1,92 @@
+import asyncio
+
+from package.testing import (
+    FakeGateway,
+    FakeRestServer,
+    dispatch_payload,
+    message_payload,
+)
+
+
+def command_message(content):
+    return dispatch_payload(
+        "MESSAGE_CREATE", message_payload("1", 10000000, 100000, content), 1
+    )
+
+
+async def wait_for_commands(bot):
+    while not bot._command_tasks:
+        await asyncio.sleep(0.01)
+
+
+def test_bot_is_built_without_a_loop(make_bot):
+    bot = make_bot()
+
+    assert bot._loop is None
+    assert bot.http._session is None
+
+
+async def test_shutdown_waits_for_running_commands(make_bot):
+    async with FakeRestServer() as rest:
+        bot = make_bot(rest.url)
+        finished = []
+
+        @bot.add_command(name="slow")
+        async def slow(ctx):
+            await asyncio.sleep(0.2)
+            finished.append(ctx.message.id)
+
+        await bot.handle_events(command_message("!slow"))
+        await wait_for_commands(bot)
+
+        assert await bot.shutdown(timeout=5)
+
+    assert finished == [1]
+    assert bot.is_closed
+
+
+async def test_shutdown_cancels_commands_past_the_timeout(make_bot):
+    async with FakeRestServer() as rest:
+        bot = make_bot(rest.url)
+        cancelled = []
+
+        @bot.add_command(name="stuck")
+        async def stuck(ctx):
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelled.append(ctx.message.id)
+                raise
+
+        await bot.handle_events(command_message("!stuck"))
+        await wait_for_commands(bot)
+
+        assert not await bot.shutdown(timeout=0.2)
+        await asyncio.sleep(0)
+
+    assert cancelled == [1]
+
+
+async def test_run_connects_and_stops(make_bot):
+    async with FakeGateway(guilds=3, message_rate=0) as gateway, FakeRestServer(
+        gateway=gateway
+    ) as rest:
+        bot = make_bot(rest.url, gateway_url=gateway.url)
+        ready = asyncio.Event()
+
+        async def on_ready(data):
+            ready.set()
+
+        bot.add_listener("READY", on_ready)
+        running = asyncio.ensure_future(bot.run())
+
+        await asyncio.wait_for(ready.wait(), 5)
+        while len(bot.state.guilds) < 3:
+            await asyncio.sleep(0.01)
+
+        bot.stop()
+        await asyncio.wait_for(running, 5)
+
+    assert gateway.identifies == 1
+    assert bot.is_closed
+    assert bot.gateway.status == "closed"
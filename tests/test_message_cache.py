@@ -0,0 +1,82 @@
+from package.message import CachedMessage
+from package.state import MessageCache
+from package.testing import dispatch_payload, message_payload
+
+
+def cached(message_id, channel_id=10):
+    return CachedMessage(
+        message_payload(str(message_id), channel_id, 100, f"message {message_id}"),
+        None,
+    )
+
+
+def test_ring_evicts_the_oldest_message():
+    cache = MessageCache(3)
+    for message_id in range(1, 5):
+        cache.add(cached(message_id))
+
+    assert len(cache) == 3
+    assert cache.get(1) is None
+    assert cache.get(4).content == "message 4"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_channel_cap_keeps_other_channels():
+    cache = MessageCache(10, max_per_channel=2)
+    cache.add(cached(1, channel_id=20))
+    for message_id in range(2, 6):
+        cache.add(cached(message_id, channel_id=10))
+
+    assert cache.get(1) is not None
+    assert [cache.get(message_id) is not None for message_id in range(2, 6)] == [
+        False,
+        False,
+        True,
+        True,
+    ]
+
+
+def test_updates_and_deletes_find_their_message():
+    cache = MessageCache(10)
+    cache.add(cached(1))
+    cache.add(cached(2, channel_id=20))
+
+    assert cache.update({"id": "1", "content": "edited"}).content == "edited"
+    assert cache.remove(1).content == "edited"
+    assert cache.remove(1) is None
+
+    cache.remove_channel(20)
+    assert len(cache) == 0
+
+
+async def test_delete_listeners_get_the_cached_message(make_bot):
+    bot = make_bot()
+    deleted = []
+
+    async def on_delete(data):
+        deleted.append(data["cached_message"])
+
+    bot.add_listener("MESSAGE_DELETE", on_delete)
+    bot.state.parse("MESSAGE_CREATE", message_payload("1", 10, 100, "soon gone"))
+    await bot.handle_events(
+        dispatch_payload("MESSAGE_DELETE", {"id": "1", "channel_id": "10"})
+    )
+    await bot.dispatcher.join()
+    await bot.dispatcher.close()
+
+    assert deleted[0].content == "soon gone"
+    assert deleted[0].author is bot.get_user(deleted[0].author.id)
+
+
+def test_hits_and_misses_are_exported(make_bot):
+    bot = make_bot()
+    bot.state.parse("MESSAGE_CREATE", message_payload("1", 10, 100, "hello"))
+    bot.get_message(1)
+    bot.get_message(2)
+    bot.get_message(3)
+
+    rendered = bot.metrics.render()
+
+    assert "# TYPE discord_message_cache_hits_total counter" in rendered
+    assert "discord_message_cache_hits_total 1" in rendered
+    assert "discord_message_cache_misses_total 2" in rendered
@@ -0,0 +1,38 @@
+import aiohttp
+
+from package import metrics
+
+
+async def test_metrics_are_served_as_prometheus_text(make_bot):
+    bot = make_bot()
+    bot.dispatcher.metrics.dropped = 3
+    server = metrics.MetricsServer(bot.metrics, port=0)
+    url = await server.start()
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url) as response:
+                headers = response.headers
+                text = await response.text()
+    finally:
+        await server.close()
+
+    assert headers["Content-Type"] == "text/plain; version=0.0.4; charset=utf-8"
+    assert "X-Content-Type-Version" not in headers
+    assert "# TYPE discord_dispatch_dropped_total counter" in text
+    assert "discord_dispatch_dropped_total 3.0" in text
+
+
+def test_samples_are_rendered_with_their_labels():
+    registry = metrics.MetricsRegistry()
+    counter = registry.counter("requests_total", "Requests", ("route",))
+    counter.labels('GET "/x"').inc(2)
+    histogram = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    histogram.observe(0.5)
+
+    text = registry.render()
+
+    assert 'requests_total{route="GET \\"/x\\""} 2.0' in text
+    assert 'latency_seconds_bucket{le="0.1"} 0' in text
+    assert 'latency_seconds_bucket{le="1.0"} 1' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 1' in text
+    assert "latency_seconds_count 1" in text
@@ -0,0 +1,29 @@
+import pytest
+
+from package.message import Message
+from package.testing import channel_payload, guild_payload, message_payload
+
+
+def test_guild_looks_up_its_channels(make_bot):
+    bot = make_bot()
+    bot.state.parse_guild_create(guild_payload(100000, [10000000, 10000001]))
+    bot.state.parse_guild_create(guild_payload(100001, [10000002]))
+    guild = bot.state.get_guild(100000)
+
+    assert guild[10000001] is bot.state.get_channel(10000001)
+    assert guild["10000000"].id == 10000000
+    with pytest.raises(KeyError):
+        guild[10000002]
+    with pytest.raises(KeyError):
+        guild[1]
+
+
+def test_message_author_is_the_cached_user(make_bot):
+    bot = make_bot()
+    channel = bot.state.store_channel(channel_payload(10000000, 100000))
+
+    first = Message(bot)._fill(message_payload("1", 10000000, 100000, "a"), channel)
+    second = Message(bot)._fill(message_payload("1", 10000000, 100000, "b"), channel)
+
+    assert first.author.id == 1001
+    assert first.author is second.author is bot.get_user(1001)
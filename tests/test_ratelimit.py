@@ -0,0 +1,88 @@
+import asyncio
+import time
+
+from package import http, ratelimit
+from package.testing import FakeRestServer
+
+
+def make_client(url, **options):
+    client = http.DiscordHttpClient(base_url=url, **options)
+    client.login("token")
+    return client
+
+
+async def send_all(client, channel_ids):
+    return await asyncio.gather(
+        *(client.send_message(channel_id, "hello") for channel_id in channel_ids)
+    )
+
+
+async def test_bucket_paces_requests_without_429():
+    async with FakeRestServer(rate_limit=5, rate_limit_window=0.3) as rest:
+        client = make_client(rest.url)
+        started = time.perf_counter()
+        try:
+            messages = await send_all(client, [1] * 12)
+        finally:
+            await client.close()
+
+    # 12 requests at 5 a window need three windows
+    assert time.perf_counter() - started >= 0.55
+    assert all(message["content"] == "hello" for message in messages)
+    assert rest.rate_limited == 0
+
+
+async def test_buckets_of_different_channels_run_in_parallel():
+    async with FakeRestServer(rate_limit=5, rate_limit_window=2.0) as rest:
+        client = make_client(rest.url)
+        started = time.perf_counter()
+        try:
+            messages = await send_all(client, [1, 2, 3, 4] * 5)
+        finally:
+            await client.close()
+
+    # Every channel stays within its first window
+    assert time.perf_counter() - started < 1.5
+    assert len(messages) == 20 and all(messages)
+    assert rest.rate_limited == 0
+
+
+async def test_rate_limited_requests_are_retried():
+    # Two clients that do not know about each other overrun the bucket they share
+    async with FakeRestServer(rate_limit=5, rate_limit_window=0.3) as rest:
+        first, second = make_client(rest.url), make_client(rest.url)
+        try:
+            messages = await asyncio.gather(
+                send_all(first, [1] * 8), send_all(second, [1] * 8)
+            )
+        finally:
+            await first.close()
+            await second.close()
+
+    assert rest.rate_limited > 0
+    assert all(message is not None for batch in messages for message in batch)
+
+
+async def test_global_rate_limit():
+    async with FakeRestServer(rate_limit=100) as rest:
+        client = make_client(rest.url, global_rate_limit=10)
+        started = time.perf_counter()
+        try:
+            await send_all(client, range(1, 16))
+        finally:
+            await client.close()
+
+    # 15 requests across channels, only 10 of them in the first second
+    assert time.perf_counter() - started >= 0.9
+
+
+async def test_idle_buckets_are_swept():
+    limiter = ratelimit.RateLimiter()
+    for channel_id in range(ratelimit.SWEEP_MIN_BUCKETS + 1):
+        route = http.Route(
+            "POST", "/channels/{channel_id}/messages", channel_id=channel_id
+        )
+        limiter.get_bucket(route)
+
+    # Creating the bucket past the threshold swept the idle ones before it
+    assert len(limiter._buckets) == 1
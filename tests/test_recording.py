@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+from package.recording import GatewayRecorder, ReplayDriver, read_recording
+from package.testing import dispatch_payload, message_payload
+
+
+def frames(count):
+    return [
+        json.dumps(dispatch_payload("TYPING_START", {"index": index}, index + 1))
+        for index in range(count)
+    ]
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_recording_round_trip(tmp_path, compress):
+    path = str(tmp_path / "gateway.rec")
+    recorder = GatewayRecorder(path, compress=compress)
+    for frame in frames(3):
+        recorder.record(2, frame)
+    recorder.close()
+
+    recorded = list(read_recording(path))
+
+    assert [frame for _, _, frame in recorded] == [
+        frame.encode() for frame in frames(3)
+    ]
+    assert {shard_id for _, shard_id, _ in recorded} == {2}
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_crash_keeps_the_flushed_frames(tmp_path, compress):
+    path = str(tmp_path / "gateway.rec")
+    recorder = GatewayRecorder(
+        path, compress=compress, flush_frames=2, flush_interval=60
+    )
+    try:
+        for frame in frames(5):
+            recorder.record(0, frame)
+
+        # Read while the recorder is still open, as after a crash
+        assert len(list(read_recording(path))) == 4
+    finally:
+        recorder.close()
+
+
+async def test_replay_restores_the_base_url(tmp_path, make_bot):
+    path = str(tmp_path / "gateway.rec")
+    recorder = GatewayRecorder(path)
+    ready = {"session_id": "session", "user": {"id": "1", "username": "bot"}}
+    recorder.record(0, json.dumps(dispatch_payload("READY", ready, 1)))
+    for index in range(5):
+        message = message_payload(str(index + 1), 10000000, 100000, "!ping")
+        recorder.record(0, json.dumps(dispatch_payload("MESSAGE_CREATE", message, 2)))
+    recorder.record(0, json.dumps(dispatch_payload("TYPING_START", {}, 3)))
+    recorder.close()
+
+    bot = make_bot("http://127.0.0.1:1/api/v9")
+    replies = []
+
+    @bot.add_command(name="ping")
+    async def ping(ctx):
+        await ctx.send("pong")
+        replies.append(ctx.message.id)
+
+    stats = await ReplayDriver(bot, path).run()
+
+    assert stats["frames"] == 7
+    assert stats["events"] == 6
+    assert stats["skipped"] == 1
+    assert sorted(replies) == [1, 2, 3, 4, 5]
+    sent = bot.metrics.rest_responses.labels(
+        "POST /channels/{channel_id}/messages", 200
+    )
+    assert sent.value == 5
+    assert bot.http.base_url == "http://127.0.0.1:1/api/v9"
@@ -0,0 +1,62 @@
+from package.state import ConnectionState
+from package.storage import MemoryBackend, SQLiteBackend
+from package.testing import channel_payload, guild_payload
+
+
+def user_payload(user_id):
+    return {"id": str(user_id), "username": f"user{user_id}", "discriminator": "0001"}
+
+
+def test_processes_share_what_they_store(tmp_path, make_bot):
+    path = str(tmp_path / "state.db")
+    first, second = SQLiteBackend(path), SQLiteBackend(path)
+    try:
+        writer = ConnectionState(make_bot(), backend=first)
+        reader = ConnectionState(make_bot(), backend=second)
+
+        writer.store_guild(guild_payload(100000, []))
+        writer.store_channel(channel_payload(10000000, 100000))
+        writer.store_user(user_payload(5))
+
+        guild = reader.get_guild(100000)
+        channel = reader.get_channel(10000000)
+        user = reader.get_user(5)
+    finally:
+        first.close()
+        second.close()
+
+    assert guild is not None and guild.name == "guild 100000"
+    assert channel is not None and channel.guild_id == 100000
+    assert user is not None and user.username == "user5"
+
+
+async def test_batched_writes_are_committed_together(tmp_path):
+    path = str(tmp_path / "state.db")
+    first = SQLiteBackend(path, flush_interval=60)
+    second = SQLiteBackend(path)
+    try:
+        first.put("user", 5, user_payload(5))
+
+        # Seen by the process that wrote it straight away, by the others once committed
+        assert first.get("user", 5) == user_payload(5)
+        assert second.get("user", 5) is None
+
+        first.flush()
+        assert second.get("user", 5) == user_payload(5)
+
+        first.delete("user", 5)
+        first.flush()
+        assert second.get("user", 5) is None
+    finally:
+        first.close()
+        second.close()
+
+
+def test_evicted_users_are_kept_in_the_backend(make_bot):
+    state = ConnectionState(make_bot(), max_users=1, backend=MemoryBackend())
+    state.store_user(user_payload(1))
+    state.store_user(user_payload(2))
+
+    assert list(state.users) == [2]
+    assert state.get_user(1).username == "user1"
+    assert list(state.users) == [1]
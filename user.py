@@ -1,18 +1,49 @@
 import typing as t
 
+from .utils import PayloadField, payload_fields, slim_payload
+
 
 class User:
+    __slots__ = ("_bot", "_data", "id", "username", "discriminator", "bot")
+
     def __init__(self, json: dict, bot):
-        # print(json.keys())
+        self._data = slim_payload({}, json, _PAYLOAD_FIELDS)
+        self._bot = bot
 
-        self.verified = json.get("verified", False)
+        self.id = int(json["id"])
         self.username = json.get("username", None)
-        self.mfa_enabled = json.get("mfa_enabled", False)
-        self.id = json.get("id")
-        self.flags = json.get("flags", None)
-        self.email = json.get("email", None)
         self.discriminator = json.get("discriminator", None)
         self.bot = json.get("bot", False)
-        self.avatar = json.get("avatar", None)
 
-        self._bot = bot
+    def _update(self, json: dict) -> None:
+        """Updates the user in place from a full or partial payload
+
+        Args:
+            json (dict): The payload of the user
+        """
+
+        slim_payload(self._data, json, _PAYLOAD_FIELDS)
+
+        self.username = json.get("username", self.username)
+        self.discriminator = json.get("discriminator", self.discriminator)
+        self.bot = json.get("bot", self.bot)
+
+    def _payload(self) -> dict:
+        """The payload the user can be built from again"""
+
+        return {
+            "id": str(self.id),
+            "username": self.username,
+            "discriminator": self.discriminator,
+            "bot": self.bot,
+            **self._data,
+        }
+
+    verified = PayloadField("verified", False)
+    mfa_enabled = PayloadField("mfa_enabled", False)
+    flags = PayloadField("flags")
+    email = PayloadField("email")
+    avatar = PayloadField("avatar")
+
+
+_PAYLOAD_FIELDS = payload_fields(User)
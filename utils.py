@@ -0,0 +1,202 @@
+import asyncio
+import typing as t
+
+
+def snowflake(value: t.Any) -> t.Optional[int]:
+    """Converts a snowflake id from a payload to an int, keeping None as it is"""
+
+    if value is None:
+        return None
+
+    return int(value)
+
+
+class PayloadField:
+    """Attribute of a model read from its raw payload when it is accessed.
+
+    Models copy the fields that are used all the time into slots, and keep the
+    other fields of their payload in ``_data``, see :func:`slim_payload`. Those
+    fields are declared as ``PayloadField``, so they cost nothing until read.
+
+    Args:
+        key (str): The key of the field in the payload
+        default (t.Any): The value when the key is missing. Defaults to None.
+        convert (t.Optional[t.Callable[[t.Any], t.Any]]): Called with the value when it is not None. Defaults to None.
+    """
+
+    __slots__ = ("key", "default", "convert")
+
+    def __init__(
+        self,
+        key: str,
+        default: t.Any = None,
+        convert: t.Optional[t.Callable[[t.Any], t.Any]] = None,
+    ) -> None:
+        self.key = key
+        self.default = default
+        self.convert = convert
+
+    def __get__(self, instance, owner=None) -> t.Any:
+        if instance is None:
+            return self
+
+        value = instance._data.get(self.key, self.default)
+        if self.convert is not None and value is not None:
+            value = self.convert(value)
+
+        return value
+
+    def omits(self, value: t.Any) -> bool:
+        """If a value reads the same as a missing key, so the model need not keep it"""
+
+        return value is None and self.default is None
+
+
+class LazyPayloadField(PayloadField):
+    """A :class:`PayloadField` that is converted once, on first access, and cached.
+
+    Used for the fields that are expensive to convert and rarely read, such as
+    roles or permission overwrites. The cache lives in the ``_lazy`` slot of the
+    model, and is cleared when the model is updated.
+    """
+
+    __slots__ = ()
+
+    def __get__(self, instance, owner=None) -> t.Any:
+        if instance is None:
+            return self
+
+        cache = instance._lazy
+        if cache is None:
+            cache = instance._lazy = {}
+
+        try:
+            return cache[self.key]
+        except KeyError:
+            value = cache[self.key] = super().__get__(instance, owner)
+            return value
+
+    def omits(self, value: t.Any) -> bool:
+        if isinstance(value, list) and not value:
+            converted = value if self.convert is None else self.convert(value)
+            return converted == self.default
+
+        return super().omits(value)
+
+
+def payload_fields(model: type) -> t.Dict[str, PayloadField]:
+    """The :class:`PayloadField` attributes of a model, by their key in the payload"""
+
+    return {
+        value.key: value
+        for value in vars(model).values()
+        if isinstance(value, PayloadField)
+    }
+
+
+def slim_payload(
+    data: t.Dict[str, t.Any],
+    json: t.Mapping[str, t.Any],
+    fields: t.Mapping[str, PayloadField],
+) -> t.Dict[str, t.Any]:
+    """Merges the fields of a payload a model reads through ``fields`` into its ``_data``
+
+    Fields the model keeps in slots or never reads are left out, and so are values
+    that read the same as a missing key, like nulls and empty lists. Only the values
+    are shared with the payload, so the payload itself can be freed.
+
+    Args:
+        data (t.Dict[str, t.Any]): The ``_data`` of the model, updated in place
+        json (t.Mapping[str, t.Any]): A full or partial payload
+        fields (t.Mapping[str, PayloadField]): The payload fields of the model, see :func:`payload_fields`
+
+    Returns:
+        t.Dict[str, t.Any]: ``data``
+    """
+
+    for key, value in json.items():
+        field = fields.get(key)
+        if field is None:
+            continue
+
+        if field.omits(value):
+            data.pop(key, None)
+        else:
+            data[key] = value
+
+    return data
+
+
+async def paginate(
+    fetch_page: t.Callable[[int, t.Optional[int], bool], t.Awaitable[t.List[t.Any]]],
+    *,
+    limit: t.Optional[int],
+    page_size: int,
+    before: t.Optional[int] = None,
+    after: t.Optional[int] = None,
+    id_of: t.Callable[[t.Any], int] = lambda item: int(item["id"]),
+) -> t.AsyncIterator[t.Any]:
+    """Walks an endpoint that pages by snowflake, yielding one item at a time.
+
+    Pages go newest first from ``before``, or oldest first from ``after`` when only
+    ``after`` is given, and the other bound stops the walk. The next page is
+    requested before the items of the current one are yielded, so it is usually
+    ready by the time the caller gets to the end of the page, and only those two
+    pages are held in memory.
+
+    Args:
+        fetch_page (t.Callable[[int, t.Optional[int], bool], t.Awaitable[t.List[t.Any]]]): Called with the page size, the cursor and whether to go forwards
+        limit (t.Optional[int]): Max number of items to yield, None for every item
+        page_size (int): Max number of items the endpoint returns per page
+        before (t.Optional[int]): Only yield items with a smaller id. Defaults to None.
+        after (t.Optional[int]): Only yield items with a larger id. Defaults to None.
+        id_of (t.Callable[[t.Any], int]): Gets the snowflake of an item. Defaults to its ``id``.
+    """
+
+    forward = after is not None and before is None
+    cursor = after if forward else before
+    remaining = limit
+
+    def request(cursor: t.Optional[int]) -> t.Tuple[int, asyncio.Future]:
+        size = page_size if remaining is None else min(page_size, remaining)
+        return size, asyncio.ensure_future(fetch_page(size, cursor, forward))
+
+    size, task = request(cursor)
+    try:
+        while True:
+            page = await task
+            task = None  # type: ignore
+
+            # Discord does not promise an order within a page
+            page = sorted(page, key=id_of, reverse=not forward)
+            if remaining is not None:
+                remaining -= len(page)
+
+            stop = [
+                index
+                for index, item in enumerate(page)
+                if (forward and before is not None and id_of(item) >= before)
+                or (not forward and after is not None and id_of(item) <= after)
+            ]
+            if stop:
+                page = page[: stop[0]]
+
+            if page and not stop and len(page) == size and remaining != 0:
+                size, task = request(id_of(page[-1]))
+
+            for item in page:
+                yield item
+
+            if task is None:
+                return
+    finally:
+        if task is not None:
+            # Nothing awaits the page anymore, so its error is retrieved here,
+            # or asyncio would log it when the task is freed
+            task.cancel()
+            task.add_done_callback(_retrieve_exception)
+
+
+def _retrieve_exception(task: asyncio.Future) -> None:
+    if not task.cancelled():
+        task.exception()